@@ -6,9 +6,12 @@ from flask_limiter.util import get_remote_address
 from flask_migrate import Migrate
 
 from app.config import Config, DevelopmentConfig
-from app.extensions import db, redis_client, ma
+from app.extensions import db, redis_client, ma, cache, celery
 from app.api.v1 import api_v1_bp
 from app.api.middleware.error_handler import register_error_handlers
+from app.api.middleware.response_cache import response_cache
+from app.models.ids import order_numbers
+from app.cli import register_commands
 
 
 def create_app(config_class=DevelopmentConfig):
@@ -28,7 +31,7 @@ def create_app(config_class=DevelopmentConfig):
         r"/api/*": {
             "origins": "*",
             "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"]
         }
     })
     
@@ -46,11 +49,18 @@ def create_app(config_class=DevelopmentConfig):
     # Initialize Redis
     redis_client.init_app(app)
     
+    # Order number generator (worker id from config, else leased from Redis)
+    order_numbers.init_app(app)
+    
+    # Initialize caching (response cache uses Flask-Caching as its shared L2)
+    cache.init_app(app)
+    response_cache.init_app(app)
+    
     # Initialize ElasticSearch (commented out for now)
     # es_client.init_app(app)
     
-    # Initialize Celery (commented out for now)
-    # celery.init_app(app)
+    # Initialize Celery (post-checkout tasks; eager when CELERY_TASK_ALWAYS_EAGER)
+    celery.init_app(app)
     
     # Register blueprints
     app.register_blueprint(api_v1_bp, url_prefix='/api/v1')
@@ -58,6 +68,9 @@ def create_app(config_class=DevelopmentConfig):
     # Register error handlers
     register_error_handlers(app)
     
+    # Register CLI commands (offline jobs)
+    register_commands(app)
+    
     # Health check endpoint
     @app.route('/health')
     def health_check():
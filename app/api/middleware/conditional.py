@@ -0,0 +1,95 @@
+"""Conditional GET support (ETag / Last-Modified)
+
+Views declare a validators function that computes a cheap version of the
+resource (``updated_at`` values, counts) with an aggregate query instead of
+loading the object graph. When the client's ``If-None-Match`` or
+``If-Modified-Since`` still matches, a 304 is returned before the view runs,
+so nothing is queried in full or serialized.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+from flask import Response, g, request
+
+
+def make_etag(*parts) -> str:
+    """Hash version parts into an opaque ETag value"""
+    raw = '|'.join('' if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _http_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    """Normalize a timestamp to aware UTC at HTTP-date (second) precision"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _set_validators(rv, etag: str, last_modified: Optional[datetime]):
+    """Attach ETag/Last-Modified to a successful view result"""
+    if isinstance(rv, Response):
+        if rv.status_code == 200:
+            rv.set_etag(etag, weak=True)
+            if last_modified is not None:
+                rv.last_modified = last_modified
+        return rv
+
+    if isinstance(rv, tuple) and len(rv) >= 2 and rv[1] == 200:
+        headers = dict(rv[2]) if len(rv) > 2 and rv[2] else {}
+        headers['ETag'] = f'W/"{etag}"'
+        if last_modified is not None:
+            headers['Last-Modified'] = last_modified.strftime('%a, %d %b %Y %H:%M:%S GMT')
+        return rv[0], rv[1], headers
+
+    return rv
+
+
+def conditional(validators: Callable[..., Optional[Tuple[tuple, Optional[datetime]]]]):
+    """Answer conditional GETs from a cheap version lookup
+
+    validators receives the view keyword arguments and returns
+    ``(version_parts, last_modified)``, or None when the resource can't be
+    resolved (the view then runs normally and reports the error). The
+    request path and query string are folded into the ETag so each
+    representation gets its own.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                result = validators(**kwargs)
+            except Exception:
+                result = None
+            if result is None:
+                return view(*args, **kwargs)
+
+            version_parts, last_modified = result
+            last_modified = _http_datetime(last_modified)
+            query = sorted(request.args.items(multi=True))
+            etag = make_etag(request.path, query, *version_parts)
+
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+                response.set_etag(etag, weak=True)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                return response
+
+            # Lets the response cache key bodies by the same version
+            g.conditional_etag = etag
+            return _set_validators(view(*args, **kwargs), etag, last_modified)
+        return wrapper
+    return decorator
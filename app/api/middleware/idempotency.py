@@ -0,0 +1,175 @@
+"""Idempotency-Key support for non-idempotent POST endpoints
+
+A client that may retry a request (timeouts, double clicks, flaky mobile
+networks) sends an ``Idempotency-Key`` header. The first request with a key
+claims it in Redis and runs the view; its status and body are stored next
+to a fingerprint of the request. Later requests with the same key:
+
+* get the stored response back, with ``Idempotent-Replayed: true``, when the
+  fingerprint matches and the first request finished;
+* wait for the first request to finish when it is still in flight, instead
+  of running the view a second time;
+* are rejected with 422 when the key was used for a different request.
+
+Keys are scoped to the signed-in user. Only responses of requests that
+actually performed the operation are stored: 2xx, and 4xx the view marks
+with keep_result() (e.g. checkout failing on stock inside its order
+transaction). Other 4xx (validation errors, an empty cart, a version
+conflict) and 5xx responses release the key, so the client can fix the
+request or retry with the same key. When Redis is unavailable the view
+runs without deduplication.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from functools import wraps
+from typing import Any, Dict, Optional
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt_identity
+
+from app.extensions import redis_client
+from app.models.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'idem'
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint() -> str:
+    """Hash of what makes two requests the same operation"""
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(request.path.encode('utf-8'))
+    digest.update(b'\0')
+    body = request.get_json(silent=True)
+    if body is not None:
+        # Key order and whitespace don't change the operation
+        digest.update(json.dumps(body, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _split_result(rv):
+    """Normalize a view result to (body, status, headers)"""
+    if isinstance(rv, tuple):
+        body = rv[0]
+        status = rv[1] if len(rv) > 1 else 200
+        headers = dict(rv[2]) if len(rv) > 2 and rv[2] else {}
+        return body, status, headers
+    return rv, 200, {}
+
+
+def _error(message: str, status: int):
+    return {'error': message}, status
+
+
+def keep_result():
+    """Store the current 4xx response too: the operation ran and failed"""
+    g.idempotency_keep_result = True
+
+
+def _load(key: str) -> Optional[Dict[str, Any]]:
+    raw = redis_client.get(key)
+    return loads(raw) if raw else None
+
+
+def idempotent(scope: str):
+    """Deduplicate retries of a view that carry the same Idempotency-Key
+
+    Apply inside ``@jwt_required()`` and outside ``@ns.marshal_with`` so
+    the key is scoped to the user and the stored body is the serialized one.
+    Requests without the header run normally.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            idempotency_key = request.headers.get(HEADER)
+            if not idempotency_key:
+                return view(*args, **kwargs)
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                return _error(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters', 400)
+
+            config = current_app.config
+            key = f'{KEY_PREFIX}:{scope}:{get_jwt_identity()}:{idempotency_key}'
+            fingerprint = request_fingerprint()
+
+            try:
+                claimed = redis_client.set(
+                    key,
+                    dumps({'state': 'in_flight', 'fingerprint': fingerprint}),
+                    nx=True,
+                    ex=config.get('IDEMPOTENCY_LOCK_TIMEOUT', 30)
+                )
+            except Exception:
+                logger.warning("Idempotency store unavailable; running %s without it", scope)
+                return view(*args, **kwargs)
+
+            if not claimed:
+                return _existing_result(key, fingerprint, config)
+
+            try:
+                rv = view(*args, **kwargs)
+            except Exception:
+                _forget(key)
+                raise
+
+            body, status, _ = _split_result(rv)
+            keep = g.pop('idempotency_keep_result', False)
+            if status >= 500 or (status >= 400 and not keep):
+                _forget(key)
+                return rv
+
+            try:
+                redis_client.set(
+                    key,
+                    dumps({
+                        'state': 'done',
+                        'fingerprint': fingerprint,
+                        'status': status,
+                        'body': body
+                    }),
+                    ex=config.get('IDEMPOTENCY_TTL', 86400)
+                )
+            except Exception:
+                logger.warning("Failed to store idempotent response for %s", scope)
+            return rv
+        return wrapper
+    return decorator
+
+
+def _existing_result(key: str, fingerprint: str, config):
+    """Replay, wait on, or reject a request whose key is already taken"""
+    deadline = time.monotonic() + config.get('IDEMPOTENCY_WAIT_TIMEOUT', 10)
+    poll_interval = config.get('IDEMPOTENCY_POLL_INTERVAL', 0.05)
+
+    while True:
+        try:
+            record = _load(key)
+        except Exception:
+            return _error('Could not verify Idempotency-Key, please retry', 503)
+
+        if record is None:
+            # The first request failed (or its claim expired) before finishing
+            return _error('Original request did not complete, please retry', 409)
+        if record['fingerprint'] != fingerprint:
+            return _error(f'{HEADER} was already used for a different request', 422)
+        if record['state'] == 'done':
+            return record['body'], record['status'], {REPLAYED_HEADER: 'true'}
+        if time.monotonic() >= deadline:
+            return _error('A request with this Idempotency-Key is still in progress', 409)
+        time.sleep(poll_interval)
+
+
+def _forget(key: str):
+    try:
+        redis_client.delete(key)
+    except Exception:
+        pass
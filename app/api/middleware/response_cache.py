@@ -0,0 +1,311 @@
+"""Read-through response cache for public catalog endpoints
+
+Responses are stored in two levels: a small in-process LRU (L1) in front of
+the shared Flask-Caching backend (L2, Redis in production). Every cached
+response is filed under one or more tags (``product:<id>``,
+``category:<id>``, ``catalog``). Each tag has a version token kept in L2 and
+the versions are folded into the cache key, so invalidating a tag simply
+moves readers to a new key; stale entries are never served and expire on
+their own. Other processes notice a new tag version within
+``RESPONSE_CACHE_TAG_TTL`` seconds.
+
+A miss is coalesced so concurrent requests for the same key produce one
+database query: threads in the same process wait on the first caller, and
+other processes wait on a short lock held in L2.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from flask import Response, current_app, g, request
+
+from app.extensions import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'resp'
+TAG_PREFIX = 'resp-tag'
+LOCK_PREFIX = 'resp-lock'
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _Flight:
+    """A cache fill in progress that other threads can wait on"""
+
+    __slots__ = ('event', 'value')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class ResponseCache:
+    """Two-level tagged response cache with miss coalescing"""
+
+    def __init__(self):
+        self.l1 = LRUCache()
+        self._tag_versions: Dict[str, Tuple[str, float]] = {}
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read settings from the app config"""
+        self.l1 = LRUCache(app.config.get('RESPONSE_CACHE_L1_SIZE', 1024))
+        self._tag_versions.clear()
+
+    # ----- configuration -----
+
+    @staticmethod
+    def _setting(name: str, default):
+        return current_app.config.get(name, default)
+
+    @property
+    def enabled(self) -> bool:
+        return self._setting('RESPONSE_CACHE_ENABLED', True)
+
+    @property
+    def default_timeout(self) -> int:
+        return self._setting('RESPONSE_CACHE_TIMEOUT', 60)
+
+    # ----- tags -----
+
+    def _tag_key(self, tag: str) -> str:
+        return f'{TAG_PREFIX}:{tag}'
+
+    def tag_versions(self, tags: Iterable[str]) -> Tuple[str, ...]:
+        """Current version token of each tag, refreshed from L2 when stale"""
+        tags = tuple(tags)
+        now = time.monotonic()
+        tag_ttl = self._setting('RESPONSE_CACHE_TAG_TTL', 2)
+
+        stale = [tag for tag in tags
+                 if tag not in self._tag_versions or self._tag_versions[tag][1] <= now]
+        if stale:
+            try:
+                values = cache.get_many(*[self._tag_key(tag) for tag in stale])
+            except Exception:
+                values = [None] * len(stale)
+
+            for tag, version in zip(stale, values):
+                if version is None:
+                    # Unknown tag (never set or evicted): mint a fresh token so
+                    # entries stored under an older one can't be served again
+                    version = uuid.uuid4().hex
+                    try:
+                        if not cache.add(self._tag_key(tag), version, timeout=0):
+                            version = cache.get(self._tag_key(tag)) or version
+                    except Exception:
+                        pass
+                self._tag_versions[tag] = (version, now + tag_ttl)
+
+        return tuple(self._tag_versions[tag][0] for tag in tags)
+
+    def invalidate(self, *tags: str):
+        """Move every tag to a new version so entries filed under it are skipped"""
+        now = time.monotonic()
+        tag_ttl = self._setting('RESPONSE_CACHE_TAG_TTL', 2)
+        for tag in set(tags):
+            version = uuid.uuid4().hex
+            self._tag_versions[tag] = (version, now + tag_ttl)
+            try:
+                cache.set(self._tag_key(tag), version, timeout=0)
+            except Exception:
+                logger.warning("Failed to invalidate response cache tag %s", tag)
+
+    # ----- lookup -----
+
+    def _l2_get(self, key: str):
+        try:
+            return cache.get(key)
+        except Exception:
+            return None
+
+    def _l1_set(self, key: str, entry: tuple, timeout: int):
+        self.l1.set(key, entry, min(timeout, self._setting('RESPONSE_CACHE_L1_TTL', 30)))
+
+    def _store(self, key: str, entry: tuple, timeout: int):
+        self._l1_set(key, entry, timeout)
+        try:
+            cache.set(key, entry, timeout=timeout)
+        except Exception:
+            pass
+
+    def get_or_fill(self, key: str, fill: Callable[[], Optional[tuple]], timeout: int):
+        """Return the entry for key, running fill() once across concurrent misses
+
+        fill() returns the entry to store, or None when the result must not be
+        cached (errors, non-200 responses). In that case each waiter runs its
+        own fill so error responses are never shared.
+        """
+        entry = self.l1.get(key)
+        if entry is not None:
+            return entry
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            lock_timeout = self._setting('RESPONSE_CACHE_LOCK_TIMEOUT', 5)
+            if flight.event.wait(lock_timeout) and flight.value is not None:
+                return flight.value
+            return fill()
+
+        try:
+            entry = self._l2_get(key)
+            if entry is None:
+                entry = self._fill_with_lock(key, fill, timeout)
+            else:
+                self._l1_set(key, entry, timeout)
+            flight.value = entry
+            return entry
+        finally:
+            flight.event.set()
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+    def _fill_with_lock(self, key: str, fill: Callable[[], Optional[tuple]], timeout: int):
+        """Fill a miss, letting only one process query the database"""
+        lock_key = f'{LOCK_PREFIX}:{key}'
+        lock_timeout = self._setting('RESPONSE_CACHE_LOCK_TIMEOUT', 5)
+
+        try:
+            acquired = cache.add(lock_key, 1, timeout=lock_timeout)
+        except Exception:
+            acquired = True
+
+        if not acquired:
+            # Another process is filling this key; poll L2 until it lands
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = self._l2_get(key)
+                if entry is not None:
+                    self._l1_set(key, entry, timeout)
+                    return entry
+
+        try:
+            entry = fill()
+            if entry is not None:
+                self._store(key, entry, timeout)
+            return entry
+        finally:
+            if acquired:
+                try:
+                    cache.delete(lock_key)
+                except Exception:
+                    pass
+
+
+response_cache = ResponseCache()
+
+
+def normalize_query(params: Optional[Dict[str, Optional[str]]]) -> str:
+    """Canonical query string for the cache key
+
+    Only whitelisted parameters are kept, blank values and values equal to
+    the endpoint default are dropped, and keys and values are sorted, so
+    ``?limit=20&page=1`` and ``?page=1`` share one entry.
+    """
+    if params is None:
+        return ''
+
+    parts = []
+    for name in sorted(params):
+        default = params[name]
+        values = sorted(
+            value.strip() for value in request.args.getlist(name)
+            if value.strip() and value.strip() != default
+        )
+        for value in values:
+            parts.append(f'{name}={value}')
+    return '&'.join(parts)
+
+
+def cached_response(tags: Callable[..., Iterable[str]],
+                    params: Optional[Dict[str, Optional[str]]] = None,
+                    timeout: Optional[int] = None):
+    """Cache a view's JSON response under the given tags
+
+    tags receives the view keyword arguments and returns the tags the
+    response depends on. params maps the query parameters that affect the
+    response to their default values; anything else is ignored for keying.
+    Only 200 responses are cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not response_cache.enabled:
+                return view(*args, **kwargs)
+
+            response_tags = tuple(tags(**kwargs))
+            versions = response_cache.tag_versions(response_tags)
+            # Bodies behind a conditional() view are also keyed by its ETag
+            # so a cached body never disagrees with the validators sent
+            raw_key = (f'{request.path}?{normalize_query(params)}|{",".join(versions)}'
+                       f'|{g.get("conditional_etag", "")}')
+            key = f'{CACHE_PREFIX}:{hashlib.sha1(raw_key.encode("utf-8")).hexdigest()}'
+
+            def fill():
+                rv = view(*args, **kwargs)
+                if isinstance(rv, Response) and rv.status_code == 200:
+                    return rv.get_data(), rv.mimetype
+                fill.uncached = rv
+                return None
+
+            fill.uncached = None
+            entry = response_cache.get_or_fill(key, fill, timeout or response_cache.default_timeout)
+            if entry is None:
+                return fill.uncached
+
+            body, mimetype = entry
+            return Response(body, status=200, mimetype=mimetype)
+        return wrapper
+    return decorator
+
+
+def product_tags(product_id, category_id=None):
+    """Tags touched by a write to a product or one of its variants"""
+    tags = [f'product:{product_id}', 'catalog']
+    if category_id:
+        tags.append(f'category:{category_id}')
+    return tags
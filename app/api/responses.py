@@ -0,0 +1,10 @@
+"""Response helpers for pre-encoded JSON payloads"""
+
+from flask import Response
+
+from app.models.serialization import dumps
+
+
+def json_response(data, status: int = 200, headers: dict = None) -> Response:
+    """Build a response from data encoded straight to JSON bytes"""
+    return Response(dumps(data), status=status, headers=headers, mimetype='application/json')
@@ -1,21 +1,39 @@
 """Admin API endpoints"""
 
-from flask import request
+import io
+
+from flask import Response, request, stream_with_context
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import Schema, fields as ma_fields, validate, ValidationError
 from uuid import UUID
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 from app.models import (
     User, Product, ProductVariant, Category, Order, OrderItem, 
-    Coupon, DiscountRule, Address, Review, Cart, CartItem
+    Coupon, DiscountRule, Address, Review, Cart, CartItem, TaxRate, ShippingRate
 )
 from app.extensions import db
+from app.api.middleware.response_cache import response_cache, product_tags
+from app.services.search_index import mark_catalog_changed
+from app.services import InventoryService, InvoiceService, OrderService
+from app.services.inventory_service import parse_csv as parse_inventory_csv, parse_ndjson as parse_inventory_ndjson
 
 # Create namespace
 ns = Namespace('admin', description='Administrative operations')
 
+order_service = OrderService()
+invoice_service = InvoiceService()
+inventory_service = InventoryService()
+
+# Bulk inventory upload formats by Content-Type
+BULK_INVENTORY_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
 # Utility function to check admin permissions
 def require_admin():
     """Check if current user is admin"""
@@ -88,6 +106,10 @@ coupon_model = ns.model('Coupon', {
     'is_active': fields.Boolean(description='Is coupon active', default=True)
 })
 
+rate_table_model = ns.model('RateTable', {
+    'rates': fields.List(fields.Raw, required=True, description='Complete list of rows; replaces the table')
+})
+
 # ============= PRODUCT MANAGEMENT =============
 
 @ns.route('/products')
@@ -220,6 +242,9 @@ class AdminProducts(Resource):
             db.session.commit()
             db.session.refresh(product)
             
+            response_cache.invalidate(*product_tags(product.id, product.category_id))
+            mark_catalog_changed()
+            
             return product.to_dict(), 201
             
         except ValueError:
@@ -249,6 +274,8 @@ class AdminProduct(Resource):
             if not data:
                 return {'error': 'Request body required'}, 400
             
+            previous_category_id = product.category_id
+            
             # Update fields
             updatable_fields = [
                 'name', 'slug', 'description', 'short_description', 'brand', 'tags',
@@ -266,6 +293,12 @@ class AdminProduct(Resource):
             db.session.commit()
             db.session.refresh(product)
             
+            response_cache.invalidate(
+                *product_tags(product.id, product.category_id),
+                *product_tags(product.id, previous_category_id)
+            )
+            mark_catalog_changed()
+            
             return product.to_dict(), 200
             
         except ValueError:
@@ -298,6 +331,9 @@ class AdminProduct(Resource):
             
             db.session.commit()
             
+            response_cache.invalidate(*product_tags(product.id, product.category_id))
+            mark_catalog_changed()
+            
             return {'message': 'Product deactivated successfully'}, 200
             
         except ValueError:
@@ -352,6 +388,8 @@ class AdminProductVariants(Resource):
             db.session.commit()
             db.session.refresh(variant)
             
+            response_cache.invalidate(*product_tags(product.id, product.category_id))
+            
             return variant.to_dict(), 201
             
         except ValueError:
@@ -459,24 +497,23 @@ class AdminOrder(Resource):
                 if new_status not in valid_statuses:
                     return {'error': 'Invalid order status'}, 400
                 
-                order.status = new_status
-                
-                # Handle status-specific logic
-                if new_status == 'shipped' and old_status != 'shipped':
-                    order.shipped_at = datetime.utcnow()
-                    if 'tracking_number' in data:
-                        order.tracking_number = data['tracking_number']
-                    if 'shipping_carrier' in data:
-                        order.shipping_carrier = data['shipping_carrier']
-                
-                elif new_status == 'delivered' and old_status != 'delivered':
-                    order.delivered_at = datetime.utcnow()
-                
-                elif new_status == 'cancelled':
-                    # Restore stock for cancelled orders
-                    for item in order.items:
-                        if item.variant:
-                            item.variant.stock += item.quantity
+                # Status changes go through the model so they're logged as order events
+                admin_id = UUID(get_jwt_identity())
+                if new_status != old_status:
+                    if new_status == 'shipped':
+                        order.mark_as_shipped(
+                            data.get('shipping_carrier'), data.get('tracking_number'), actor_id=admin_id
+                        )
+                    elif new_status == 'delivered':
+                        order.mark_as_delivered(actor_id=admin_id)
+                    else:
+                        order.transition_to(new_status, actor_id=admin_id)
+                    
+                    if new_status == 'cancelled':
+                        # Restore stock for cancelled orders
+                        for item in order.items:
+                            if item.variant:
+                                item.variant.stock += item.quantity
             
             # Update tracking information
             if 'tracking_number' in data:
@@ -527,8 +564,10 @@ class AdminOrderRefund(Resource):
             reason = data.get('reason', 'Admin refund')
             
             # Process refund
-            order.status = 'refunded'
             order.payment_status = 'refunded'
+            order.transition_to(
+                'refunded', actor_id=UUID(get_jwt_identity()), amount=refund_amount, reason=reason
+            )
             
             # Store refund information
             if not order.order_metadata:
@@ -560,6 +599,62 @@ class AdminOrderRefund(Resource):
             db.session.rollback()
             return {'error': 'Failed to process refund'}, 500
 
+@ns.route('/orders/sla')
+class AdminOrderSLA(Resource):
+    @jwt_required()
+    @ns.doc('admin_order_sla')
+    @ns.param('days', 'Only count events from the last N days', type=int, default=30)
+    def get(self):
+        """Latency histograms between fulfilment stages (placed, confirmed, shipped, delivered)"""
+        if not require_admin():
+            return {'error': 'Admin access required'}, 403
+        
+        days = request.args.get('days', 30, type=int)
+        if days < 1 or days > 365:
+            return {'error': 'days must be between 1 and 365'}, 400
+        
+        try:
+            return {'days': days, 'stages': order_service.get_sla_report(days)}, 200
+        except Exception as e:
+            return {'error': 'Failed to compute order SLA report'}, 500
+
+@ns.route('/orders/invoices')
+class AdminOrderInvoices(Resource):
+    @jwt_required()
+    @ns.doc('admin_export_invoices')
+    @ns.param('start', 'First order date (YYYY-MM-DD)', required=True)
+    @ns.param('end', 'Last order date, inclusive (YYYY-MM-DD)', required=True)
+    @ns.param('format', 'ndjson (JSON invoices, one per line) or zip (HTML invoices)',
+              enum=['ndjson', 'zip'], default='ndjson')
+    def get(self):
+        """Stream the invoices of orders placed in a date range"""
+        if not require_admin():
+            return {'error': 'Admin access required'}, 403
+        
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'zip'):
+            return {'error': 'format must be ndjson or zip'}, 400
+        try:
+            start = datetime.strptime(request.args['start'], '%Y-%m-%d')
+            end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1)
+        except (KeyError, ValueError):
+            return {'error': 'start and end dates (YYYY-MM-DD) are required'}, 400
+        if end <= start:
+            return {'error': 'end must not be before start'}, 400
+        
+        filename = f"invoices-{request.args['start']}-{request.args['end']}.{fmt}"
+        if fmt == 'zip':
+            body, mimetype = invoice_service.export_zip(start, end), 'application/zip'
+        else:
+            body, mimetype = invoice_service.export_ndjson(start, end), 'application/x-ndjson'
+        
+        # Rendered batch by batch while the response is sent
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
 # ============= USER MANAGEMENT =============
 
 @ns.route('/users')
@@ -770,29 +865,24 @@ class AdminInventoryAdjust(Resource):
             
             if not variant_id or adjustment is None:
                 return {'error': 'variant_id and adjustment are required'}, 400
+            if not isinstance(adjustment, int) or isinstance(adjustment, bool):
+                return {'error': 'adjustment must be an integer'}, 400
             
-            variant = db.session.query(ProductVariant).filter(
-                ProductVariant.id == UUID(variant_id)
-            ).first()
-            
-            if not variant:
-                return {'error': 'Product variant not found'}, 404
-            
-            old_stock = variant.stock
-            new_stock = old_stock + adjustment
-            
-            if new_stock < 0:
-                return {'error': 'Stock cannot be negative'}, 400
+            result = inventory_service.adjust(
+                UUID(variant_id), adjustment, reason, actor_id=UUID(get_jwt_identity())
+            )
+            if not result['success']:
+                return {'error': result['error']}, result['status_code']
             
-            variant.stock = new_stock
-            db.session.commit()
+            _invalidate_stock_caches(result['products'])
             
+            entry = result['entry']
             return {
-                'variant_id': str(variant.id),
-                'previous_stock': old_stock,
+                'variant_id': str(entry['variant_id']),
+                'previous_stock': entry['previous_stock'],
                 'adjustment': adjustment,
-                'new_stock': new_stock,
-                'reason': reason
+                'new_stock': entry['new_stock'],
+                'reason': entry['reason']
             }, 200
             
         except ValueError:
@@ -801,6 +891,55 @@ class AdminInventoryAdjust(Resource):
             db.session.rollback()
             return {'error': 'Failed to adjust inventory'}, 500
 
+@ns.route('/inventory/bulk-adjust')
+class AdminInventoryBulkAdjust(Resource):
+    @jwt_required()
+    @ns.doc('admin_bulk_adjust_inventory')
+    @ns.param('format', 'csv or ndjson (default: from the Content-Type)')
+    @ns.param('reason', 'Reason recorded for rows without their own')
+    def post(self):
+        """Apply a CSV or NDJSON stream of stock adjustments
+        
+        Each row names a variant by sku or variant_id and gives either a
+        delta or an absolute stock level, plus an optional reason. The body
+        is read as it arrives and applied in batches; rows that can't be
+        applied are listed in errors with their row number. If the body
+        can't be read to the end, the batches before stay applied and the
+        400 response carries the same report.
+        """
+        if not require_admin():
+            return {'error': 'Admin access required'}, 403
+        
+        fmt = request.args.get('format') or BULK_INVENTORY_FORMATS.get(request.mimetype)
+        if fmt not in ('csv', 'ndjson'):
+            return {'error': 'Send text/csv or application/x-ndjson'}, 415
+        
+        try:
+            lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+            rows = parse_inventory_csv(lines) if fmt == 'csv' else parse_inventory_ndjson(lines)
+            # Caches are invalidated as each batch commits, even if a later one fails
+            result = inventory_service.bulk_adjust(
+                rows, request.args.get('reason', 'Bulk adjustment'), actor_id=UUID(get_jwt_identity()),
+                on_batch=_invalidate_stock_caches
+            )
+        except Exception as e:
+            db.session.rollback()
+            return {'error': 'Failed to adjust inventory'}, 500
+        
+        result.pop('products')
+        result.pop('entries')
+        if result['aborted']:
+            # Rows before the bad input stay applied; report them with the error
+            return {'error': result['aborted'], **result}, 400
+        return result, 200
+
+def _invalidate_stock_caches(products):
+    tags = set()
+    for product_id, category_id in products:
+        tags.update(product_tags(product_id, category_id))
+    if tags:
+        response_cache.invalidate(*tags)
+
 # ============= COUPON MANAGEMENT =============
 
 @ns.route('/coupons')
@@ -826,7 +965,7 @@ class AdminCoupons(Resource):
                     'minimum_amount': float(coupon.minimum_amount) if coupon.minimum_amount else None,
                     'usage_limit': coupon.usage_limit,
                     'usage_count': coupon.usage_count,
-                    'user_limit': coupon.user_limit,
+                    'user_limit': coupon.usage_limit_per_user,
                     'valid_from': coupon.valid_from.isoformat() if coupon.valid_from else None,
                     'valid_until': coupon.valid_until.isoformat() if coupon.valid_until else None,
                     'is_active': coupon.is_active,
@@ -872,12 +1011,13 @@ class AdminCoupons(Resource):
             # Create coupon
             coupon = Coupon(
                 code=data['code'].upper(),
+                name=data.get('name') or data['code'].upper(),
                 description=data.get('description'),
                 discount_type=data['discount_type'],
                 discount_value=data['discount_value'],
                 minimum_amount=data.get('minimum_amount'),
                 usage_limit=data.get('usage_limit'),
-                user_limit=data.get('user_limit', 1),
+                usage_limit_per_user=data.get('user_limit', 1),
                 valid_from=valid_from,
                 valid_until=valid_until,
                 is_active=data.get('is_active', True)
@@ -925,14 +1065,16 @@ class AdminCoupon(Resource):
             
             # Update fields
             updatable_fields = [
-                'description', 'discount_value', 'minimum_amount', 'usage_limit',
-                'user_limit', 'is_active'
+                'description', 'discount_value', 'minimum_amount', 'usage_limit', 'is_active'
             ]
             
             for field in updatable_fields:
                 if field in data:
                     setattr(coupon, field, data[field])
             
+            if 'user_limit' in data:
+                coupon.usage_limit_per_user = data['user_limit']
+            
             # Update dates
             if 'valid_from' in data and data['valid_from']:
                 coupon.valid_from = datetime.fromisoformat(data['valid_from'].replace('Z', '+00:00'))
@@ -981,4 +1123,97 @@ class AdminCoupon(Resource):
             return {'error': 'Invalid UUID format'}, 400
         except Exception as e:
             db.session.rollback()
-            return {'error': 'Failed to deactivate coupon'}, 500 
\ No newline at end of file
+            return {'error': 'Failed to deactivate coupon'}, 500 
+
+# ============= RATE TABLES =============
+
+# Columns exposed per table, and the ones a row must provide
+RATE_TABLES = {
+    'tax': (TaxRate, ('name', 'country', 'state', 'postal_prefix', 'rate', 'is_active'),
+            ('country', 'rate')),
+    'shipping': (ShippingRate, ('method', 'name', 'description', 'country', 'max_weight', 'price',
+                                'free_over', 'sort_order', 'is_active'),
+                 ('method', 'name', 'price')),
+}
+
+def _rate_row_to_dict(row, columns):
+    data = {'id': str(row.id)}
+    for column in columns:
+        value = getattr(row, column)
+        data[column] = float(value) if isinstance(value, Decimal) else value
+    return data
+
+def _rate_row_from_dict(model, columns, required, data):
+    missing = [column for column in required if data.get(column) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    values = {column: data[column] for column in columns if column in data}
+    if values.get('country'):
+        country = values['country']
+        if not (isinstance(country, str) and len(country) == 2 and country.isascii() and country.isalpha()):
+            raise ValueError('country must be a two-letter ISO 3166-1 code')
+        values['country'] = country.upper()
+    for column in ('rate', 'price', 'max_weight', 'free_over'):
+        if values.get(column) is not None:
+            values[column] = Decimal(str(values[column]))
+    if 'rate' in values and not Decimal('0') <= values['rate'] < Decimal('1'):
+        raise ValueError('rate must be a fraction from 0 up to 1, e.g. 0.0825')
+    # Longer strings would fail as a database error rather than a 400
+    for column in columns:
+        length = getattr(model.__table__.c[column].type, 'length', None)
+        if length and isinstance(values.get(column), str) and len(values[column]) > length:
+            raise ValueError(f'{column} is longer than {length} characters')
+    return model(**values)
+
+@ns.route('/rates/<string:table>')
+@ns.param('table', 'Rate table: tax or shipping')
+class AdminRates(Resource):
+    @jwt_required()
+    @ns.doc('admin_list_rates')
+    def get(self, table):
+        """Get all rows of a rate table"""
+        if not require_admin():
+            return {'error': 'Admin access required'}, 403
+        if table not in RATE_TABLES:
+            return {'error': 'Unknown rate table'}, 404
+        
+        try:
+            model, columns, _ = RATE_TABLES[table]
+            rows = db.session.query(model).order_by(*(getattr(model, c) for c in columns[:2])).all()
+            return {'rates': [_rate_row_to_dict(row, columns) for row in rows]}, 200
+            
+        except Exception as e:
+            return {'error': 'Failed to retrieve rates'}, 500
+    
+    @jwt_required()
+    @ns.doc('admin_replace_rates')
+    @ns.expect(rate_table_model)
+    def put(self, table):
+        """Replace a rate table; running processes pick it up within seconds"""
+        if not require_admin():
+            return {'error': 'Admin access required'}, 403
+        if table not in RATE_TABLES:
+            return {'error': 'Unknown rate table'}, 404
+        
+        try:
+            data = request.json
+            if not data or not isinstance(data.get('rates'), list):
+                return {'error': 'rates list required'}, 400
+            
+            model, columns, required = RATE_TABLES[table]
+            rows = [_rate_row_from_dict(model, columns, required, row) for row in data['rates']]
+            
+            # Row events flag the session, so commit bumps the rates version
+            for row in db.session.query(model).all():
+                db.session.delete(row)
+            db.session.add_all(rows)
+            db.session.commit()
+            
+            return {'rates': [_rate_row_to_dict(row, columns) for row in rows]}, 200
+            
+        except (ValueError, TypeError, ArithmeticError) as e:
+            db.session.rollback()
+            return {'error': f'Invalid rate row: {e}'}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {'error': 'Failed to replace rates'}, 500
@@ -1,11 +1,12 @@
 """Authentication API endpoints"""
 
-from flask import request
+from flask import request, session
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from marshmallow import Schema, fields as ma_fields, validate, ValidationError
+from uuid import UUID
 
-from app.services import AuthService
+from app.services import AuthService, CartService
 
 # Create namespace
 ns = Namespace('auth', description='Authentication operations')
@@ -44,6 +45,7 @@ login_model = ns.model('Login', {
 
 # Initialize services
 auth_service = AuthService()
+cart_service = CartService()
 
 @ns.route('/register')
 class Register(Resource):
@@ -88,11 +90,20 @@ class Login(Resource):
             result = auth_service.login_user(data['email'], data['password'])
             
             if result['success']:
-                return {
+                response = {
                     'message': 'Login successful',
                     'user': result['user'],
                     'tokens': result['tokens']
-                }, 200
+                }
+                
+                # Carry the guest cart over to the user's cart
+                session_id = session.get('session_id') or request.headers.get('X-Session-ID')
+                if session_id:
+                    merge = cart_service.merge_guest_cart(session_id, UUID(result['user']['id']))
+                    if merge['success']:
+                        response['merged_cart_items'] = merge['merged_items']
+                
+                return response, 200
             else:
                 return {'error': result['error']}, 401
                 
@@ -7,6 +7,7 @@ from marshmallow import Schema, fields as ma_fields, validate, ValidationError
 from uuid import UUID
 
 from app.services import CartService
+from app.api.middleware.conditional import conditional
 
 # Create namespace
 ns = Namespace('cart', description='Shopping cart operations')
@@ -31,7 +32,9 @@ cart_model = ns.model('Cart', {
     'shipping': fields.Float(description='Shipping cost'),
     'discount': fields.Float(description='Discount amount'),
     'total': fields.Float(description='Total amount'),
-    'items_count': fields.Integer(description='Total items count')
+    'items_count': fields.Integer(description='Total items count'),
+    'promotions': fields.List(fields.Raw, description='Automatic promotions applied'),
+    'version': fields.Integer(description='Cart version, bumped on every change')
 })
 
 add_item_model = ns.model('AddCartItem', {
@@ -65,9 +68,15 @@ def get_user_or_session():
     
     return user_id, session_id
 
+def cart_version():
+    """Cheap version of the current cart for conditional GETs"""
+    user_id, session_id = get_user_or_session()
+    return cart_service.get_cart_version(user_id, session_id)
+
 @ns.route('')
 class CartResource(Resource):
     @ns.doc('get_cart')
+    @conditional(cart_version)
     @ns.marshal_with(cart_model)
     def get(self):
         """Get current cart contents"""
@@ -282,10 +291,12 @@ class ValidateCart(Resource):
 class CartTotals(Resource):
     @ns.doc('calculate_totals')
     @ns.param('shipping_address_id', 'Shipping address ID for shipping calculation')
+    @ns.param('shipping_method', 'Shipping method ID from /cart/shipping-options (default: standard)')
     def get(self):
         """Calculate cart totals"""
         try:
             shipping_address_id = request.args.get('shipping_address_id')
+            shipping_method = request.args.get('shipping_method')
             shipping_uuid = None
             if shipping_address_id:
                 try:
@@ -295,7 +306,7 @@ class CartTotals(Resource):
             
             user_id, session_id = get_user_or_session()
             
-            result = cart_service.calculate_totals(user_id, session_id, shipping_uuid)
+            result = cart_service.calculate_totals(user_id, session_id, shipping_uuid, shipping_method)
             
             if result['success']:
                 return result['totals'], 200
@@ -308,29 +319,26 @@ class CartTotals(Resource):
 @ns.route('/shipping-options')
 class ShippingOptions(Resource):
     @ns.doc('get_shipping_options')
+    @ns.param('shipping_address_id', 'Shipping address ID (rates differ by country)')
     def get(self):
-        """Get available shipping options"""
-        # This is a simplified implementation
-        # In a real application, you would integrate with shipping providers
-        options = [
-            {
-                'id': 'standard',
-                'name': 'Standard Shipping',
-                'description': '5-7 business days',
-                'price': 9.99
-            },
-            {
-                'id': 'express',
-                'name': 'Express Shipping',
-                'description': '2-3 business days',
-                'price': 19.99
-            },
-            {
-                'id': 'overnight',
-                'name': 'Overnight Shipping',
-                'description': '1 business day',
-                'price': 39.99
-            }
-        ]
-        
-        return {'shipping_options': options}, 200 
\ No newline at end of file
+        """Get available shipping options and prices for the current cart"""
+        try:
+            shipping_address_id = request.args.get('shipping_address_id')
+            shipping_uuid = None
+            if shipping_address_id:
+                try:
+                    shipping_uuid = UUID(shipping_address_id)
+                except ValueError:
+                    return {'error': 'Invalid shipping address ID'}, 400
+            
+            user_id, session_id = get_user_or_session()
+            
+            result = cart_service.get_shipping_options(user_id, session_id, shipping_uuid)
+            
+            if result['success']:
+                return {'shipping_options': result['options']}, 200
+            else:
+                return {'error': result['error']}, 400
+                
+        except Exception as e:
+            return {'error': 'Failed to get shipping options'}, 500 
\ No newline at end of file
@@ -1,21 +1,51 @@
 """Order API endpoints"""
 
-from flask import request
+from flask import Response, request
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import Schema, fields as ma_fields, validate, ValidationError
 from uuid import UUID
-from datetime import datetime
 
 from app.models import Order, OrderItem, Cart, CartItem, ProductVariant, Address, User
-from app.services import CartService
+from app.services import CartService, InvoiceService, OrderService, ProductService
+from app.services.invoice_service import INVOICE_FORMATS
 from app.extensions import db
+from app.api.responses import json_response
+from app.api.middleware.conditional import conditional
+from app.api.middleware.idempotency import idempotent, keep_result
+from app.repositories import OrderRepository
 
 # Create namespace
 ns = Namespace('orders', description='Order operations')
 
 # Initialize services
 cart_service = CartService()
+order_service = OrderService()
+invoice_service = InvoiceService()
+product_service = ProductService()
+order_repo = OrderRepository()
+
+
+def order_history_version():
+    """Cheap version of the user's order history for conditional GETs"""
+    return order_repo.get_history_version(UUID(get_jwt_identity()))
+
+
+def order_tracking_version(order_id):
+    """Cheap version of a single order for conditional GETs"""
+    return order_repo.get_order_version(UUID(order_id), UUID(get_jwt_identity()))
+
+# Title and description of each order event on the tracking timeline
+TIMELINE_STEPS = {
+    'placed': ('Order Placed', 'Order {order_number} was placed'),
+    'pending': ('Order Pending', 'Order is awaiting confirmation'),
+    'confirmed': ('Order Confirmed', 'Payment confirmed and order is being processed'),
+    'processing': ('Order Processing', 'Order is being prepared for shipment'),
+    'shipped': ('Order Shipped', 'Order shipped via {carrier}'),
+    'delivered': ('Order Delivered', 'Order has been delivered'),
+    'cancelled': ('Order Cancelled', 'Order was cancelled'),
+    'refunded': ('Order Refunded', 'Order was refunded'),
+}
 
 # Flask-RESTX models for documentation
 checkout_model = ns.model('Checkout', {
@@ -23,7 +53,9 @@ checkout_model = ns.model('Checkout', {
     'billing_address_id': fields.String(required=True, description='Billing address ID'),
     'payment_method': fields.String(required=True, description='Payment method'),
     'notes': fields.String(description='Order notes'),
-    'coupon_code': fields.String(description='Coupon code')
+    'coupon_code': fields.String(description='Coupon code'),
+    'shipping_method': fields.String(description='Shipping method ID (default: standard)'),
+    'cart_version': fields.Integer(description='Cart version the shown totals came from; 409 if the cart changed since')
 })
 
 order_item_model = ns.model('OrderItem', {
@@ -63,140 +95,34 @@ class OrderList(Resource):
     @jwt_required()
     @ns.doc('create_order')
     @ns.expect(checkout_model)
+    @idempotent('checkout')
     @ns.marshal_with(order_model)
     def post(self):
         """Create order (checkout)"""
         try:
             user_id = UUID(get_jwt_identity())
-            data = request.json
-            
-            if not data:
-                return {'error': 'Request body required'}, 400
-            
-            # Validate required fields
-            required_fields = ['shipping_address_id', 'billing_address_id', 'payment_method']
-            for field in required_fields:
-                if not data.get(field):
-                    return {'error': f'{field} is required'}, 400
-            
-            # Get user cart
-            cart = cart_service.get_or_create_cart(user_id, None)
-            if not cart or cart.is_empty():
-                return {'error': 'Cart is empty'}, 400
-            
-            # Validate cart items
-            validation_result = cart_service.validate_cart(user_id, None)
-            if not validation_result['valid']:
-                return {
-                    'error': 'Cart validation failed',
-                    'details': validation_result['errors']
-                }, 400
-            
-            # Validate addresses
-            shipping_address = db.session.query(Address).filter(
-                Address.id == UUID(data['shipping_address_id']),
-                Address.user_id == user_id
-            ).first()
-            
-            billing_address = db.session.query(Address).filter(
-                Address.id == UUID(data['billing_address_id']),
-                Address.user_id == user_id
-            ).first()
-            
-            if not shipping_address or not billing_address:
-                return {'error': 'Invalid address'}, 400
-            
-            try:
-                # Calculate totals
-                totals_result = cart_service.calculate_totals(user_id, None, UUID(data['shipping_address_id']))
-                if not totals_result['success']:
-                    return {'error': 'Failed to calculate totals'}, 500
-                
-                totals = totals_result['totals']
-                
-                # Create order
-                order = Order(
-                    user_id=user_id,
-                    status='pending',
-                    payment_status='pending',
-                    subtotal=totals['subtotal'],
-                    tax_amount=totals['tax'],
-                    shipping_amount=totals['shipping'],
-                    discount_amount=totals['discount'],
-                    total=totals['total'],
-                    currency='USD',
-                    shipping_address={
-                        'line1': shipping_address.line1,
-                        'line2': shipping_address.line2,
-                        'city': shipping_address.city,
-                        'state': shipping_address.state,
-                        'postal_code': shipping_address.postal_code,
-                        'country': shipping_address.country
-                    },
-                    billing_address={
-                        'line1': billing_address.line1,
-                        'line2': billing_address.line2,
-                        'city': billing_address.city,
-                        'state': billing_address.state,
-                        'postal_code': billing_address.postal_code,
-                        'country': billing_address.country
-                    },
-                    payment_method=data['payment_method'],
-                    notes=data.get('notes')
-                )
-                
-                db.session.add(order)
-                db.session.flush()  # Get order ID
-                
-                # Create order items from cart
-                for cart_item in cart.items:
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        variant_id=cart_item.variant_id,
-                        quantity=cart_item.quantity,
-                        price=cart_item.price,
-                        total=cart_item.price * cart_item.quantity,
-                        product_name=cart_item.variant.product.name if cart_item.variant.product else '',
-                        product_sku=cart_item.variant.product.sku if cart_item.variant.product else '',
-                        variant_name=cart_item.variant.name,
-                        variant_sku=cart_item.variant.sku,
-                        variant_attributes=cart_item.variant.attributes or {}
-                    )
-                    db.session.add(order_item)
-                    
-                    # Update stock
-                    cart_item.variant.stock -= cart_item.quantity
-                
-                # Clear cart
-                cart.status = 'converted'
-                cart.converted_at = datetime.utcnow()
-                
-                # Process payment (simplified)
-                if data['payment_method'] in ['credit_card', 'paypal']:
-                    order.payment_status = 'captured'
-                    order.status = 'confirmed'
-                
-                db.session.commit()
-                
-                # Track order creation event
-                self._track_order_event(user_id, order.id, 'order_created')
-                
-                return order.to_dict(), 201
-                
-            except Exception as e:
-                db.session.rollback()
-                return {'error': 'Failed to create order'}, 500
-                
         except ValueError:
             return {'error': 'Invalid UUID format'}, 400
-        except Exception as e:
-            return {'error': 'Failed to process checkout'}, 500
+        
+        # Payment, confirmation email and analytics run as background tasks
+        result = order_service.checkout(user_id, request.get_json(silent=True))
+        if not result['success']:
+            if result.get('order_attempted'):
+                # Failed inside the order transaction: replay it rather than retry
+                keep_result()
+            error = {'error': result['error']}
+            if 'details' in result:
+                error['details'] = result['details']
+            return error, result.get('status_code', 400)
+        
+        return result['order'].to_dict(), 201
     
     @jwt_required()
     @ns.doc('get_orders')
     @ns.param('page', 'Page number', type=int, default=1)
     @ns.param('limit', 'Items per page', type=int, default=20)
     @ns.param('status', 'Filter by order status')
+    @conditional(order_history_version)
     def get(self):
         """Get user's order history"""
         try:
@@ -223,34 +149,18 @@ class OrderList(Resource):
             # Get orders
             orders = query.order_by(Order.created_at.desc()).offset(offset).limit(limit).all()
             
-            return {
-                'orders': [order.to_dict() for order in orders],
+            return json_response({
+                'orders': [order.to_dict(for_encoder=True) for order in orders],
                 'pagination': {
                     'page': page,
                     'limit': limit,
                     'total': total,
                     'pages': (total + limit - 1) // limit
                 }
-            }, 200
+            })
             
         except Exception as e:
             return {'error': 'Failed to retrieve orders'}, 500
-    
-    def _track_order_event(self, user_id: UUID, order_id: UUID, event_type: str):
-        """Track order-related events"""
-        try:
-            from app.models import UserEvent
-            event = UserEvent(
-                user_id=user_id,
-                event_type=event_type,
-                entity_type='order',
-                entity_id=order_id,
-                metadata={}
-            )
-            db.session.add(event)
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
 
 @ns.route('/<string:order_id>')
 class OrderDetail(Resource):
@@ -302,7 +212,7 @@ class CancelOrder(Resource):
             try:
                 # Cancel order
                 reason = request.json.get('reason', 'Customer requested cancellation') if request.json else 'Customer requested cancellation'
-                order.cancel_order(reason)
+                order.cancel_order(reason, actor_id=user_id)
                 
                 # Restore stock
                 for item in order.items:
@@ -345,6 +255,7 @@ class CancelOrder(Resource):
 class TrackOrder(Resource):
     @jwt_required()
     @ns.doc('track_order')
+    @conditional(order_tracking_version)
     def get(self, order_id):
         """Track order status"""
         try:
@@ -370,7 +281,7 @@ class TrackOrder(Resource):
                 'shipped_at': order.shipped_at.isoformat() if order.shipped_at else None,
                 'delivered_at': order.delivered_at.isoformat() if order.delivered_at else None,
                 'estimated_delivery': self._calculate_estimated_delivery(order),
-                'timeline': self._generate_order_timeline(order)
+                'timeline': self._generate_order_timeline(order, order_repo.get_events(order.id))
             }
             
             return tracking_info, 200
@@ -399,8 +310,57 @@ class TrackOrder(Resource):
         
         return None
     
-    def _generate_order_timeline(self, order):
-        """Generate order status timeline"""
+    def _generate_order_timeline(self, order, events):
+        """Order status timeline from the order's event log"""
+        if not events:
+            return self._infer_order_timeline(order)
+        
+        timeline = []
+        reached = set()
+        for event in events:
+            title, description = TIMELINE_STEPS.get(
+                event.event_type, (f'Order {event.event_type.title()}', '')
+            )
+            details = event.details or {}
+            if event.event_type == 'placed':
+                description = description.format(order_number=order.order_number)
+            elif event.event_type == 'shipped':
+                description = description.format(carrier=details.get('carrier') or 'carrier')
+            elif event.event_type == 'cancelled' and details.get('reason'):
+                description = details['reason']
+            
+            reached.add(event.event_type)
+            timeline.append({
+                'status': event.event_type,
+                'title': title,
+                'description': description,
+                'date': event.occurred_at.isoformat(),
+                'completed': True
+            })
+        
+        # Steps still ahead of an open order
+        if order.status not in ('cancelled', 'refunded'):
+            if 'shipped' not in reached and order.status != 'delivered':
+                timeline.append({
+                    'status': 'shipped',
+                    'title': 'Order Shipped',
+                    'description': 'Order is being prepared for shipment',
+                    'date': None,
+                    'completed': False
+                })
+            if 'delivered' not in reached:
+                timeline.append({
+                    'status': 'delivered',
+                    'title': 'Order Delivered',
+                    'description': 'Order will be delivered soon',
+                    'date': None,
+                    'completed': False
+                })
+        
+        return timeline
+    
+    def _infer_order_timeline(self, order):
+        """Timeline guessed from the order row, for orders placed before the event log"""
         timeline = []
         
         # Order placed
@@ -472,30 +432,22 @@ class TrackOrder(Resource):
 class OrderInvoice(Resource):
     @jwt_required()
     @ns.doc('get_order_invoice')
+    @ns.param('format', 'Invoice format', enum=list(INVOICE_FORMATS), default='json')
     def get(self, order_id):
         """Get order invoice"""
+        fmt = request.args.get('format', 'json')
+        if fmt not in INVOICE_FORMATS:
+            return {'error': f"format must be one of {', '.join(INVOICE_FORMATS)}"}, 400
+        
         try:
             user_id = UUID(get_jwt_identity())
             order_uuid = UUID(order_id)
             
-            order = db.session.query(Order).filter(
-                Order.id == order_uuid,
-                Order.user_id == user_id
-            ).first()
-            
-            if not order:
+            invoice = invoice_service.get_invoice(order_uuid, user_id, fmt)
+            if invoice is None:
                 return {'error': 'Order not found'}, 404
             
-            # Generate invoice data
-            invoice_data = {
-                'order': order.to_dict(),
-                'invoice_number': f'INV-{order.order_number}',
-                'invoice_date': datetime.utcnow().isoformat(),
-                'due_date': datetime.utcnow().isoformat(),  # Paid order
-                'status': 'paid' if order.payment_status == 'captured' else 'pending'
-            }
-            
-            return invoice_data, 200
+            return Response(invoice, mimetype=INVOICE_FORMATS[fmt])
             
         except ValueError:
             return {'error': 'Invalid order ID'}, 400
@@ -2,11 +2,16 @@
 
 from flask import request
 from flask_restx import Namespace, Resource, fields
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, verify_jwt_in_request
 from marshmallow import Schema, fields as ma_fields, validate, ValidationError
 from uuid import UUID
 
+from app.models import Product
 from app.services import ProductService
+from app.services.search_index import suggest_index
+from app.api.responses import json_response
+from app.api.middleware.response_cache import cached_response
+from app.api.middleware.conditional import conditional
 
 # Create namespace
 ns = Namespace('products', description='Product operations')
@@ -14,6 +19,33 @@ ns = Namespace('products', description='Product operations')
 # Initialize services
 product_service = ProductService()
 
+# Query parameters that shape each cached listing, with their defaults
+LIST_PARAMS = {
+    'q': '', 'category': None, 'brand': None, 'min_price': None, 'max_price': None,
+    'in_stock': 'true', 'sort': 'created_at', 'page': '1', 'limit': '20'
+}
+PAGE_PARAMS = {'page': '1', 'limit': '20'}
+
+
+def catalog_tags(**kwargs):
+    return ('catalog',)
+
+
+def product_tags(product_id):
+    return (f'product:{product_id.lower()}',)
+
+
+def related_tags(product_id):
+    return (f'product:{product_id.lower()}', 'catalog', 'related')
+
+
+def category_tags(category_id):
+    return (f'category:{category_id.lower()}',)
+
+
+def product_version(product_id):
+    return product_service.get_product_version(UUID(product_id))
+
 # Flask-RESTX models for documentation
 product_model = ns.model('Product', {
     'id': fields.String(description='Product ID'),
@@ -40,6 +72,7 @@ class ProductList(Resource):
     @ns.param('sort', 'Sort order (name, price, created_at)')
     @ns.param('page', 'Page number')
     @ns.param('limit', 'Items per page')
+    @cached_response(catalog_tags, params=LIST_PARAMS)
     def get(self):
         """Get products with filtering and search"""
         try:
@@ -85,15 +118,15 @@ class ProductList(Resource):
                 offset=offset
             )
             
-            return {
-                'products': [product.to_dict() for product in result['products']],
+            return json_response({
+                'products': Product.to_dict_many(result['products'], for_encoder=True),
                 'pagination': {
                     'page': page,
                     'limit': limit,
                     'total': result['total'],
                     'pages': (result['total'] + limit - 1) // limit
                 }
-            }, 200
+            })
             
         except Exception as e:
             return {'error': 'Failed to fetch products'}, 500
@@ -103,42 +136,69 @@ class ProductDetail(Resource):
     @ns.doc('get_product')
     def get(self, product_id):
         """Get product details by ID"""
-        try:
-            product_uuid = UUID(product_id)
-            product = product_service.get_product_with_variants(product_uuid)
-            
-            if not product:
-                return {'error': 'Product not found'}, 404
-            
-            # Track product view
+        response = self._render(product_id=product_id)
+        
+        # Track product view (cache hits and revalidations included)
+        if getattr(response, 'status_code', None) in (200, 304):
             user_id = None
             try:
                 user_id = get_jwt_identity() if get_jwt_identity() else None
             except:
                 pass
             
-            product_service.track_product_view(product_uuid, user_id)
+            product_service.track_product_view(
+                UUID(product_id), user_id, request.headers.get('X-Session-ID')
+            )
+        
+        return response
+    
+    @conditional(product_version)
+    @cached_response(product_tags)
+    def _render(self, product_id):
+        try:
+            product_uuid = UUID(product_id)
+            product = product_service.get_product_with_variants(product_uuid)
+            
+            if not product:
+                return {'error': 'Product not found'}, 404
             
-            return {'product': product.to_dict()}, 200
+            return json_response({'product': product.to_dict()})
             
         except ValueError:
             return {'error': 'Invalid product ID'}, 400
         except Exception as e:
             return {'error': 'Failed to fetch product'}, 500
 
+@ns.route('/suggest')
+class ProductSuggest(Resource):
+    @ns.doc('suggest_products')
+    @ns.param('q', 'Prefix typed so far')
+    @ns.param('limit', 'Number of suggestions to return (max 20)')
+    def get(self):
+        """Autocomplete product names, brands and categories"""
+        try:
+            prefix = request.args.get('q', '')
+            limit = request.args.get('limit', 8, type=int)
+            
+            return json_response({'suggestions': suggest_index.suggest(prefix, max(limit, 1))})
+            
+        except Exception as e:
+            return {'error': 'Failed to fetch suggestions'}, 500
+
 @ns.route('/featured')
 class FeaturedProducts(Resource):
     @ns.doc('get_featured_products')
     @ns.param('limit', 'Number of featured products to return')
+    @cached_response(catalog_tags, params={'limit': '10'})
     def get(self):
         """Get featured products"""
         try:
             limit = request.args.get('limit', 10, type=int)
             products = product_service.get_featured_products(limit)
             
-            return {
-                'products': [product.to_dict() for product in products]
-            }, 200
+            return json_response({
+                'products': Product.to_dict_many(products, for_encoder=True)
+            })
             
         except Exception as e:
             return {'error': 'Failed to fetch featured products'}, 500
@@ -146,11 +206,12 @@ class FeaturedProducts(Resource):
 @ns.route('/categories')
 class Categories(Resource):
     @ns.doc('get_categories')
+    @cached_response(catalog_tags)
     def get(self):
         """Get product categories"""
         try:
             categories = product_service.get_categories()
-            return {'categories': categories}, 200
+            return json_response({'categories': categories})
         except Exception as e:
             return {'error': 'Failed to fetch categories'}, 500
 
@@ -159,6 +220,7 @@ class CategoryProducts(Resource):
     @ns.doc('get_category_products')
     @ns.param('page', 'Page number')
     @ns.param('limit', 'Items per page')
+    @cached_response(category_tags, params=PAGE_PARAMS)
     def get(self, category_id):
         """Get products in a specific category"""
         try:
@@ -171,15 +233,15 @@ class CategoryProducts(Resource):
                 category_uuid, limit, offset
             )
             
-            return {
-                'products': [product.to_dict() for product in result['products']],
+            return json_response({
+                'products': Product.to_dict_many(result['products'], for_encoder=True),
                 'pagination': {
                     'page': page,
                     'limit': limit,
                     'total': result['total'],
                     'pages': (result['total'] + limit - 1) // limit
                 }
-            }, 200
+            })
             
         except ValueError:
             return {'error': 'Invalid category ID'}, 400
@@ -190,6 +252,7 @@ class CategoryProducts(Resource):
 class RelatedProducts(Resource):
     @ns.doc('get_related_products')
     @ns.param('limit', 'Number of related products to return')
+    @cached_response(related_tags, params={'limit': '5'})
     def get(self, product_id):
         """Get related products"""
         try:
@@ -198,9 +261,9 @@ class RelatedProducts(Resource):
             
             products = product_service.get_related_products(product_uuid, limit)
             
-            return {
-                'products': [product.to_dict() for product in products]
-            }, 200
+            return json_response({
+                'products': Product.to_dict_many(products, for_encoder=True)
+            })
             
         except ValueError:
             return {'error': 'Invalid product ID'}, 400
@@ -218,15 +281,14 @@ class Recommendations(Resource):
             user_id = None
             
             try:
+                verify_jwt_in_request(optional=True)
                 user_id = UUID(get_jwt_identity()) if get_jwt_identity() else None
             except:
                 pass
             
             products = product_service.get_recommendations(user_id, limit)
             
-            return {
-                'products': [product.to_dict() for product in products]
-            }, 200
+            return json_response({'products': products})
             
         except Exception as e:
             return {'error': 'Failed to fetch recommendations'}, 500
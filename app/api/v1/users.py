@@ -8,10 +8,23 @@ from uuid import UUID
 
 from app.models import User, Address, Order, Wishlist, ProductVariant
 from app.extensions import db
+from app.api.responses import json_response
+from app.api.middleware.conditional import conditional
+from app.repositories import OrderRepository, UserStatsRepository
+from app.services import WishlistService
 
 # Create namespace
 ns = Namespace('users', description='User profile and management operations')
 
+order_repo = OrderRepository()
+stats_repo = UserStatsRepository()
+wishlist_service = WishlistService()
+
+
+def order_summary_version():
+    """Cheap version of the user's order summaries for conditional GETs"""
+    return order_repo.get_summary_version(UUID(get_jwt_identity()))
+
 # Flask-RESTX models for documentation
 address_model = ns.model('Address', {
     'id': fields.String(description='Address ID'),
@@ -56,6 +69,10 @@ wishlist_item_model = ns.model('WishlistItem', {
     'added_at': fields.String(description='Date added to wishlist')
 })
 
+wishlist_move_model = ns.model('WishlistMove', {
+    'variant_ids': fields.List(fields.String, description='Variant IDs to move; omit to move the whole wishlist')
+})
+
 @ns.route('/me')
 class UserProfile(Resource):
     @jwt_required()
@@ -353,8 +370,9 @@ class UserOrders(Resource):
     @ns.param('page', 'Page number', type=int, default=1)
     @ns.param('limit', 'Items per page', type=int, default=20)
     @ns.param('status', 'Filter by order status')
+    @conditional(order_summary_version)
     def get(self):
-        """Get user's order history"""
+        """Get user's order history (summaries, without items)"""
         try:
             user_id = UUID(get_jwt_identity())
             page = request.args.get('page', 1, type=int)
@@ -367,27 +385,22 @@ class UserOrders(Resource):
             
             offset = (page - 1) * limit
             
-            # Build query
-            query = db.session.query(Order).filter(Order.user_id == user_id)
-            
+            # Summaries only: no items or variant lookups
+            orders = order_repo.get_summaries(user_id, status_filter, offset, limit)
             if status_filter:
-                query = query.filter(Order.status == status_filter)
-            
-            # Get total count
-            total = query.count()
-            
-            # Get orders
-            orders = query.order_by(Order.created_at.desc()).offset(offset).limit(limit).all()
+                total = order_repo.count_for_user(user_id, status_filter)
+            else:
+                total = stats_repo.get_for_user(user_id).total_orders
             
-            return {
-                'orders': [order.to_dict() for order in orders],
+            return json_response({
+                'orders': orders,
                 'pagination': {
                     'page': page,
                     'limit': limit,
                     'total': total,
                     'pages': (total + limit - 1) // limit
                 }
-            }, 200
+            })
             
         except Exception as e:
             return {'error': 'Failed to retrieve orders'}, 500
@@ -402,33 +415,7 @@ class UserWishlist(Resource):
         try:
             user_id = UUID(get_jwt_identity())
             
-            wishlist_items = db.session.query(Wishlist).filter(
-                Wishlist.user_id == user_id
-            ).order_by(Wishlist.created_at.desc()).all()
-            
-            result = []
-            for item in wishlist_items:
-                result.append({
-                    'id': str(item.id),
-                    'variant_id': str(item.variant_id),
-                    'variant': {
-                        'id': str(item.variant.id),
-                        'name': item.variant.name,
-                        'sku': item.variant.sku,
-                        'price': float(item.variant.price),
-                        'stock': item.variant.stock,
-                        'attributes': item.variant.attributes,
-                        'product': {
-                            'id': str(item.variant.product.id),
-                            'name': item.variant.product.name,
-                            'slug': item.variant.product.slug,
-                            'brand': item.variant.product.brand
-                        } if item.variant.product else None
-                    } if item.variant else None,
-                    'added_at': item.created_at.isoformat() if item.created_at else None
-                })
-            
-            return result, 200
+            return wishlist_service.get_wishlist(user_id), 200
             
         except Exception as e:
             return {'error': 'Failed to retrieve wishlist'}, 500
@@ -510,6 +497,35 @@ class WishlistItem(Resource):
             db.session.rollback()
             return {'error': 'Failed to remove item from wishlist'}, 500
 
+@ns.route('/me/wishlist/move-to-cart')
+class MoveWishlistToCart(Resource):
+    @jwt_required()
+    @ns.doc('move_wishlist_items_to_cart')
+    @ns.expect(wishlist_move_model)
+    def post(self):
+        """Move several wishlist items (or the whole wishlist) to the cart"""
+        try:
+            user_id = UUID(get_jwt_identity())
+            data = request.json or {}
+            
+            variant_ids = data.get('variant_ids')
+            if variant_ids is not None:
+                if not isinstance(variant_ids, list):
+                    return {'error': 'variant_ids must be a list'}, 400
+                variant_ids = [UUID(variant_id) for variant_id in variant_ids]
+            
+            result = wishlist_service.move_to_cart(user_id, variant_ids)
+            
+            if result['success']:
+                return {'moved': result['moved'], 'skipped': result['skipped']}, 200
+            else:
+                return {'error': result['error']}, 500
+                
+        except (ValueError, TypeError, AttributeError):
+            return {'error': 'Invalid variant ID'}, 400
+        except Exception as e:
+            return {'error': 'Failed to move items to cart'}, 500
+
 @ns.route('/me/wishlist/<string:variant_id>/move-to-cart')
 class MoveToCart(Resource):
     @jwt_required()
@@ -520,39 +536,19 @@ class MoveToCart(Resource):
             user_id = UUID(get_jwt_identity())
             variant_uuid = UUID(variant_id)
             
-            # Check if item is in wishlist
-            wishlist_item = db.session.query(Wishlist).filter(
-                Wishlist.user_id == user_id,
-                Wishlist.variant_id == variant_uuid
-            ).first()
-            
-            if not wishlist_item:
-                return {'error': 'Item not in wishlist'}, 404
-            
-            # Check stock availability
-            variant = wishlist_item.variant
-            if not variant or not variant.is_active or variant.stock < 1:
-                return {'error': 'Product is not available'}, 400
-            
-            # Add to cart using cart service
-            from app.services import CartService
-            cart_service = CartService()
+            result = wishlist_service.move_to_cart(user_id, [variant_uuid])
             
-            result = cart_service.add_to_cart(user_id, None, variant_uuid, 1)
-            
-            if result['success']:
-                # Remove from wishlist
-                db.session.delete(wishlist_item)
-                db.session.commit()
-                
+            if not result['success']:
+                return {'error': result['error']}, 500
+            if result['moved']:
                 return {'message': 'Item moved to cart successfully'}, 200
-            else:
-                return {'error': result['error']}, 400
+            
+            error = result['skipped'][0]['error']
+            return {'error': error}, 404 if error == 'Item not in wishlist' else 400
                 
         except ValueError:
             return {'error': 'Invalid variant ID'}, 400
         except Exception as e:
-            db.session.rollback()
             return {'error': 'Failed to move item to cart'}, 500
 
 @ns.route('/me/stats')
@@ -564,33 +560,21 @@ class UserStats(Resource):
         try:
             user_id = UUID(get_jwt_identity())
             
-            # Calculate user statistics
-            total_orders = db.session.query(Order).filter(Order.user_id == user_id).count()
-            
-            completed_orders = db.session.query(Order).filter(
-                Order.user_id == user_id,
-                Order.status.in_(['delivered', 'completed'])
-            ).count()
-            
-            total_spent = db.session.query(db.func.sum(Order.total)).filter(
-                Order.user_id == user_id,
-                Order.status.in_(['delivered', 'completed', 'shipped'])
-            ).scalar() or 0
-            
-            wishlist_count = db.session.query(Wishlist).filter(
-                Wishlist.user_id == user_id
-            ).count()
+            # Counters are maintained on order and wishlist writes
+            user_stats = stats_repo.get_for_user(user_id)
             
-            # Get last order
-            last_order = db.session.query(Order).filter(
-                Order.user_id == user_id
-            ).order_by(Order.created_at.desc()).first()
+            last_order = db.session.get(Order, user_stats.last_order_id) if user_stats.last_order_id else None
+            if last_order is None and user_stats.total_orders:
+                # The recorded last order was deleted
+                last_order = db.session.query(Order).filter(
+                    Order.user_id == user_id
+                ).order_by(Order.created_at.desc()).first()
             
             stats = {
-                'total_orders': total_orders,
-                'completed_orders': completed_orders,
-                'total_spent': float(total_spent),
-                'wishlist_items': wishlist_count,
+                'total_orders': user_stats.total_orders,
+                'completed_orders': user_stats.completed_orders,
+                'total_spent': float(user_stats.total_spent),
+                'wishlist_items': user_stats.wishlist_items,
                 'last_order': {
                     'id': str(last_order.id),
                     'order_number': last_order.order_number,
@@ -0,0 +1,136 @@
+"""Flask CLI commands for offline and maintenance jobs"""
+
+import click
+from flask.cli import AppGroup
+
+jobs_cli = AppGroup('jobs', help='Offline precompute and maintenance jobs')
+
+
+@jobs_cli.command('build-related')
+@click.option('--full', is_flag=True, help='Rebuild every product instead of only those touched since the last run')
+def build_related(full):
+    """Rebuild related products from co-purchase and co-view graphs"""
+    from app.services.related_products_service import RelatedProductsService
+    from app.api.middleware.response_cache import response_cache
+    
+    stats = RelatedProductsService().build(full=full)
+    response_cache.invalidate('related')
+    
+    click.echo(
+        f"Related products ({stats['mode']}): "
+        f"{stats['products']} products, {stats['relations']} relations"
+    )
+
+
+@jobs_cli.command('train-recommendations')
+@click.option('--full', is_flag=True, help='Recompute every item instead of only those with new interactions')
+def train_recommendations(full):
+    """Retrain item-item collaborative filtering neighbors"""
+    from app.services.recommendation_service import RecommendationService
+    
+    stats = RecommendationService().train(full=full)
+    
+    click.echo(
+        f"Recommendations ({stats['mode']}): {stats['users']} users, {stats['items']} items, "
+        f"{stats['interactions']} interactions, {stats['items_updated']} items updated, "
+        f"{stats['relations']} neighbors"
+    )
+
+
+@jobs_cli.command('reindex-search')
+@click.option('--batch-size', default=500, show_default=True, help='Products updated per commit')
+def reindex_search(batch_size):
+    """Recompute the folded search text behind the product trigram index"""
+    from app.extensions import db
+    from app.models import Product
+    from app.models.product import build_search_text
+    
+    updated = 0
+    last_id = None
+    while True:
+        query = db.session.query(Product.id, Product.name, Product.brand, Product.tags)
+        if last_id is not None:
+            query = query.filter(Product.id > last_id)
+        rows = query.order_by(Product.id).limit(batch_size).all()
+        if not rows:
+            break
+        
+        # Bulk UPDATE by primary key; skips the ORM save hooks and updated_at
+        db.session.bulk_update_mappings(Product, [
+            {'id': row.id, 'search_text': build_search_text(row.name, row.brand, row.tags)}
+            for row in rows
+        ])
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+    
+    click.echo(f"Search text: {updated} products reindexed")
+
+
+@jobs_cli.command('reconcile-coupons')
+@click.option('--batch-size', type=int, default=None, help='Coupons updated per commit')
+def reconcile_coupons(batch_size):
+    """Apply redeemed coupon uses to coupons.usage_count and release expired holds"""
+    from app.services.coupon_reservation_service import CouponReservationService
+    
+    stats = CouponReservationService().reconcile(batch_size)
+    
+    click.echo(
+        f"Coupons: {stats['uses']} uses applied to {stats['coupons']} coupons, "
+        f"{stats['released']} expired reservations released"
+    )
+
+
+@jobs_cli.command('compact-carts')
+@click.option('--days', type=int, default=None, help='Days past expiry before closed carts are deleted')
+@click.option('--batch-size', type=int, default=None, help='Carts expired or deleted per transaction')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches')
+@click.option('--dry-run', is_flag=True, help='Only count what would be expired, archived and deleted')
+def compact_carts(days, batch_size, max_batches, dry_run):
+    """Expire stale carts, then archive and delete old closed carts in batches"""
+    from app.services.cart_retention_service import CartRetentionService
+    
+    stats = CartRetentionService().run(days, batch_size, dry_run, max_batches)
+    
+    click.echo(
+        f"Carts{' (dry run)' if dry_run else ''}: {stats['expired']} expired, "
+        f"{stats['archived']} archived, {stats['deleted']} deleted "
+        f"({stats['items_deleted']} items) in {stats['batches']} batches, "
+        f"{stats['seconds']}s, {stats['carts_per_second']} carts/s"
+    )
+
+
+@jobs_cli.command('rebuild-user-stats')
+@click.option('--batch-size', default=500, show_default=True, help='Users recomputed per commit')
+def rebuild_user_stats(batch_size):
+    """Recompute every user's order and wishlist counters from the source tables"""
+    from app.extensions import db
+    from app.models import User, UserStats
+    from app.models.user_stats import compute_user_stats
+    
+    rebuilt = 0
+    last_id = None
+    while True:
+        query = db.session.query(User.id)
+        if last_id is not None:
+            query = query.filter(User.id > last_id)
+        user_ids = [row.id for row in query.order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            break
+        
+        connection = db.session.connection()
+        db.session.query(UserStats).filter(UserStats.user_id.in_(user_ids)).delete(synchronize_session=False)
+        connection.execute(
+            UserStats.__table__.insert(),
+            [compute_user_stats(connection, user_id) for user_id in user_ids]
+        )
+        db.session.commit()
+        rebuilt += len(user_ids)
+        last_id = user_ids[-1]
+    
+    click.echo(f"User stats: {rebuilt} users rebuilt")
+
+
+def register_commands(app):
+    """Register CLI command groups with the Flask app"""
+    app.cli.add_command(jobs_cli)
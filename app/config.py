@@ -50,6 +50,9 @@ class Config:
     CELERY_ACCEPT_CONTENT = ['json']
     CELERY_TIMEZONE = 'UTC'
     CELERY_ENABLE_UTC = True
+    CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'false').lower() in ['true', 'on', '1']
+    CELERY_TASK_EAGER_PROPAGATES = False
+    CELERY_BROKER_CONNECTION_TIMEOUT = 1  # seconds a publish waits for the broker before tasks run inline
     
     # File Upload Configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -74,6 +77,24 @@ class Config:
     CACHE_REDIS_URL = REDIS_URL
     CACHE_DEFAULT_TIMEOUT = 300  # 5 minutes
     
+    # Response cache for public catalog endpoints (L1 in-process, L2 Flask-Caching)
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RESPONSE_CACHE_TIMEOUT = 60  # seconds an entry lives in L2
+    RESPONSE_CACHE_L1_SIZE = 1024  # entries kept per process
+    RESPONSE_CACHE_L1_TTL = 30  # seconds an entry lives in L1
+    RESPONSE_CACHE_TAG_TTL = 2  # seconds before re-reading tag versions from L2
+    RESPONSE_CACHE_LOCK_TIMEOUT = 5  # seconds to wait on another process filling a miss
+    
+    # Idempotency-Key handling for checkout
+    IDEMPOTENCY_TTL = 86400  # seconds a completed response can be replayed
+    IDEMPOTENCY_LOCK_TIMEOUT = 30  # seconds an in-flight claim lives if its request dies
+    IDEMPOTENCY_WAIT_TIMEOUT = 10  # seconds a duplicate waits on the in-flight request
+    IDEMPOTENCY_POLL_INTERVAL = 0.05  # seconds between checks while waiting
+    
+    # Invoices
+    INVOICE_CACHE_TTL = 604800  # seconds a rendered invoice of a closed order is kept
+    INVOICE_EXPORT_BATCH_SIZE = 500  # orders read and rendered per batch in bulk exports
+    
     # Rate Limiting Configuration
     RATELIMIT_STORAGE_URL = REDIS_URL
     RATELIMIT_HEADERS_ENABLED = True
@@ -88,12 +109,51 @@ class Config:
     
     # Business Configuration
     DEFAULT_CURRENCY = os.environ.get('DEFAULT_CURRENCY') or 'USD'
-    TAX_RATE = float(os.environ.get('TAX_RATE') or 0.0)
-    SHIPPING_RATE = float(os.environ.get('SHIPPING_RATE') or 0.0)
+    TAX_RATE = float(os.environ.get('TAX_RATE') or 0.08)  # used where no tax_rates row matches
+    SHIPPING_RATE = float(os.environ.get('SHIPPING_RATE') or 9.99)  # standard shipping without shipping_rates rows
+    FREE_SHIPPING_THRESHOLD = float(os.environ.get('FREE_SHIPPING_THRESHOLD') or 50.0)  # subtotal for free standard shipping
+    RATES_CHECK_INTERVAL = 5  # seconds between tax/shipping table version checks
+    ORDER_WORKER_ID = os.environ.get('ORDER_WORKER_ID')  # 0-1023, unique per process; unset = lease from Redis
+    ORDER_WORKER_LEASE_TTL = 60  # seconds a leased worker id survives without a heartbeat
+    PROMOTIONS_CHECK_INTERVAL = 5  # seconds between discount rule version checks
+    COUPON_RESERVATION_TTL = 900  # seconds a cart holds a coupon use before checkout
+    COUPON_RECONCILE_BATCH = 500  # coupons updated per commit by the reconcile job
+    CART_TOTALS_TTL = 600  # seconds computed totals are kept per cart version
+    CART_RETENTION_DAYS = 90  # days past expiry before closed carts are archived and deleted
+    CART_RETENTION_BATCH = 1000  # carts expired or deleted per transaction
+    CART_RETENTION_PAUSE = 0.0  # seconds to sleep between batches (lets replicas catch up)
+    WISHLIST_ALERT_BATCH = 1000  # wishlist rows per alert fan-out chunk
+    WISHLIST_ALERT_DEDUP_TTL = 86400  # seconds a user gets one alert per variant and kind
+    WISHLIST_ALERT_USER_LIMIT = 5  # wishlist alerts per user per window
+    WISHLIST_ALERT_USER_WINDOW = 86400  # seconds
+    INVENTORY_BULK_BATCH = 2000  # adjustment rows applied per transaction
+    INVENTORY_BULK_MAX_ERRORS = 1000  # row errors listed in a bulk adjustment response
     
     # Search Configuration
     SEARCH_RESULTS_PER_PAGE = 20
     SEARCH_MAX_RESULTS = 1000
+    SEARCH_INDEX_CHECK_INTERVAL = 5  # seconds between catalog version checks
+    SEARCH_INDEX_REBUILD_INTERVAL = 3600  # seconds between full index rebuilds
+    SEARCH_POPULARITY_DAYS = 90  # sales/views window used to rank suggestions
+    SEARCH_TRIGRAM_THRESHOLD = 0.5  # minimum word similarity for a text match
+    
+    # Related Products Configuration (offline co-purchase / co-view job)
+    RELATED_PRODUCTS_TOP_K = 20  # neighbors stored per product
+    RELATED_PRODUCTS_ORDER_DAYS = 365  # order history window
+    RELATED_PRODUCTS_VIEW_DAYS = 90  # product view window
+    RELATED_PRODUCTS_VIEW_WEIGHT = 0.3  # co-view weight relative to co-purchase
+    RELATED_PRODUCTS_MAX_BASKET = 50  # products per order/session considered
+    
+    # Recommendations Configuration (item-item collaborative filtering)
+    RECOMMENDATIONS_HISTORY_DAYS = 365  # interaction window used for training
+    RECOMMENDATIONS_NEIGHBORS = 30  # neighbors stored per item
+    RECOMMENDATIONS_BLOCK_SIZE = 1024  # items per similarity block (bounds memory)
+    RECOMMENDATIONS_MIN_SIMILARITY = 0.01  # drop weaker neighbors
+    RECOMMENDATIONS_MAX_WEIGHT = 10.0  # cap on one user's weight for one item
+    RECOMMENDATIONS_HISTORY_ITEMS = 50  # recent interactions used when serving
+    RECOMMENDATIONS_CACHE_SIZE = 20  # product cards cached per user
+    RECOMMENDATIONS_CACHE_FRESH = 300  # seconds before a refresh is triggered
+    RECOMMENDATIONS_CACHE_TTL = 3600  # seconds stale cards may still be served
 
 
 class DevelopmentConfig(Config):
@@ -124,6 +184,9 @@ class TestingConfig(Config):
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(minutes=5)
     
+    # Always read through to the database in tests
+    RESPONSE_CACHE_ENABLED = False
+    
     # Mock external services
     MAIL_SUPPRESS_SEND = True
     CELERY_TASK_ALWAYS_EAGER = True
@@ -7,7 +7,7 @@ from flask_migrate import Migrate
 from flask_caching import Cache
 import redis
 # from elasticsearch import Elasticsearch
-# from celery import Celery
+from celery import Celery, Task
 
 
 # Database
@@ -63,45 +63,55 @@ class RedisClient:
 #         return getattr(self._client, name)
 
 
-# class CeleryExtension:
-#     """Celery extension for Flask"""
-#     
-#     def __init__(self):
-#         self._celery = None
-#     
-#     def init_app(self, app):
-#         """Initialize Celery with Flask app"""
-#         self._celery = Celery(
-#             app.import_name,
-#             broker=app.config.get('CELERY_BROKER_URL'),
-#             backend=app.config.get('CELERY_RESULT_BACKEND')
-#         )
-#         
-#         # Update configuration
-#         self._celery.conf.update(
-#             task_serializer=app.config.get('CELERY_TASK_SERIALIZER', 'json'),
-#             result_serializer=app.config.get('CELERY_RESULT_SERIALIZER', 'json'),
-#             accept_content=app.config.get('CELERY_ACCEPT_CONTENT', ['json']),
-#             timezone=app.config.get('CELERY_TIMEZONE', 'UTC'),
-#             enable_utc=app.config.get('CELERY_ENABLE_UTC', True),
-#         )
-#         
-#         # Context task for Flask app context
-#         class ContextTask(self._celery.Task):
-#             def __call__(self, *args, **kwargs):
-#                 with app.app_context():
-#                     return self.run(*args, **kwargs)
-#         
-#         self._celery.Task = ContextTask
-#     
-#     def __getattr__(self, name):
-#         """Proxy attribute access to Celery instance"""
-#         if self._celery is None:
-#             raise RuntimeError("Celery not initialized. Call init_app() first.")
-#         return getattr(self._celery, name)
+class CeleryExtension:
+    """Celery extension for Flask
+    
+    The Celery app exists from import time so tasks can be declared with
+    ``celery.task``; init_app configures it from the Flask config and runs
+    every task inside an application context.
+    """
+    
+    def __init__(self):
+        self.flask_app = None
+        extension = self
+        
+        class ContextTask(Task):
+            def __call__(self, *args, **kwargs):
+                with extension.flask_app.app_context():
+                    return self.run(*args, **kwargs)
+        
+        self._celery = Celery(__name__, task_cls=ContextTask)
+    
+    def init_app(self, app):
+        """Initialize Celery with Flask app"""
+        self.flask_app = app
+        self._celery.main = app.import_name
+        self._celery.conf.update(
+            broker_url=app.config.get('CELERY_BROKER_URL'),
+            result_backend=app.config.get('CELERY_RESULT_BACKEND'),
+            task_serializer=app.config.get('CELERY_TASK_SERIALIZER', 'json'),
+            result_serializer=app.config.get('CELERY_RESULT_SERIALIZER', 'json'),
+            accept_content=app.config.get('CELERY_ACCEPT_CONTENT', ['json']),
+            timezone=app.config.get('CELERY_TIMEZONE', 'UTC'),
+            enable_utc=app.config.get('CELERY_ENABLE_UTC', True),
+            task_always_eager=app.config.get('CELERY_TASK_ALWAYS_EAGER', False),
+            task_eager_propagates=app.config.get('CELERY_TASK_EAGER_PROPAGATES', False),
+            task_acks_late=True,
+            broker_connection_timeout=app.config.get('CELERY_BROKER_CONNECTION_TIMEOUT', 4),
+        )
+        app.extensions['celery'] = self._celery
+    
+    @property
+    def app(self) -> Celery:
+        """The underlying Celery application"""
+        return self._celery
+    
+    def __getattr__(self, name):
+        """Proxy attribute access to Celery instance"""
+        return getattr(self._celery, name)
 
 
 # Initialize extension instances
 redis_client = RedisClient()
 # es_client = ElasticsearchClient()
-# celery = CeleryExtension() 
\ No newline at end of file
+celery = CeleryExtension() 
\ No newline at end of file
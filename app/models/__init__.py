@@ -2,21 +2,33 @@
 
 from .base import BaseModel
 from .user import User, Address, UserRole
-from .product import Category, Product, ProductVariant, ProductImage, Review
-from .cart import Cart, CartItem
-from .order import Order, OrderItem, OrderStatus
+from .product import (
+    Category, Product, ProductVariant, ProductImage, Review, ProductRelation, RelationType
+)
+from .cart import Cart, CartItem, CartArchive
+from .order import Order, OrderItem, OrderEvent, OrderStatus
 from .discount import Coupon, DiscountRule, CouponUsage
 from .analytics import UserEvent, ProductMetric, CartAbandonment
 from .wishlist import Wishlist
+from .user_stats import UserStats
+from .rates import TaxRate, ShippingRate
+from .inventory import InventoryLedger
+from .serialization import compile_serializers
+
+# Compile column serializers once at import time
+compile_serializers(BaseModel)
 
 # Export all models for easy importing
 __all__ = [
     'BaseModel',
     'User', 'Address', 'UserRole',
     'Category', 'Product', 'ProductVariant', 'ProductImage', 'Review',
-    'Cart', 'CartItem',
-    'Order', 'OrderItem', 'OrderStatus',
+    'ProductRelation', 'RelationType',
+    'Cart', 'CartItem', 'CartArchive',
+    'Order', 'OrderItem', 'OrderEvent', 'OrderStatus',
     'Coupon', 'DiscountRule', 'CouponUsage',
     'UserEvent', 'ProductMetric', 'CartAbandonment',
-    'Wishlist'
+    'Wishlist', 'UserStats',
+    'TaxRate', 'ShippingRate',
+    'InventoryLedger'
 ] 
\ No newline at end of file
@@ -36,7 +36,17 @@ class UserEvent(BaseModel):
         Index('idx_user_event_type', 'event_type'),
         Index('idx_user_event_timestamp', 'timestamp'),
         Index('idx_user_event_session', 'session_id'),
+        # Product views by product, for the related products and recommendation jobs
+        Index(
+            'idx_user_event_viewed_product', properties['product_id'].as_string(),
+            postgresql_where=event_type == 'product_view'
+        ),
     )
+
+    @classmethod
+    def viewed_product_id(cls):
+        """properties.product_id as text; matches idx_user_event_viewed_product"""
+        return cls.properties['product_id'].as_string()
     
     @staticmethod
     def create_event(event_type: str, event_name: str, user_id=None, session_id=None, properties=None):
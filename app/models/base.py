@@ -1,11 +1,12 @@
 """Base model with common fields and functionality"""
 
 import uuid
-from datetime import datetime
 from sqlalchemy import Column, DateTime, String, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 
+from .serialization import get_serializer
+
 Base = declarative_base()
 
 
@@ -19,21 +20,16 @@ class BaseModel(Base):
     
     def to_dict(self, exclude_fields=None):
         """Convert model instance to dictionary"""
-        if exclude_fields is None:
-            exclude_fields = []
+        return get_serializer(type(self), exclude_fields).serialize(self)
+    
+    @classmethod
+    def to_dict_many(cls, instances, exclude_fields=None, for_encoder=False):
+        """Convert a list of instances to dictionaries in one pass
         
-        result = {}
-        for column in self.__table__.columns:
-            if column.name not in exclude_fields:
-                value = getattr(self, column.name)
-                # Handle datetime objects
-                if isinstance(value, datetime):
-                    value = value.isoformat()
-                # Handle UUID objects
-                elif isinstance(value, uuid.UUID):
-                    value = str(value)
-                result[column.name] = value
-        return result
+        With for_encoder=True datetime and UUID values are left for
+        serialization.dumps to encode natively.
+        """
+        return get_serializer(cls, exclude_fields).serialize_many(instances, for_encoder)
     
     def update_from_dict(self, data, exclude_fields=None):
         """Update model instance from dictionary"""
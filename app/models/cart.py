@@ -3,8 +3,8 @@
 import enum
 from datetime import datetime, timedelta
 from decimal import Decimal
-from sqlalchemy import Column, String, Integer, Numeric, ForeignKey, DateTime, Boolean, Index
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, Numeric, ForeignKey, DateTime, Boolean, Index, event, inspect, update
+from sqlalchemy.dialects.postgresql import UUID, JSON
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
@@ -16,6 +16,7 @@ class CartStatus(enum.Enum):
     ABANDONED = "abandoned"
     CONVERTED = "converted"
     EXPIRED = "expired"
+    MERGED = "merged"
 
 
 class Cart(BaseModel):
@@ -32,6 +33,12 @@ class Cart(BaseModel):
     # Expiration
     expires_at = Column(DateTime(timezone=True), nullable=True)
     
+    # Applied coupon and other checkout state
+    cart_metadata = Column(JSON, default=dict, nullable=True)
+    
+    # Bumped whenever lines or the coupon change (see the listeners below)
+    version = Column(Integer, default=1, server_default='1', nullable=False)
+    
     # Relationships
     user = relationship("User", back_populates="cart")
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan")
@@ -121,6 +128,14 @@ class Cart(BaseModel):
         """Mark cart as abandoned"""
         self.status = CartStatus.ABANDONED.value
     
+    def bump_version(self):
+        """Count a change made outside the ORM (e.g. a bulk line insert)"""
+        self.version = Cart.version + 1
+    
+    def mark_merged(self):
+        """Mark a guest cart as merged into a user's cart"""
+        self.status = CartStatus.MERGED.value
+    
     def mark_converted(self):
         """Mark cart as converted to order"""
         self.status = CartStatus.CONVERTED.value
@@ -226,4 +241,63 @@ class CartItem(BaseModel):
         data['total'] = float(self.get_total())
         data['savings'] = float(self.get_savings())
         
-        return data 
\ No newline at end of file
+        return data
+
+
+@event.listens_for(Cart, 'before_update')
+def _cart_updated(mapper, connection, target):
+    # The coupon lives in cart_metadata and changes the totals
+    if inspect(target).attrs.cart_metadata.history.has_changes():
+        target.version = Cart.version + 1
+
+
+def _bump_cart_version(connection, cart_id):
+    carts = Cart.__table__
+    connection.execute(update(carts).where(carts.c.id == cart_id).values(version=carts.c.version + 1))
+
+
+@event.listens_for(CartItem, 'after_insert')
+@event.listens_for(CartItem, 'after_delete')
+def _cart_item_added_or_removed(mapper, connection, target):
+    _bump_cart_version(connection, target.cart_id)
+
+
+@event.listens_for(CartItem, 'after_update')
+def _cart_item_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.quantity.history.has_changes() or state.attrs.price.history.has_changes():
+        _bump_cart_version(connection, target.cart_id)
+
+
+class CartArchive(BaseModel):
+    """Compact record of a cart removed by the retention job
+    
+    One row per deleted cart with its lines folded into a JSON list of
+    [variant_id, quantity, price], kept for abandonment and conversion
+    analytics after carts and cart_items are purged.
+    """
+    __tablename__ = 'cart_archives'
+    
+    cart_id = Column(UUID(as_uuid=True), nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=True)
+    session_id = Column(String(255), nullable=True)
+    status = Column(String(20), nullable=False)
+    
+    # Cart contents at deletion
+    item_count = Column(Integer, default=0, nullable=False)
+    total_quantity = Column(Integer, default=0, nullable=False)
+    subtotal = Column(Numeric(12, 2), default=0, nullable=False)
+    items = Column(JSON, default=list, nullable=False)
+    cart_metadata = Column(JSON, nullable=True)
+    
+    # Original cart timestamps
+    cart_created_at = Column(DateTime(timezone=True), nullable=True)
+    cart_updated_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Database Indexes
+    __table_args__ = (
+        Index('idx_cart_archive_cart', 'cart_id'),
+        Index('idx_cart_archive_user', 'user_id'),
+        Index('idx_cart_archive_created', 'created_at'),
+    )
@@ -5,10 +5,10 @@ from datetime import datetime
 from decimal import Decimal
 from sqlalchemy import (
     Column, String, Numeric, Integer, Boolean, ForeignKey, 
-    DateTime, Text, Index, CheckConstraint
+    DateTime, Text, Index, CheckConstraint, func
 )
 from sqlalchemy.dialects.postgresql import UUID, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session
 
 from .base import BaseModel
 
@@ -50,6 +50,7 @@ class Coupon(BaseModel):
     
     # Usage Tracking
     usage_count = Column(Integer, default=0, nullable=False)
+    reconcile_batch = Column(String(32), nullable=True)  # last reconcile batch added to usage_count
     
     # Validity Period
     valid_from = Column(DateTime(timezone=True), nullable=True)
@@ -99,7 +100,7 @@ class Coupon(BaseModel):
         
         # Check per-user usage limit
         if user_id and self.usage_limit_per_user:
-            user_usage_count = len([u for u in self.usages if u.user_id == user_id])
+            user_usage_count = self.get_user_usage_count(user_id)
             if user_usage_count >= self.usage_limit_per_user:
                 errors.append("You have already used this coupon the maximum number of times")
         
@@ -108,6 +109,16 @@ class Coupon(BaseModel):
             "errors": errors
         }
     
+    def get_user_usage_count(self, user_id: UUID) -> int:
+        """Count a user's redemptions with one indexed COUNT query"""
+        session = object_session(self)
+        if session is None:
+            return 0
+        return session.query(func.count(CouponUsage.id)).filter(
+            CouponUsage.coupon_id == self.id,
+            CouponUsage.user_id == user_id
+        ).scalar() or 0
+    
     def calculate_discount(self, cart_total: Decimal, items: list = None) -> Decimal:
         """Calculate discount amount for given cart total"""
         if self.discount_type == DiscountType.PERCENTAGE.value:
@@ -131,8 +142,8 @@ class Coupon(BaseModel):
         return discount
     
     def increment_usage(self):
-        """Increment usage count"""
-        self.usage_count += 1
+        """Increment usage count in SQL so concurrent increments aren't lost"""
+        self.usage_count = Coupon.usage_count + 1
     
     def get_status(self) -> str:
         """Get current coupon status"""
@@ -176,6 +187,7 @@ class DiscountRule(BaseModel):
     
     # Usage Tracking
     usage_count = Column(Integer, default=0, nullable=False)
+    reconcile_batch = Column(String(32), nullable=True)  # last reconcile batch added to usage_count
     usage_limit = Column(Integer, nullable=True)
     
     # Database Indexes
@@ -276,5 +288,6 @@ class CouponUsage(BaseModel):
     __table_args__ = (
         Index('idx_coupon_usage_coupon', 'coupon_id'),
         Index('idx_coupon_usage_user', 'user_id'),
+        Index('idx_coupon_usage_coupon_user', 'coupon_id', 'user_id'),
         Index('idx_coupon_usage_order', 'order_id'),
     ) 
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""Coordination-free unique IDs for business numbers (order numbers)"""
+
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 2024-01-01T00:00:00Z; 41 bits of milliseconds last until 2093
+EPOCH_MS = 1704067200000
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+WORKER_COUNTER_KEY = 'ids:worker_counter'
+WORKER_LEASE_KEY = 'ids:worker:{}'
+DEFAULT_LEASE_TTL = 60  # seconds
+
+# Touch or drop a lease only while this process still holds it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Crockford base32: no I, L, O, U; ascending, so fixed-width strings sort like the ids
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ENCODED_LENGTH = 13  # ceil(63 / 5)
+DAY_MS = 86400000
+
+
+def encode(value: int) -> str:
+    """Fixed-width Crockford base32 of a 63-bit id"""
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, remainder = divmod(value, 32)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+class SnowflakeGenerator:
+    """Snowflake ids: 41 bits of milliseconds, 10 bits of worker, 12 bits of sequence
+
+    Each process needs its own worker id. It comes from ORDER_WORKER_ID when
+    set (give every process its own value, e.g. from the pod ordinal and
+    the gunicorn worker index); otherwise one is leased from Redis the
+    first time an id is needed, and again in a forked child. A lease is an
+    ids:worker:<n> key taken with SET NX EX; a daemon thread renews it
+    every third of ORDER_WORKER_LEASE_TTL and it is deleted at exit, so
+    ids of dead processes come back and two live processes never hold the
+    same one. If a renewal finds the lease gone, the next id leases a
+    fresh worker id. Generating an id never touches the database or the
+    network.
+
+    Up to 4096 ids per millisecond per worker. Past that, and when the wall
+    clock steps backwards, the generator keeps counting on its own logical
+    clock so ids stay unique and increasing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured_worker_id: Optional[int] = None
+        self._worker_id: Optional[int] = None
+        self._last_ms = -1
+        self._sequence = 0
+        self._day = (0, '')
+        self._lease_ttl = DEFAULT_LEASE_TTL
+        self._lease: Optional[tuple] = None  # (worker id, token) while holding a Redis lease
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.release)
+
+    def init_app(self, app):
+        worker_id = app.config.get('ORDER_WORKER_ID')
+        if worker_id in (None, ''):
+            self._configured_worker_id = None
+        else:
+            worker_id = int(worker_id)
+            if not 0 <= worker_id <= MAX_WORKER_ID:
+                raise ValueError(f'ORDER_WORKER_ID must be between 0 and {MAX_WORKER_ID}')
+            self._configured_worker_id = worker_id
+        self._lease_ttl = int(app.config.get('ORDER_WORKER_LEASE_TTL') or DEFAULT_LEASE_TTL)
+        self._worker_id = self._configured_worker_id
+
+    @property
+    def worker_id(self) -> int:
+        if self._worker_id is None:
+            with self._lock:
+                if self._worker_id is None:
+                    self._worker_id = self._lease_worker_id()
+        return self._worker_id
+
+    def next_id(self) -> int:
+        """Next unique, time-ordered 63-bit id"""
+        worker_id = self.worker_id
+        with self._lock:
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Borrow the next millisecond instead of sleeping
+                    self._last_ms += 1
+                    self._sequence = 0
+            return (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (worker_id << SEQUENCE_BITS) | self._sequence
+
+    def next_order_number(self) -> str:
+        """Order number like ORD-20260101-0B7Y3N4Q40001"""
+        value = self.next_id()
+        created_ms = (value >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS
+        day_start, day = self._day
+        if not day_start <= created_ms < day_start + DAY_MS:
+            day_start = created_ms - created_ms % DAY_MS
+            day = datetime.fromtimestamp(day_start / 1000, tz=timezone.utc).strftime('%Y%m%d')
+            self._day = (day_start, day)
+        return f"ORD-{day}-{encode(value)}"
+
+    def _after_fork(self):
+        # A forked child must not share the parent's leased worker id
+        self._lock = threading.Lock()
+        self._worker_id = self._configured_worker_id
+        self._lease = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def release(self):
+        """Give a leased worker id back to Redis"""
+        lease, self._lease = self._lease, None
+        if lease is None:
+            return
+        try:
+            from app.extensions import redis_client
+            redis_client.register_script(RELEASE_SCRIPT)(keys=[WORKER_LEASE_KEY.format(lease[0])], args=[lease[1]])
+        except Exception:
+            pass
+
+    def _lease_worker_id(self) -> int:
+        try:
+            from app.extensions import redis_client
+            token = uuid.uuid4().hex
+            # The counter only spreads the starting point; the NX keys decide who holds an id
+            start = redis_client.incr(WORKER_COUNTER_KEY) - 1
+            for offset in range(MAX_WORKER_ID + 1):
+                worker_id = (start + offset) & MAX_WORKER_ID
+                if redis_client.set(WORKER_LEASE_KEY.format(worker_id), token, nx=True, ex=self._lease_ttl):
+                    self._lease = (worker_id, token)
+                    threading.Thread(target=self._heartbeat, args=(self._lease,), daemon=True).start()
+                    return worker_id
+            logger.error("All %s id workers are leased", MAX_WORKER_ID + 1)
+        except Exception:
+            logger.exception("Could not lease an id worker from Redis")
+        worker_id = random.SystemRandom().randint(0, MAX_WORKER_ID)
+        logger.warning("Using random id worker %s; set ORDER_WORKER_ID to avoid collisions.", worker_id)
+        return worker_id
+
+    def _heartbeat(self, lease: tuple):
+        """Renew the lease until it is released, replaced or lost"""
+        from app.extensions import redis_client
+        worker_id, token = lease
+        while True:
+            time.sleep(max(self._lease_ttl / 3, 0.1))
+            if self._lease != lease:
+                return
+            try:
+                renewed = redis_client.register_script(RENEW_SCRIPT)(
+                    keys=[WORKER_LEASE_KEY.format(worker_id)], args=[token, self._lease_ttl]
+                )
+            except Exception:
+                logger.warning("Could not renew id worker %s lease; retrying", worker_id)
+                continue
+            if not renewed:
+                with self._lock:
+                    if self._lease == lease:
+                        logger.warning("Lost the id worker %s lease; leasing a new worker id", worker_id)
+                        self._lease = None
+                        self._worker_id = None
+                return
+
+
+order_numbers = SnowflakeGenerator()
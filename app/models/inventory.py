@@ -0,0 +1,33 @@
+"""Inventory audit ledger"""
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
+from sqlalchemy.dialects.postgresql import UUID
+
+from .base import BaseModel
+
+
+class InventoryLedger(BaseModel):
+    """One stock change made through the inventory endpoints
+
+    Append-only: rows are written with the stock update they record and
+    never changed. sku is copied so entries stay readable if the variant
+    is deleted.
+    """
+    __tablename__ = 'inventory_ledger'
+
+    variant_id = Column(UUID(as_uuid=True), ForeignKey('product_variants.id', ondelete='SET NULL'), nullable=True)
+    sku = Column(String(100), nullable=False)
+    delta = Column(Integer, nullable=False)
+    previous_stock = Column(Integer, nullable=False)
+    new_stock = Column(Integer, nullable=False)
+    reason = Column(String(255), nullable=True)
+    source = Column(String(20), nullable=False)  # adjust, bulk
+    batch_id = Column(UUID(as_uuid=True), nullable=True)  # Groups the rows of one bulk upload
+    actor_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+
+    # Database Indexes
+    __table_args__ = (
+        Index('idx_inventory_ledger_variant', 'variant_id', 'created_at'),
+        Index('idx_inventory_ledger_batch', 'batch_id'),
+        Index('idx_inventory_ledger_created', 'created_at'),
+    )
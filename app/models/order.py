@@ -11,6 +11,8 @@ from sqlalchemy.dialects.postgresql import UUID, JSON
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
+from .ids import order_numbers
+from .serialization import get_serializer
 
 
 class OrderStatus(enum.Enum):
@@ -76,10 +78,14 @@ class Order(BaseModel):
     # Relationships
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    # Append-only; write_only so recording an event never loads the history
+    events = relationship("OrderEvent", back_populates="order", cascade="all, delete-orphan",
+                          passive_deletes=True, lazy="write_only")
     
     # Database Indexes
     __table_args__ = (
         Index('idx_order_user_status', 'user_id', 'status'),
+        Index('idx_order_user_created', 'user_id', 'created_at'),
         Index('idx_order_status', 'status'),
         Index('idx_order_number', 'order_number'),
         Index('idx_order_created', 'created_at'),
@@ -95,24 +101,23 @@ class Order(BaseModel):
     @staticmethod
     def generate_order_number() -> str:
         """Generate unique order number"""
-        from datetime import datetime
-        import random
-        timestamp = datetime.now().strftime('%Y%m%d')
-        random_part = str(random.randint(1000, 9999))
-        return f"ORD-{timestamp}-{random_part}"
+        return order_numbers.next_order_number()
     
     def calculate_totals(self):
         """Calculate order totals from items"""
+        from app.services.rate_engine import rate_engine
+        
         self.subtotal = sum(item.total for item in self.items)
-        # Tax calculation can be customized based on business rules
-        tax_rate = Decimal('0.08')  # 8% tax rate example
-        self.tax_amount = self.subtotal * tax_rate
+        discount = self.discount_amount or Decimal('0.00')
         
-        # Shipping calculation can be customized
-        if self.subtotal > 50:  # Free shipping over $50
-            self.shipping_amount = Decimal('0.00')
-        else:
-            self.shipping_amount = Decimal('9.99')
+        # Same rate tables as the cart, for the shipping address snapshot
+        self.tax_amount = rate_engine.tax(self.subtotal - discount, self.shipping_address)
+        shipping = rate_engine.shipping(
+            self.shipping_address, self.subtotal, self.get_weight(),
+            (self.order_metadata or {}).get('shipping_method')
+        )
+        if shipping is not None:
+            self.shipping_amount = shipping
         
         self.total = self.subtotal + self.tax_amount + self.shipping_amount - self.discount_amount
     
@@ -127,31 +132,46 @@ class Order(BaseModel):
             OrderStatus.SHIPPED.value
         ] and self.payment_status == PaymentStatus.CAPTURED.value
     
-    def mark_as_shipped(self, carrier: str = None, tracking_number: str = None):
+    def record_event(self, event_type: str, actor_id=None, from_status: str = None, **details):
+        """Append an entry to the order's event log"""
+        self.events.add(OrderEvent(
+            event_type=event_type,
+            from_status=from_status,
+            to_status=self.status,
+            actor_id=actor_id,
+            details=details,
+            occurred_at=datetime.utcnow()
+        ))
+    
+    def transition_to(self, status: str, actor_id=None, **details):
+        """Change the order status and log the transition"""
+        from_status = self.status
+        self.status = status
+        self.record_event(status, actor_id=actor_id, from_status=from_status, **details)
+    
+    def mark_as_shipped(self, carrier: str = None, tracking_number: str = None, actor_id=None):
         """Mark order as shipped"""
-        self.status = OrderStatus.SHIPPED.value
         self.shipped_at = datetime.utcnow()
         if carrier:
             self.shipping_carrier = carrier
         if tracking_number:
             self.tracking_number = tracking_number
+        self.transition_to(
+            OrderStatus.SHIPPED.value, actor_id=actor_id,
+            carrier=self.shipping_carrier, tracking_number=self.tracking_number
+        )
     
-    def mark_as_delivered(self):
+    def mark_as_delivered(self, actor_id=None):
         """Mark order as delivered"""
-        self.status = OrderStatus.DELIVERED.value
         self.delivered_at = datetime.utcnow()
+        self.transition_to(OrderStatus.DELIVERED.value, actor_id=actor_id)
     
-    def cancel_order(self, reason: str = None):
+    def cancel_order(self, reason: str = None, actor_id=None):
         """Cancel the order"""
         if not self.can_be_cancelled():
             raise ValueError("Order cannot be cancelled in current status")
         
-        self.status = OrderStatus.CANCELLED.value
-        if reason:
-            if not self.order_metadata:
-                self.order_metadata = {}
-            self.order_metadata['cancellation_reason'] = reason
-            self.order_metadata['cancelled_at'] = datetime.utcnow().isoformat()
+        self.transition_to(OrderStatus.CANCELLED.value, actor_id=actor_id, reason=reason)
     
     def get_item_count(self) -> int:
         """Get total number of items in order"""
@@ -165,18 +185,19 @@ class Order(BaseModel):
                 total_weight += item.variant.product.weight * item.quantity
         return total_weight
     
-    def to_dict(self):
+    def to_dict(self, for_encoder=False):
         """Convert order to dictionary with complete details"""
-        data = super().to_dict()
+        data = get_serializer(Order).serialize(self, for_encoder)
+        items = self.items
         
         # Add computed fields
-        data['item_count'] = self.get_item_count()
+        data['item_count'] = sum(item.quantity for item in items)
         data['weight'] = float(self.get_weight())
         data['can_cancel'] = self.can_be_cancelled()
         data['can_refund'] = self.can_be_refunded()
         
         # Include order items
-        data['items'] = [item.to_dict() for item in self.items]
+        data['items'] = OrderItem.to_dict_many(items, for_encoder=for_encoder)
         
         return data
 
@@ -245,21 +266,62 @@ class OrderItem(BaseModel):
         item_subtotal = self.price * self.quantity
         return (self.discount_amount / item_subtotal) * 100 if item_subtotal > 0 else 0.0
     
-    def to_dict(self):
+    def to_dict(self, for_encoder=False):
         """Convert order item to dictionary"""
-        data = super().to_dict()
-        
-        # Add computed fields
-        data['subtotal'] = float(self.price * self.quantity)
+        data = get_serializer(OrderItem).serialize(self, for_encoder)
+        return self._add_computed_fields(data)
+    
+    @classmethod
+    def to_dict_many(cls, instances, exclude_fields=None, for_encoder=False):
+        """Convert a list of order items to dictionaries in one pass"""
+        instances = list(instances)
+        rows = get_serializer(cls, exclude_fields).serialize_many(instances, for_encoder)
+        for item, data in zip(instances, rows):
+            item._add_computed_fields(data)
+        return rows
+    
+    def _add_computed_fields(self, data):
+        """Add computed and current variant fields to serialized item data"""
+        price = self.price
+        quantity = self.quantity
+        data['subtotal'] = float(price * quantity)
         data['discount_percentage'] = self.get_discount_percentage()
         
         # Add current variant information if still available
-        if self.variant:
+        variant = self.variant
+        if variant:
             data['current_variant'] = {
-                'id': str(self.variant.id),
-                'current_price': float(self.variant.price),
-                'stock': self.variant.stock,
-                'is_active': self.variant.is_active
+                'id': data['variant_id'] if 'variant_id' in data else str(variant.id),
+                'current_price': float(variant.price),
+                'stock': variant.stock,
+                'is_active': variant.is_active
             }
         
-        return data 
\ No newline at end of file
+        return data
+
+
+class OrderEvent(BaseModel):
+    """Append-only log of order status transitions
+    
+    One row per transition (placed, confirmed, shipped, cancelled, ...), so
+    an order's timeline is one indexed range read and stage-to-stage
+    latencies can be aggregated across orders.
+    """
+    __tablename__ = 'order_events'
+    
+    order_id = Column(UUID(as_uuid=True), ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    event_type = Column(String(30), nullable=False)  # 'placed' or the status entered
+    from_status = Column(String(20), nullable=True)
+    to_status = Column(String(20), nullable=False)
+    actor_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)  # Null for system events
+    details = Column(JSON, default=dict, nullable=False)
+    occurred_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    order = relationship("Order", back_populates="events")
+    
+    # Database Indexes
+    __table_args__ = (
+        Index('idx_order_event_order_time', 'order_id', 'occurred_at'),
+        Index('idx_order_event_type_time', 'event_type', 'occurred_at'),
+    )
@@ -1,10 +1,11 @@
 """Product models for catalog management"""
 
 import enum
+import unicodedata
 from decimal import Decimal
 from sqlalchemy import (
-    Column, String, Text, Boolean, Integer, Numeric, ForeignKey, 
-    Index, CheckConstraint, func
+    Column, String, Text, Boolean, Integer, Numeric, Float, ForeignKey, 
+    Index, CheckConstraint, DDL, event, func
 )
 from sqlalchemy.dialects.postgresql import UUID, JSON
 from sqlalchemy.orm import relationship
@@ -62,9 +63,26 @@ class Category(BaseModel):
         return children
 
 
+def fold_text(text) -> str:
+    """Lowercase and strip accents so "Niños" and "ninos" compare equal"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def build_search_text(name, brand=None, tags=None) -> str:
+    """Accent-folded name, brand and tags used by trigram search"""
+    parts = [name, brand]
+    if isinstance(tags, (list, tuple)):
+        parts.extend(str(tag) for tag in tags)
+    return fold_text(' '.join(part for part in parts if part))
+
+
 class Product(BaseModel):
     """Product model with basic information"""
     __tablename__ = 'products'
+    __serialize_exclude__ = ('search_text',)
     
     # Basic Information
     sku = Column(String(100), unique=True, nullable=False, index=True)
@@ -77,6 +95,7 @@ class Product(BaseModel):
     category_id = Column(UUID(as_uuid=True), ForeignKey('categories.id'), nullable=True)
     brand = Column(String(100), nullable=True, index=True)
     tags = Column(JSON, default=list, nullable=False)
+    search_text = Column(Text, nullable=True)  # maintained from name/brand/tags on save
     
     # Status
     is_active = Column(Boolean, default=True, nullable=False)
@@ -103,6 +122,11 @@ class Product(BaseModel):
         Index('idx_product_featured', 'is_featured'),
         # Note: PostgreSQL text search index commented out for SQLite compatibility
         # Index('idx_product_name_search', func.to_tsvector('english', name)),
+        # Trigram index for typo-tolerant search (SQLite dev uses an in-process index)
+        Index(
+            'idx_product_search_trgm', 'search_text',
+            postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
     )
     
     def get_price_range(self) -> dict:
@@ -148,6 +172,18 @@ class Product(BaseModel):
         return len([r for r in self.reviews if r.rating is not None])
 
 
+@event.listens_for(Product, 'before_insert')
+@event.listens_for(Product, 'before_update')
+def _update_search_text(mapper, connection, target):
+    target.search_text = build_search_text(target.name, target.brand, target.tags)
+
+
+event.listen(
+    Product.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
 class ProductVariant(BaseModel):
     """Product variant with pricing and inventory"""
     __tablename__ = 'product_variants'
@@ -277,4 +313,27 @@ class Review(BaseModel):
     
     def mark_helpful(self):
         """Increment helpful count"""
-        self.helpful_count += 1 
\ No newline at end of file
+        self.helpful_count += 1 
+
+class RelationType(enum.Enum):
+    """Product relation type enumeration"""
+    RELATED = "related"  # Co-purchase / co-view neighbors
+    SIMILAR = "similar"  # Collaborative filtering neighbors
+
+
+class ProductRelation(BaseModel):
+    """Precomputed top-K neighbors of a product, rebuilt by offline jobs"""
+    __tablename__ = 'product_relations'
+    
+    product_id = Column(UUID(as_uuid=True), ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    related_product_id = Column(UUID(as_uuid=True), ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    relation_type = Column(String(20), default=RelationType.RELATED.value, nullable=False)
+    
+    # Ranking
+    score = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=False)  # 0 = strongest neighbor
+    
+    # Database Indexes
+    __table_args__ = (
+        Index('idx_relation_lookup', 'product_id', 'relation_type', 'rank', unique=True),
+    )
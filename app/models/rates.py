@@ -0,0 +1,52 @@
+"""Tax and shipping rate tables"""
+
+from sqlalchemy import Boolean, Column, Index, Integer, Numeric, String, Text
+
+from .base import BaseModel
+
+
+class TaxRate(BaseModel):
+    """Sales tax rate for a region
+
+    A row applies to a country, optionally narrowed to a state and to
+    postal codes starting with postal_prefix. The most specific matching
+    row wins; rate is the combined rate for that region.
+    """
+    __tablename__ = 'tax_rates'
+
+    name = Column(String(255), nullable=True)
+    country = Column(String(2), nullable=False)  # ISO 3166-1 alpha-2
+    state = Column(String(100), nullable=True)  # None = whole country
+    postal_prefix = Column(String(20), nullable=True)  # None = whole state
+    rate = Column(Numeric(6, 4), nullable=False)  # 0.0825 = 8.25%
+    is_active = Column(Boolean, default=True, nullable=False)
+
+    # Database Indexes
+    __table_args__ = (
+        Index('idx_tax_rate_region', 'country', 'state', 'postal_prefix'),
+    )
+
+
+class ShippingRate(BaseModel):
+    """Price of a shipping method for one weight band
+
+    A method (standard, express, ...) has one row per band; max_weight is
+    the band's upper bound in kg (None = no limit). country None applies
+    everywhere without a country-specific row for that method.
+    """
+    __tablename__ = 'shipping_rates'
+
+    method = Column(String(50), nullable=False)
+    name = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    country = Column(String(2), nullable=True)
+    max_weight = Column(Numeric(10, 3), nullable=True)  # kg
+    price = Column(Numeric(10, 2), nullable=False)
+    free_over = Column(Numeric(10, 2), nullable=True)  # subtotal that ships free
+    sort_order = Column(Integer, default=0, nullable=False)
+    is_active = Column(Boolean, default=True, nullable=False)
+
+    # Database Indexes
+    __table_args__ = (
+        Index('idx_shipping_rate_method', 'country', 'method', 'max_weight'),
+    )
@@ -0,0 +1,148 @@
+"""Column-driven serializers compiled once per model class"""
+
+import enum
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, DateTime, Numeric, Time, Uuid
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional at runtime
+    orjson = None
+
+
+def _isoformat(value) -> str:
+    return value.isoformat()
+
+
+def _column_converter(column) -> Optional[Callable[[Any], Any]]:
+    """Pick the converter for a column type, or None when the value passes through"""
+    column_type = column.type
+    if isinstance(column_type, (DateTime, Date, Time)):
+        return _isoformat
+    if isinstance(column_type, Uuid):
+        return str
+    if isinstance(column_type, Numeric):
+        return float
+    return None
+
+
+class ModelSerializer:
+    """Precomputed column list and converters for one model class"""
+
+    def __init__(self, model_class, exclude_fields: FrozenSet[str] = frozenset()):
+        self.model_class = model_class
+
+        # Internal columns a model never exposes (e.g. derived search text)
+        exclude_fields = exclude_fields | frozenset(getattr(model_class, '__serialize_exclude__', ()))
+
+        names = []
+        converters = []
+        for column in model_class.__table__.columns:
+            if column.name in exclude_fields:
+                continue
+            names.append(column.name)
+            converter = _column_converter(column)
+            if converter is not None:
+                converters.append((column.name, converter))
+
+        self.names: Tuple[str, ...] = tuple(names)
+        self.converters: Tuple[Tuple[str, Callable], ...] = tuple(converters)
+        # dumps() encodes datetimes and UUIDs natively, so only the remaining
+        # converters are needed when the result goes straight to the encoder
+        self.encoder_converters: Tuple[Tuple[str, Callable], ...] = tuple(
+            (name, convert) for name, convert in converters if convert is float
+        )
+        self._attr_getter = attrgetter(*self.names)
+        self._state_getter = itemgetter(*self.names)
+        self._single = len(self.names) == 1
+
+    def _values(self, instance) -> tuple:
+        """Read column values from loaded state, falling back to attribute access"""
+        try:
+            values = self._state_getter(instance.__dict__)
+        except KeyError:
+            # Expired or deferred columns go through the ORM to load
+            values = self._attr_getter(instance)
+        return (values,) if self._single else values
+
+    def serialize(self, instance, for_encoder: bool = False) -> Dict[str, Any]:
+        """Serialize a single instance to a dictionary"""
+        data = dict(zip(self.names, self._values(instance)))
+        for name, convert in (self.encoder_converters if for_encoder else self.converters):
+            value = data[name]
+            if value is not None:
+                data[name] = convert(value)
+        return data
+
+    def serialize_many(self, instances: Iterable, for_encoder: bool = False) -> List[Dict[str, Any]]:
+        """Serialize a result list in one pass"""
+        names = self.names
+        converters = self.encoder_converters if for_encoder else self.converters
+        read_values = self._values
+
+        result = []
+        for instance in instances:
+            data = dict(zip(names, read_values(instance)))
+            for name, convert in converters:
+                value = data[name]
+                if value is not None:
+                    data[name] = convert(value)
+            result.append(data)
+        return result
+
+
+_serializers: Dict[Tuple[type, FrozenSet[str]], ModelSerializer] = {}
+
+
+def get_serializer(model_class, exclude_fields: Optional[Iterable[str]] = None) -> ModelSerializer:
+    """Get (or compile) the serializer for a model class and exclusion set"""
+    key = (model_class, frozenset(exclude_fields) if exclude_fields else frozenset())
+    serializer = _serializers.get(key)
+    if serializer is None:
+        serializer = ModelSerializer(model_class, key[1])
+        _serializers[key] = serializer
+    return serializer
+
+
+def compile_serializers(base_class):
+    """Compile serializers for every mapped subclass of base_class"""
+    pending = list(base_class.__subclasses__())
+    while pending:
+        model_class = pending.pop()
+        pending.extend(model_class.__subclasses__())
+        if getattr(model_class, '__table__', None) is not None:
+            get_serializer(model_class)
+
+
+def _default(value):
+    """Fallback encoder for types the JSON encoders don't handle natively"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        # orjson encodes enums by value; keep the stdlib fallback in step
+        return value.value
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    """Encode data straight to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Decode JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,180 @@
+"""Per-user aggregate counters kept in step with orders and wishlists"""
+
+from decimal import Decimal
+
+from sqlalchemy import Column, ForeignKey, Integer, Numeric, event, func, insert, inspect, select, update
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session
+
+from .base import BaseModel
+from .order import Order
+from .wishlist import Wishlist
+
+# Statuses counted by /users/me/stats
+COMPLETED_STATUSES = frozenset({'delivered', 'completed'})
+SPENT_STATUSES = frozenset({'delivered', 'completed', 'shipped'})
+
+
+class UserStats(BaseModel):
+    """Order and wishlist counters for one user
+
+    Updated in the same transaction as the order or wishlist write (see the
+    mapper listeners below), so reading a user's stats is a single primary
+    key lookup instead of several aggregate queries. A missing row is
+    computed from the source tables on first use.
+    """
+    __tablename__ = 'user_stats'
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), nullable=False, unique=True)
+    total_orders = Column(Integer, default=0, nullable=False)
+    completed_orders = Column(Integer, default=0, nullable=False)
+    total_spent = Column(Numeric(12, 2), default=0, nullable=False)
+    wishlist_items = Column(Integer, default=0, nullable=False)
+    last_order_id = Column(UUID(as_uuid=True), nullable=True)
+
+
+def compute_user_stats(connection, user_id) -> dict:
+    """Counters for user_id recomputed from orders and wishlists"""
+    orders = Order.__table__
+    wishlists = Wishlist.__table__
+
+    total_orders, completed_orders, total_spent = connection.execute(
+        select(
+            func.count(),
+            func.count().filter(orders.c.status.in_(COMPLETED_STATUSES)),
+            func.coalesce(func.sum(orders.c.total).filter(orders.c.status.in_(SPENT_STATUSES)), 0)
+        ).where(orders.c.user_id == user_id)
+    ).one()
+    wishlist_items = connection.execute(
+        select(func.count()).where(wishlists.c.user_id == user_id)
+    ).scalar()
+    last_order_id = connection.execute(
+        select(orders.c.id).where(orders.c.user_id == user_id)
+        .order_by(orders.c.created_at.desc()).limit(1)
+    ).scalar()
+
+    return {
+        'user_id': user_id,
+        'total_orders': total_orders,
+        'completed_orders': completed_orders,
+        'total_spent': total_spent,
+        'wishlist_items': wishlist_items,
+        'last_order_id': last_order_id,
+    }
+
+
+def _insert_ignoring_conflict(connection, values: dict) -> bool:
+    table = UserStats.__table__
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        connection.execute(insert(table).values(**values))
+        return True
+    result = connection.execute(
+        dialect_insert(table).values(**values).on_conflict_do_nothing(index_elements=['user_id'])
+    )
+    return result.rowcount == 1
+
+
+def ensure_user_stats(connection, user_id) -> None:
+    """Create the user's counters row from the source tables if it's missing"""
+    table = UserStats.__table__
+    exists = connection.execute(select(table.c.id).where(table.c.user_id == user_id)).first()
+    if exists is None:
+        _insert_ignoring_conflict(connection, compute_user_stats(connection, user_id))
+
+
+def apply_user_stats(connection, user_id, last_order_id=None, **deltas) -> None:
+    """Add deltas to a user's counters within the current transaction"""
+    if user_id is None:
+        return
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas and last_order_id is None:
+        return
+
+    table = UserStats.__table__
+    values = {name: table.c[name] + delta for name, delta in deltas.items()}
+    if last_order_id is not None:
+        values['last_order_id'] = last_order_id
+    statement = update(table).where(table.c.user_id == user_id).values(**values)
+
+    if connection.execute(statement).rowcount:
+        return
+    # No row yet: the recount already sees this transaction's write. ORM
+    # flushes create the row up front (_ensure_rows_before_flush), since a
+    # recount there could also see rows whose listeners haven't run yet.
+    if not _insert_ignoring_conflict(connection, compute_user_stats(connection, user_id)):
+        connection.execute(statement)
+
+
+def _status_counts(status, total) -> dict:
+    return {
+        'completed_orders': 1 if status in COMPLETED_STATUSES else 0,
+        'total_spent': Decimal(str(total or 0)) if status in SPENT_STATUSES else Decimal('0'),
+    }
+
+
+@event.listens_for(Session, 'before_flush')
+def _ensure_rows_before_flush(session, flush_context, instances):
+    """Create missing counter rows before the flush writes, so listeners only add deltas"""
+    user_ids = {
+        target.user_id
+        for target in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(target, (Order, Wishlist)) and target.user_id is not None
+    }
+    if user_ids:
+        connection = session.connection()
+        for user_id in user_ids:
+            ensure_user_stats(connection, user_id)
+
+
+@event.listens_for(Order, 'after_insert')
+def _order_inserted(mapper, connection, target):
+    counts = _status_counts(target.status, target.total)
+    apply_user_stats(connection, target.user_id, last_order_id=target.id, total_orders=1, **counts)
+
+
+# Load the previous value when these are set on an unloaded (e.g. expired
+# after commit) order, so _order_updated can take back the old counts
+@event.listens_for(Order.status, 'set', active_history=True)
+@event.listens_for(Order.total, 'set', active_history=True)
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+@event.listens_for(Order, 'after_update')
+def _order_updated(mapper, connection, target):
+    state = inspect(target)
+    status_history = state.attrs.status.history
+    total_history = state.attrs.total.history
+    if not status_history.has_changes() and not total_history.has_changes():
+        return
+
+    old_status = status_history.deleted[0] if status_history.deleted else target.status
+    old_total = total_history.deleted[0] if total_history.deleted else target.total
+    before = _status_counts(old_status, old_total)
+    after = _status_counts(target.status, target.total)
+    apply_user_stats(
+        connection, target.user_id,
+        **{name: after[name] - before[name] for name in after}
+    )
+
+
+@event.listens_for(Order, 'after_delete')
+def _order_deleted(mapper, connection, target):
+    counts = _status_counts(target.status, target.total)
+    apply_user_stats(connection, target.user_id, total_orders=-1,
+                     **{name: -value for name, value in counts.items()})
+
+
+@event.listens_for(Wishlist, 'after_insert')
+def _wishlist_added(mapper, connection, target):
+    apply_user_stats(connection, target.user_id, wishlist_items=1)
+
+
+@event.listens_for(Wishlist, 'after_delete')
+def _wishlist_removed(mapper, connection, target):
+    apply_user_stats(connection, target.user_id, wishlist_items=-1)
@@ -21,7 +21,7 @@ class Wishlist(BaseModel):
     # Database Indexes
     __table_args__ = (
         Index('idx_wishlist_user', 'user_id'),
-        Index('idx_wishlist_variant', 'variant_id'),
+        Index('idx_wishlist_variant', 'variant_id', 'user_id'),  # Alert fan-out walks users per variant
         Index('idx_wishlist_unique', 'user_id', 'variant_id', unique=True),
     )
     
@@ -1,18 +1,23 @@
 """Repository package for data access layer"""
 
 from .base_repository import BaseRepository
-from .user_repository import UserRepository
+from .user_repository import UserRepository, UserStatsRepository
 from .product_repository import ProductRepository, ProductVariantRepository
 # from .cart_repository import CartRepository
-# from .order_repository import OrderRepository
+from .order_repository import OrderRepository
+from .coupon_repository import CouponRepository
+from .wishlist_repository import WishlistRepository
 # from .analytics_repository import AnalyticsRepository
 
 __all__ = [
     'BaseRepository',
     'UserRepository', 
+    'UserStatsRepository',
     'ProductRepository',
     'ProductVariantRepository',
     # 'CartRepository',
-    # 'OrderRepository',
+    'OrderRepository',
+    'CouponRepository',
+    'WishlistRepository',
     # 'AnalyticsRepository'
 ] 
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Coupon repository with usage-limit queries"""
+
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import func, or_
+
+from app.models import Coupon, CouponUsage
+from .base_repository import BaseRepository
+
+
+class CouponRepository(BaseRepository):
+    """Repository for coupon lookups and redemption"""
+    
+    def __init__(self):
+        super().__init__(Coupon)
+    
+    def get_by_code(self, code: str) -> Optional[Coupon]:
+        """Get coupon by its (upper-cased) code"""
+        return self.db.query(Coupon).filter(Coupon.code == code.upper()).first()
+    
+    def count_user_usages(self, coupon_id: UUID, user_id: UUID) -> int:
+        """Times a user has redeemed a coupon, from the (coupon_id, user_id) index"""
+        return self.db.query(func.count(CouponUsage.id)).filter(
+            CouponUsage.coupon_id == coupon_id,
+            CouponUsage.user_id == user_id
+        ).scalar() or 0
+    
+    def claim_usage(self, coupon_id: UUID) -> bool:
+        """Atomically count one use of a coupon if it is below its usage limit
+        
+        A single conditional UPDATE, so concurrent redemptions can never push
+        usage_count past usage_limit. The updated row stays locked until the
+        transaction ends, which also serializes per-user checks made after it.
+        """
+        claimed = self.db.query(Coupon).filter(
+            Coupon.id == coupon_id,
+            or_(Coupon.usage_limit.is_(None), Coupon.usage_count < Coupon.usage_limit)
+        ).update(
+            {Coupon.usage_count: Coupon.usage_count + 1},
+            synchronize_session=False
+        )
+        return claimed == 1
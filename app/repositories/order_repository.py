@@ -0,0 +1,198 @@
+"""Order repository with specialized order queries"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+from datetime import datetime
+from sqlalchemy import and_, case, func, insert, or_
+
+from app.models import Order, OrderEvent, OrderItem, ProductVariant
+from .base_repository import BaseRepository
+
+# Order fields listed in order history (no items)
+ORDER_SUMMARY_COLUMNS = (
+    'id', 'order_number', 'status', 'payment_status', 'subtotal', 'tax_amount',
+    'shipping_amount', 'discount_amount', 'total', 'currency', 'tracking_number',
+    'shipped_at', 'delivered_at', 'created_at', 'updated_at'
+)
+
+# Order and item fields an invoice is rendered from
+INVOICE_ORDER_COLUMNS = ORDER_SUMMARY_COLUMNS + (
+    'user_id', 'payment_method', 'shipping_carrier', 'shipping_address', 'billing_address'
+)
+INVOICE_ITEM_COLUMNS = (
+    'order_id', 'product_name', 'product_sku', 'variant_name', 'variant_sku',
+    'variant_attributes', 'quantity', 'price', 'discount_amount', 'tax_amount', 'total'
+)
+
+
+class OrderRepository(BaseRepository):
+    """Repository for order-related database operations"""
+    
+    def __init__(self):
+        super().__init__(Order)
+    
+    def get_history_version(self, user_id: UUID) -> Tuple[tuple, Optional[datetime]]:
+        """Version of a user's order history without loading the orders
+        
+        Order items embed the current variant price and stock, so variant
+        changes count as well. Every status change writes an OrderEvent, so
+        the event count moves with transitions timestamps can't tell apart.
+        """
+        event_count = self.db.query(func.count(OrderEvent.id)).join(
+            Order, Order.id == OrderEvent.order_id
+        ).filter(Order.user_id == user_id).scalar_subquery()
+        
+        row = self.db.query(
+            func.count(func.distinct(Order.id)),
+            func.max(Order.updated_at),
+            func.max(ProductVariant.updated_at),
+            event_count
+        ).select_from(Order).outerjoin(
+            OrderItem, OrderItem.order_id == Order.id
+        ).outerjoin(
+            ProductVariant, ProductVariant.id == OrderItem.variant_id
+        ).filter(Order.user_id == user_id).one()
+        
+        order_count, orders_updated, variants_updated, events = row
+        last_modified = max(filter(None, (orders_updated, variants_updated)), default=None)
+        return (user_id, order_count, orders_updated, variants_updated, events), last_modified
+    
+    def get_order_version(self, order_id: UUID, user_id: UUID) -> Optional[Tuple[tuple, Optional[datetime]]]:
+        """Version of a single order owned by user_id, or None if not found"""
+        row = self.db.query(Order.updated_at, Order.status).filter(
+            Order.id == order_id,
+            Order.user_id == user_id
+        ).first()
+        
+        if row is None:
+            return None
+        return (order_id, row.updated_at, row.status), row.updated_at
+    
+    def mark_payment_captured(self, order_id: UUID) -> bool:
+        """Capture payment of a pending order; False if it was already handled"""
+        updated = self.db.query(Order).filter(
+            Order.id == order_id,
+            Order.status == 'pending',
+            Order.payment_status == 'pending'
+        ).update(
+            {Order.payment_status: 'captured', Order.status: 'confirmed'},
+            synchronize_session=False
+        )
+        if updated != 1:
+            return False
+        
+        self.db.add(OrderEvent(
+            order_id=order_id,
+            event_type='confirmed',
+            from_status='pending',
+            to_status='confirmed',
+            details={'payment_status': 'captured'},
+            occurred_at=datetime.utcnow()
+        ))
+        return True
+    
+    def add_items(self, order_id: UUID, lines: List[Dict[str, Any]]):
+        """Insert all items of an order with one multi-row INSERT"""
+        if lines:
+            self.db.execute(insert(OrderItem), [dict(line, order_id=order_id) for line in lines])
+    
+    def get_events(self, order_id: UUID) -> List[OrderEvent]:
+        """An order's event log, oldest first (order_id, occurred_at index)"""
+        return self.db.query(OrderEvent).filter(
+            OrderEvent.order_id == order_id
+        ).order_by(OrderEvent.occurred_at, OrderEvent.created_at).all()
+    
+    def get_stage_times(self, stages: List[str], since: datetime) -> List[tuple]:
+        """First time each order reached each stage, for events since a date
+        
+        Returns one row per order: (order_id, time of stages[0], time of
+        stages[1], ...), None where the stage wasn't reached. A single
+        grouped scan of the (event_type, occurred_at) index.
+        """
+        columns = [
+            func.min(case((OrderEvent.event_type == stage, OrderEvent.occurred_at)))
+            for stage in stages
+        ]
+        return self.db.query(OrderEvent.order_id, *columns).filter(
+            OrderEvent.event_type.in_(stages),
+            OrderEvent.occurred_at >= since
+        ).group_by(OrderEvent.order_id).all()
+    
+    def get_summary_version(self, user_id: UUID) -> Tuple[tuple, Optional[datetime]]:
+        """Version of a user's order summaries (no items, so variants don't matter)"""
+        order_count, last_updated = self.db.query(
+            func.count(Order.id), func.max(Order.updated_at)
+        ).filter(Order.user_id == user_id).one()
+        return (user_id, order_count, last_updated), last_updated
+    
+    def get_summaries(self, user_id: UUID, status: Optional[str] = None,
+                      offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """A page of a user's orders as summary rows, newest first
+        
+        Reads only order columns, from the (user_id, created_at) index;
+        items and variants are not loaded.
+        """
+        query = self.db.query(*[getattr(Order, column) for column in ORDER_SUMMARY_COLUMNS]).filter(
+            Order.user_id == user_id
+        )
+        if status:
+            query = query.filter(Order.status == status)
+        rows = query.order_by(Order.created_at.desc()).offset(offset).limit(limit).all()
+        return [dict(zip(ORDER_SUMMARY_COLUMNS, row)) for row in rows]
+    
+    def count_for_user(self, user_id: UUID, status: Optional[str] = None) -> int:
+        """Number of a user's orders, optionally with one status"""
+        query = self.db.query(func.count(Order.id)).filter(Order.user_id == user_id)
+        if status:
+            query = query.filter(Order.status == status)
+        return query.scalar()
+    
+    def get_invoice_snapshot(self, order_id: UUID, user_id: Optional[UUID] = None) -> Optional[Dict[str, Any]]:
+        """An order's invoice fields as a flat dict, without items"""
+        query = self.db.query(*[getattr(Order, column) for column in INVOICE_ORDER_COLUMNS]).filter(
+            Order.id == order_id
+        )
+        if user_id is not None:
+            query = query.filter(Order.user_id == user_id)
+        row = query.first()
+        return dict(zip(INVOICE_ORDER_COLUMNS, row)) if row else None
+    
+    def get_invoice_items(self, order_ids: List[UUID]) -> Dict[UUID, List[Dict[str, Any]]]:
+        """Invoice item rows for several orders in one query, keyed by order id"""
+        items = defaultdict(list)
+        if not order_ids:
+            return items
+        rows = self.db.query(*[getattr(OrderItem, column) for column in INVOICE_ITEM_COLUMNS]).filter(
+            OrderItem.order_id.in_(order_ids)
+        ).order_by(OrderItem.order_id, OrderItem.created_at, OrderItem.id)
+        for row in rows:
+            item = dict(zip(INVOICE_ITEM_COLUMNS, row))
+            items[item.pop('order_id')].append(item)
+        return items
+    
+    def iter_invoice_snapshots(self, start: datetime, end: datetime,
+                               batch_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """Invoice snapshots of orders created in [start, end), in batches
+        
+        Pages by (created_at, id) instead of OFFSET, so each batch is an
+        index range scan and only one batch is held at a time. Snapshots
+        come without items; fetch those per batch with get_invoice_items.
+        """
+        columns = [getattr(Order, column) for column in INVOICE_ORDER_COLUMNS]
+        last = None
+        while True:
+            query = self.db.query(*columns).filter(Order.created_at >= start, Order.created_at < end)
+            if last is not None:
+                query = query.filter(or_(
+                    Order.created_at > last[0],
+                    and_(Order.created_at == last[0], Order.id > last[1])
+                ))
+            rows = query.order_by(Order.created_at, Order.id).limit(batch_size).all()
+            if not rows:
+                return
+            batch = [dict(zip(INVOICE_ORDER_COLUMNS, row)) for row in rows]
+            last = (batch[-1]['created_at'], batch[-1]['id'])
+            yield batch
+            if len(rows) < batch_size:
+                return
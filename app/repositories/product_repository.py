@@ -2,10 +2,11 @@
 
 from typing import List, Dict, Any, Optional
 from uuid import UUID
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy import and_, or_, func, desc, case, text
 from sqlalchemy.orm import joinedload
 
-from app.models import Product, ProductVariant, Category, Review
+from app.models import Product, ProductVariant, Category, Review, ProductRelation, RelationType
+from app.models.product import fold_text
 from .base_repository import BaseRepository
 
 
@@ -23,11 +24,42 @@ class ProductRepository(BaseRepository):
             joinedload(Product.category)
         ).filter(Product.id == product_id).first()
     
+    def get_version(self, product_id: UUID):
+        """Version of a product row without loading it, or None if not found"""
+        row = self.db.query(Product.updated_at).filter(Product.id == product_id).first()
+        if row is None:
+            return None
+        return (product_id, row.updated_at), row.updated_at
+    
+    def get_active_by_ids(self, product_ids: List[UUID]) -> List[Product]:
+        """Get active products by ID in one query, keeping the given order"""
+        if not product_ids:
+            return []
+        
+        products = self.db.query(Product).filter(
+            Product.id.in_(product_ids),
+            Product.is_active == True
+        ).all()
+        by_id = {product.id: product for product in products}
+        return [by_id[product_id] for product_id in product_ids if product_id in by_id]
+    
+    def has_trigram_index(self) -> bool:
+        """Whether text search can use the pg_trgm index on products.search_text"""
+        return self.db.get_bind().dialect.name == 'postgresql'
+    
     def search_products(self, query: str = None, category_ids: List[UUID] = None,
                        min_price: float = None, max_price: float = None,
                        brands: List[str] = None, in_stock: bool = True,
-                       limit: int = 20, offset: int = 0) -> Dict[str, Any]:
-        """Advanced product search with filters"""
+                       limit: int = 20, offset: int = 0,
+                       ranked_ids: List[UUID] = None,
+                       similarity_threshold: float = 0.5) -> Dict[str, Any]:
+        """Advanced product search with filters
+        
+        Text queries are matched by trigram similarity against the folded
+        name, brand and tags and ordered by score. On Postgres this uses the
+        pg_trgm GIN index; elsewhere the caller ranks the matches in process
+        and passes them as ranked_ids.
+        """
         
         # Base query with joins
         base_query = self.db.query(Product).options(
@@ -37,13 +69,25 @@ class ProductRepository(BaseRepository):
         ).filter(Product.is_active == True)
         
         # Text search
-        if query:
-            search_filter = or_(
-                Product.name.ilike(f'%{query}%'),
-                Product.description.ilike(f'%{query}%'),
-                Product.brand.ilike(f'%{query}%')
+        if ranked_ids is not None:
+            if not ranked_ids:
+                return {'products': [], 'total': 0, 'limit': limit, 'offset': offset}
+            base_query = base_query.filter(Product.id.in_(ranked_ids)).order_by(
+                case({product_id: rank for rank, product_id in enumerate(ranked_ids)},
+                     value=Product.id)
+            )
+        elif query:
+            folded = fold_text(query)
+            # %> is the indexable form of word_similarity(query, search_text) >= threshold
+            self.db.execute(
+                text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+                {'threshold': str(similarity_threshold)}
+            )
+            base_query = base_query.filter(
+                Product.search_text.op('%>')(folded)
+            ).order_by(
+                func.word_similarity(folded, Product.search_text).desc()
             )
-            base_query = base_query.filter(search_filter)
         
         # Category filter
         if category_ids:
@@ -107,24 +151,38 @@ class ProductRepository(BaseRepository):
         ).offset(offset).limit(limit).all()
     
     def get_related_products(self, product_id: UUID, limit: int = 5) -> List[Product]:
-        """Get related products based on category and brand"""
-        product = self.get_by_id(product_id)
-        if not product:
-            return []
-        
-        return self.db.query(Product).options(
-            joinedload(Product.variants),
-            joinedload(Product.images)
+        """Get precomputed related products, topped up by category and brand"""
+        related = self.db.query(Product).join(
+            ProductRelation, ProductRelation.related_product_id == Product.id
         ).filter(
+            ProductRelation.product_id == product_id,
+            ProductRelation.relation_type == RelationType.RELATED.value,
+            Product.is_active == True
+        ).order_by(ProductRelation.rank).limit(limit).all()
+        
+        if len(related) >= limit:
+            return related
+        
+        # Fallback for products without enough purchase/view history
+        source = self.db.query(Product.category_id, Product.brand).filter(
+            Product.id == product_id
+        ).first()
+        if not source:
+            return related
+        
+        exclude_ids = [product_id] + [product.id for product in related]
+        fallback = self.db.query(Product).filter(
             and_(
                 Product.is_active == True,
-                Product.id != product_id,
+                ~Product.id.in_(exclude_ids),
                 or_(
-                    Product.category_id == product.category_id,
-                    Product.brand == product.brand
+                    Product.category_id == source.category_id,
+                    Product.brand == source.brand
                 )
             )
-        ).limit(limit).all()
+        ).limit(limit - len(related)).all()
+        
+        return related + fallback
     
     def get_top_rated_products(self, limit: int = 10) -> List[Product]:
         """Get top-rated products"""
@@ -282,4 +340,18 @@ class ProductVariantRepository(BaseRepository):
     def check_stock_availability(self, variant_id: UUID, quantity: int) -> bool:
         """Check if variant has enough stock"""
         variant = self.get_by_id(variant_id)
-        return variant and variant.is_active and variant.stock >= quantity 
\ No newline at end of file
+        return variant and variant.is_active and variant.stock >= quantity 
+    
+    def reserve_stock(self, variant_id: UUID, quantity: int) -> bool:
+        """Atomically take quantity units of stock if that many are left
+        
+        A conditional UPDATE, so concurrent checkouts can't oversell a variant.
+        """
+        reserved = self.db.query(ProductVariant).filter(
+            ProductVariant.id == variant_id,
+            ProductVariant.stock >= quantity
+        ).update(
+            {ProductVariant.stock: ProductVariant.stock - quantity},
+            synchronize_session=False
+        )
+        return reserved == 1
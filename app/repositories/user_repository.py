@@ -2,7 +2,8 @@
 
 from typing import Optional, List
 from sqlalchemy.orm import joinedload
-from app.models import User, Address
+from app.models import User, Address, UserStats
+from app.models.user_stats import ensure_user_stats
 from app.repositories.base_repository import BaseRepository
 
 
@@ -126,4 +127,24 @@ class UserRepository(BaseRepository):
         if exclude_user_id:
             query = query.filter(User.id != exclude_user_id)
         
-        return query.first() is not None 
\ No newline at end of file
+        return query.first() is not None 
+
+
+class UserStatsRepository(BaseRepository):
+    """Repository for per-user order and wishlist counters"""
+    
+    def __init__(self):
+        super().__init__(UserStats)
+    
+    def get_for_user(self, user_id) -> UserStats:
+        """The user's counters, created from orders and wishlists on first use"""
+        stats = self.db.query(UserStats).filter(UserStats.user_id == user_id).first()
+        if stats is None:
+            try:
+                ensure_user_stats(self.db.connection(), user_id)
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+            stats = self.db.query(UserStats).filter(UserStats.user_id == user_id).one()
+        return stats
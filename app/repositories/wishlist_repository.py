@@ -0,0 +1,103 @@
+"""Wishlist repository for data access operations"""
+
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, delete
+
+from app.models import CartItem, Product, ProductVariant, Wishlist
+from app.models.user_stats import apply_user_stats
+from app.repositories.base_repository import BaseRepository
+
+
+class WishlistRepository(BaseRepository):
+    """Repository for wishlist operations"""
+
+    def __init__(self):
+        super().__init__(Wishlist)
+
+    def get_items(self, user_id: UUID) -> List[Dict[str, Any]]:
+        """A user's wishlist with variant and product fields, newest first
+
+        One joined query for the whole list instead of lazy-loading each
+        item's variant and product.
+        """
+        rows = self.db.query(
+            Wishlist.id, Wishlist.variant_id, Wishlist.created_at,
+            ProductVariant.name, ProductVariant.sku, ProductVariant.price,
+            ProductVariant.stock, ProductVariant.attributes,
+            Product.id, Product.name, Product.slug, Product.brand
+        ).join(
+            ProductVariant, ProductVariant.id == Wishlist.variant_id
+        ).outerjoin(
+            Product, Product.id == ProductVariant.product_id
+        ).filter(
+            Wishlist.user_id == user_id
+        ).order_by(Wishlist.created_at.desc()).all()
+
+        return [
+            {
+                'id': str(item_id),
+                'variant_id': str(variant_id),
+                'variant': {
+                    'id': str(variant_id),
+                    'name': variant_name,
+                    'sku': sku,
+                    'price': float(price),
+                    'stock': stock,
+                    'attributes': attributes,
+                    'product': {
+                        'id': str(product_id),
+                        'name': product_name,
+                        'slug': slug,
+                        'brand': brand
+                    } if product_id else None
+                },
+                'added_at': created_at.isoformat() if created_at else None
+            }
+            for (item_id, variant_id, created_at, variant_name, sku, price, stock, attributes,
+                 product_id, product_name, slug, brand) in rows
+        ]
+
+    def get_move_candidates(self, user_id: UUID, cart_id: UUID,
+                            variant_ids: Optional[List[UUID]] = None) -> List[Dict[str, Any]]:
+        """Wishlisted variants with their availability and current cart quantity
+
+        One query covers the stock check for any number of items. Without
+        variant_ids the whole wishlist is returned.
+        """
+        query = self.db.query(
+            Wishlist.variant_id, ProductVariant.is_active, ProductVariant.stock,
+            ProductVariant.price, CartItem.quantity
+        ).join(
+            ProductVariant, ProductVariant.id == Wishlist.variant_id
+        ).outerjoin(
+            CartItem, and_(CartItem.cart_id == cart_id, CartItem.variant_id == Wishlist.variant_id)
+        ).filter(Wishlist.user_id == user_id)
+        if variant_ids is not None:
+            query = query.filter(Wishlist.variant_id.in_(variant_ids))
+
+        return [
+            {
+                'variant_id': variant_id,
+                'is_active': is_active,
+                'stock': stock,
+                'price': price,
+                'in_cart': in_cart or 0
+            }
+            for variant_id, is_active, stock, price, in_cart in query.all()
+        ]
+
+    def remove_variants(self, user_id: UUID, variant_ids: List[UUID]) -> int:
+        """Delete several wishlist items in one statement and update the user's counter"""
+        if not variant_ids:
+            return 0
+        removed = self.db.execute(
+            delete(Wishlist).where(
+                Wishlist.user_id == user_id,
+                Wishlist.variant_id.in_(variant_ids)
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        # Bulk deletes skip the mapper events that keep user_stats in step
+        apply_user_stats(self.db.connection(), user_id, wishlist_items=-removed)
+        return removed
@@ -3,13 +3,21 @@
 from .auth_service import AuthService
 from .product_service import ProductService
 from .cart_service import CartService
-# from .order_service import OrderService
+from .order_service import OrderService
+from .invoice_service import InvoiceService
+from .wishlist_service import WishlistService
+from .wishlist_alert_service import WishlistAlertService
+from .inventory_service import InventoryService
 # from .analytics_service import AnalyticsService
 
 __all__ = [
     'AuthService',
     'ProductService', 
     'CartService',
-    # 'OrderService',
+    'OrderService',
+    'InvoiceService',
+    'WishlistService',
+    'WishlistAlertService',
+    'InventoryService',
     # 'AnalyticsService'
 ] 
\ No newline at end of file
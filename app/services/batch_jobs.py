@@ -0,0 +1,38 @@
+"""Helpers shared by the offline catalog jobs (related products, recommendations)"""
+
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+from uuid import UUID
+
+from app.extensions import redis_client
+
+
+def chunks(ids: Iterable, size: int = 1000) -> Iterator[List]:
+    """Lists of at most size ids, for IN clauses"""
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def event_product_id(properties) -> Optional[UUID]:
+    """Product id recorded on a product_view event, if any"""
+    try:
+        return UUID(str(properties['product_id']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_watermark(key: str) -> Optional[datetime]:
+    """Start time of the job's last successful run"""
+    try:
+        value = redis_client.get(key)
+        return datetime.fromisoformat(value) if value else None
+    except Exception:
+        return None
+
+
+def set_watermark(key: str, value: datetime):
+    try:
+        redis_client.set(key, value.isoformat())
+    except Exception:
+        pass
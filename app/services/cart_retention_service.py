@@ -0,0 +1,217 @@
+"""Cart retention: expire stale carts, archive and purge closed ones"""
+
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import delete, exists, func, insert, select, update
+
+from app.models import Cart, CartArchive, CartAbandonment, CartItem
+from app.models.cart import CartStatus
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Carts no longer in use; purged once they are past the retention window
+CLOSED_STATUSES = (
+    CartStatus.CONVERTED.value,
+    CartStatus.ABANDONED.value,
+    CartStatus.EXPIRED.value,
+    CartStatus.MERGED.value,
+)
+
+
+class CartRetentionService:
+    """Batched cart expiry and compaction
+
+    Both phases walk idx_cart_expires in expires_at order and work on at
+    most batch_size carts per transaction, so row locks are held briefly
+    and the job can be stopped at any point without losing work:
+
+    1. active carts past expires_at are marked expired;
+    2. closed carts (converted, abandoned, expired, merged) whose
+       expires_at is more than `days` ago are copied to cart_archives and
+       deleted with their items. Carts with cart_abandonments rows are
+       kept, since those reference them.
+
+    Age is measured from expires_at, which checkout and cart activity push
+    30 days past the last change.
+    """
+
+    def run(self, days: Optional[int] = None, batch_size: Optional[int] = None,
+            dry_run: bool = False, max_batches: Optional[int] = None) -> Dict[str, Any]:
+        """Run both phases and return counts and throughput"""
+        config = current_app.config
+        days = config.get('CART_RETENTION_DAYS', 90) if days is None else days
+        batch_size = batch_size or config.get('CART_RETENTION_BATCH', 1000)
+        pause = config.get('CART_RETENTION_PAUSE', 0.0)
+
+        now = datetime.utcnow()
+        cutoff = now - timedelta(days=days)
+        started = time.perf_counter()
+
+        if dry_run:
+            stats = self._preview(now, cutoff)
+        else:
+            stats = {'expired': 0, 'archived': 0, 'deleted': 0, 'items_deleted': 0, 'batches': 0}
+            self._expire(now, batch_size, pause, max_batches, stats)
+            self._purge(cutoff, batch_size, pause, max_batches, stats)
+
+        elapsed = time.perf_counter() - started
+        processed = 0 if dry_run else stats['expired'] + stats['deleted']
+        stats.update({
+            'dry_run': dry_run,
+            'days': days,
+            'batch_size': batch_size,
+            'seconds': round(elapsed, 3),
+            'carts_per_second': round(processed / elapsed, 1) if elapsed else 0.0
+        })
+        return stats
+
+    # ----- phases -----
+
+    def _expire(self, now: datetime, batch_size: int, pause: float,
+                max_batches: Optional[int], stats: Dict[str, Any]):
+        while max_batches is None or stats['batches'] < max_batches:
+            cart_ids = self._next_batch(self._expirable(now), batch_size)
+            if not cart_ids:
+                return
+            try:
+                # Re-check status so carts touched since the SELECT are left alone
+                expired = db.session.execute(
+                    update(Cart).where(
+                        Cart.id.in_(cart_ids),
+                        Cart.status == CartStatus.ACTIVE.value,
+                        Cart.expires_at < now
+                    ).values(status=CartStatus.EXPIRED.value).execution_options(synchronize_session=False)
+                ).rowcount
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            stats['expired'] += expired
+            stats['batches'] += 1
+            logger.info("Cart retention: expired %s carts", expired)
+            if len(cart_ids) < batch_size:
+                return
+            self._sleep(pause)
+
+    def _purge(self, cutoff: datetime, batch_size: int, pause: float,
+               max_batches: Optional[int], stats: Dict[str, Any]):
+        while max_batches is None or stats['batches'] < max_batches:
+            cart_ids = self._next_batch(self._purgeable(cutoff), batch_size)
+            if not cart_ids:
+                return
+            try:
+                archives = self._archive_rows(cart_ids)
+                if archives:
+                    db.session.execute(insert(CartArchive), archives)
+                items_deleted = db.session.execute(
+                    delete(CartItem).where(CartItem.cart_id.in_(cart_ids))
+                ).rowcount
+                deleted = db.session.execute(
+                    delete(Cart).where(Cart.id.in_(cart_ids))
+                ).rowcount
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            stats['archived'] += len(archives)
+            stats['deleted'] += deleted
+            stats['items_deleted'] += items_deleted
+            stats['batches'] += 1
+            logger.info("Cart retention: archived %s and deleted %s carts", len(archives), deleted)
+            if len(cart_ids) < batch_size:
+                return
+            self._sleep(pause)
+
+    def _preview(self, now: datetime, cutoff: datetime) -> Dict[str, Any]:
+        """Counts a real run would produce, without writing"""
+        expired = db.session.execute(
+            select(func.count()).select_from(self._expirable(now).subquery())
+        ).scalar()
+
+        # Active carts past the cutoff would be expired first, then purged
+        purgeable = select(Cart.id).where(
+            Cart.status.in_(CLOSED_STATUSES + (CartStatus.ACTIVE.value,)),
+            Cart.expires_at < cutoff,
+            ~exists().where(CartAbandonment.cart_id == Cart.id)
+        ).subquery()
+        deleted, archived, items = db.session.execute(
+            select(
+                func.count(func.distinct(purgeable.c.id)),
+                func.count(func.distinct(CartItem.cart_id)),
+                func.count(CartItem.id)
+            ).select_from(purgeable).outerjoin(CartItem, CartItem.cart_id == purgeable.c.id)
+        ).one()
+
+        return {'expired': expired, 'archived': archived, 'deleted': deleted,
+                'items_deleted': items, 'batches': 0}
+
+    # ----- queries -----
+
+    @staticmethod
+    def _expirable(now: datetime):
+        return select(Cart.id).where(
+            Cart.status == CartStatus.ACTIVE.value,
+            Cart.expires_at < now
+        )
+
+    @staticmethod
+    def _purgeable(cutoff: datetime):
+        return select(Cart.id).where(
+            Cart.status.in_(CLOSED_STATUSES),
+            Cart.expires_at < cutoff,
+            ~exists().where(CartAbandonment.cart_id == Cart.id)
+        )
+
+    @staticmethod
+    def _next_batch(query, batch_size: int) -> List:
+        # Oldest first along idx_cart_expires; processed rows drop out of the filter
+        return db.session.execute(query.order_by(Cart.expires_at).limit(batch_size)).scalars().all()
+
+    @staticmethod
+    def _archive_rows(cart_ids: List) -> List[Dict[str, Any]]:
+        """Archive rows for the carts that still have items (empty carts are just deleted)"""
+        lines = defaultdict(list)
+        for cart_id, variant_id, quantity, price in db.session.execute(
+            select(CartItem.cart_id, CartItem.variant_id, CartItem.quantity, CartItem.price)
+            .where(CartItem.cart_id.in_(cart_ids))
+        ):
+            lines[cart_id].append((variant_id, quantity, price))
+        if not lines:
+            return []
+
+        archives = []
+        for cart in db.session.execute(
+            select(Cart.id, Cart.user_id, Cart.session_id, Cart.status, Cart.cart_metadata,
+                   Cart.created_at, Cart.updated_at, Cart.expires_at)
+            .where(Cart.id.in_(list(lines)))
+        ):
+            cart_lines = lines[cart.id]
+            archives.append({
+                'cart_id': cart.id,
+                'user_id': cart.user_id,
+                'session_id': cart.session_id,
+                'status': cart.status,
+                'item_count': len(cart_lines),
+                'total_quantity': sum(quantity for _, quantity, _ in cart_lines),
+                'subtotal': sum((price * quantity for _, quantity, price in cart_lines), Decimal('0')),
+                'items': [[str(variant_id), quantity, float(price)] for variant_id, quantity, price in cart_lines],
+                'cart_metadata': cart.cart_metadata,
+                'cart_created_at': cart.created_at,
+                'cart_updated_at': cart.updated_at,
+                'expires_at': cart.expires_at
+            })
+        return archives
+
+    @staticmethod
+    def _sleep(pause: float):
+        if pause:
+            time.sleep(pause)
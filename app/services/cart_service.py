@@ -1,12 +1,22 @@
 """Cart service with shopping cart business logic"""
 
 from typing import Dict, Any, Optional
-from uuid import UUID
+from uuid import UUID, uuid4
 from decimal import Decimal
+from flask import current_app
+from sqlalchemy import case, func, literal, select
 
-from app.models import Cart, CartItem, ProductVariant, User, Address, Coupon
-from app.repositories import BaseRepository, ProductVariantRepository
+from app.models import Cart, CartItem, Product, ProductVariant, User, Address, Coupon, CouponUsage
+from app.repositories import BaseRepository, ProductVariantRepository, CouponRepository
 from app.extensions import db, redis_client
+from app.models.serialization import dumps, loads
+from app.services.promotion_engine import promotion_engine
+from app.services.rate_engine import rate_engine
+from app.services.search_index import catalog_version
+from app.services.coupon_reservation_service import CouponReservationService
+
+TOTALS_CACHE_PREFIX = 'cart_totals'
+COUPON_UNAVAILABLE = 'Coupon is temporarily unavailable, please try again'
 
 
 class CartService:
@@ -15,6 +25,8 @@ class CartService:
     def __init__(self):
         self.cart_repo = CartRepository()
         self.variant_repo = ProductVariantRepository()
+        self.coupon_repo = CouponRepository()
+        self.reservations = CouponReservationService()
     
     def get_or_create_cart(self, user_id: Optional[UUID] = None, 
                           session_id: Optional[str] = None) -> Optional[Cart]:
@@ -38,6 +50,51 @@ class CartService:
         
         return cart
     
+    def merge_guest_cart(self, session_id: str, user_id: UUID) -> Dict[str, Any]:
+        """Move a guest's session cart into the user's cart after login
+        
+        Lines are merged with one INSERT ... ON CONFLICT, with quantities
+        capped by stock, and the guest cart is retired in the same
+        transaction. The guest cart's coupon hold is released; the coupon
+        is not carried over, since per-user limits weren't checked for it.
+        """
+        guest_cart = self.cart_repo.find_one_by({'session_id': session_id, 'status': 'active'})
+        if not guest_cart or guest_cart.user_id is not None:
+            return {'success': True, 'merged_items': 0}
+        
+        try:
+            cart = self.cart_repo.find_one_by({'user_id': user_id, 'status': 'active'})
+            if not cart:
+                cart = self.cart_repo.create({'user_id': user_id, 'status': 'active'})
+            
+            merged_items = self.cart_repo.merge_items(guest_cart.id, cart.id)
+            if merged_items:
+                cart.bump_version()
+            guest_cart.mark_merged()
+            cart.extend_expiration()
+            
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            return {'success': False, 'error': 'Failed to merge cart'}
+        
+        coupon_id = (guest_cart.cart_metadata or {}).get('coupon_id')
+        if coupon_id:
+            self.reservations.release(coupon_id, guest_cart.id)
+        
+        return {'success': True, 'merged_items': merged_items, 'cart': cart}
+    
+    def get_cart_version(self, user_id: Optional[UUID] = None,
+                         session_id: Optional[str] = None):
+        """Get cheap version info of the active cart for conditional requests"""
+        version = self.cart_repo.get_version(user_id, session_id)
+        if version is None:
+            return None
+        
+        # Totals include automatic promotions, so rule changes are a new version
+        parts, last_modified = version
+        return (*parts, promotion_engine.version()), last_modified
+    
     def add_to_cart(self, user_id: Optional[UUID], session_id: Optional[str],
                    variant_id: UUID, quantity: int) -> Dict[str, Any]:
         """Add item to cart"""
@@ -213,9 +270,7 @@ class CartService:
                 }
             
             # Find coupon
-            coupon = db.session.query(Coupon).filter(
-                Coupon.code == coupon_code.upper()
-            ).first()
+            coupon = self.coupon_repo.get_by_code(coupon_code)
             
             if not coupon:
                 return {
@@ -234,18 +289,33 @@ class CartService:
                     'error': ', '.join(validation['errors'])
                 }
             
+            # Hold one use of the coupon for this cart until checkout
+            previous_coupon_id = (cart.cart_metadata or {}).get('coupon_id')
+            reserved = self.reservations.reserve(coupon, cart.id)
+            if reserved is False:
+                return {
+                    'success': False,
+                    'error': 'Coupon usage limit exceeded'
+                }
+            if reserved is None and coupon.usage_limit is not None:
+                # Limited coupons can't be counted without Redis (see redeem_coupon)
+                return {
+                    'success': False,
+                    'error': COUPON_UNAVAILABLE
+                }
+            if previous_coupon_id and previous_coupon_id != str(coupon.id):
+                self.reservations.release(previous_coupon_id, cart.id)
+            
             # Calculate discount
             discount_amount = coupon.calculate_discount(cart_total)
             
-            # Store coupon in cart metadata
-            if not hasattr(cart, 'metadata') or cart.metadata is None:
-                cart.metadata = {}
-            
-            cart.metadata.update({
+            # Store coupon in cart metadata (reassigned so the JSON change is saved)
+            cart.cart_metadata = {
+                **(cart.cart_metadata or {}),
                 'coupon_code': coupon_code.upper(),
                 'coupon_id': str(coupon.id),
                 'discount_amount': float(discount_amount)
-            })
+            }
             
             db.session.commit()
             
@@ -266,6 +336,84 @@ class CartService:
                 'error': 'Failed to apply coupon'
             }
     
+    def redeem_coupon(self, cart: Cart, user_id: Optional[UUID], order_id: UUID,
+                      cart_total: Decimal) -> Dict[str, Any]:
+        """Record use of the cart's coupon as part of the caller's transaction
+        
+        Limits are enforced by converting the cart's Redis reservation, and
+        coupons.usage_count is brought up to date later by the reconcile
+        job. Without Redis, coupons with a usage_limit fail closed:
+        usage_count lags the uses still pending in Redis, so it can't tell
+        whether one is left. Other coupons take the SQL path, where the
+        conditional UPDATE holds the coupon row lock while the per-user
+        limit is checked against coupon_usages; that count is also what
+        Redis catches up to on the next conversion. Nothing is committed
+        here: on failure the caller rolls back, and if its commit fails it
+        must call cancel_redemption.
+        """
+        metadata = cart.cart_metadata or {}
+        if not metadata.get('coupon_id'):
+            return {'success': True, 'coupon': None}
+        
+        coupon = self.coupon_repo.get_by_id(UUID(metadata['coupon_id']))
+        if not coupon:
+            return {
+                'success': False,
+                'error': 'Invalid coupon code'
+            }
+        
+        validation = coupon.is_valid(cart_total, user_id)
+        if not validation['valid']:
+            return {
+                'success': False,
+                'error': ', '.join(validation['errors'])
+            }
+        
+        user_usage_count = self.coupon_repo.count_user_usages(coupon.id, user_id) if user_id else 0
+        outcome = self.reservations.convert(coupon, cart.id, user_id, user_usage_count)
+        reserved = outcome is not None
+        
+        if outcome is None:
+            if coupon.usage_limit is not None:
+                return {
+                    'success': False,
+                    'error': COUPON_UNAVAILABLE
+                }
+            if not self.coupon_repo.claim_usage(coupon.id):
+                outcome = 'exhausted'
+            elif (user_id and coupon.usage_limit_per_user and
+                    self.coupon_repo.count_user_usages(coupon.id, user_id) >= coupon.usage_limit_per_user):
+                outcome = 'user_limit'
+            else:
+                outcome = 'ok'
+        
+        if outcome == 'exhausted':
+            return {
+                'success': False,
+                'error': 'Coupon usage limit exceeded'
+            }
+        if outcome == 'user_limit':
+            return {
+                'success': False,
+                'error': 'You have already used this coupon the maximum number of times'
+            }
+        
+        db.session.add(CouponUsage(
+            coupon_id=coupon.id,
+            user_id=user_id,
+            order_id=order_id,
+            discount_amount=Decimal(str(metadata.get('discount_amount', 0))),
+            cart_total=cart_total
+        ))
+        
+        # 'reserved': counted in Redis (else the SQL path, which the rollback undoes)
+        return {'success': True, 'coupon': coupon, 'user_id': user_id, 'reserved': reserved}
+    
+    def cancel_redemption(self, redemption: Dict[str, Any]):
+        """Give back a redemption whose checkout transaction was rolled back"""
+        if redemption and redemption.get('coupon') is not None and redemption.get('reserved'):
+            self.reservations.revert(redemption['coupon'].id, redemption.get('user_id'))
+    
     def remove_coupon(self, user_id: Optional[UUID], 
                      session_id: Optional[str]) -> Dict[str, Any]:
         """Remove coupon from cart"""
@@ -277,11 +425,14 @@ class CartService:
                     'error': 'Cart not found'
                 }
             
-            # Remove coupon from metadata
-            if hasattr(cart, 'metadata') and cart.metadata:
-                cart.metadata.pop('coupon_code', None)
-                cart.metadata.pop('coupon_id', None)
-                cart.metadata.pop('discount_amount', None)
+            # Remove coupon from metadata and give back its reservation
+            if cart.cart_metadata:
+                if cart.cart_metadata.get('coupon_id'):
+                    self.reservations.release(cart.cart_metadata['coupon_id'], cart.id)
+                cart.cart_metadata = {
+                    key: value for key, value in cart.cart_metadata.items()
+                    if key not in ('coupon_code', 'coupon_id', 'discount_amount')
+                }
             
             db.session.commit()
             
@@ -324,8 +475,16 @@ class CartService:
         }
     
     def calculate_totals(self, user_id: Optional[UUID], session_id: Optional[str],
-                        shipping_address_id: Optional[UUID] = None) -> Dict[str, Any]:
-        """Calculate cart totals including tax and shipping"""
+                        shipping_address_id: Optional[UUID] = None,
+                        shipping_method: Optional[str] = None) -> Dict[str, Any]:
+        """Calculate cart totals including tax and shipping
+        
+        Totals are cached per cart version, shipping address (and when it
+        was last edited), shipping method, and promotion, rate table and
+        catalog versions, so repeated reads (cart polling, then checkout)
+        return the exact same figures until something they depend on
+        changes.
+        """
         try:
             cart = self.get_or_create_cart(user_id, session_id)
             if not cart:
@@ -334,65 +493,132 @@ class CartService:
                     'error': 'Cart not found'
                 }
             
-            if cart.is_empty():
-                return {
-                    'success': True,
-                    'totals': {
-                        'subtotal': 0,
-                        'tax': 0,
-                        'shipping': 0,
-                        'discount': 0,
-                        'total': 0
-                    }
-                }
-            
-            # Calculate subtotal
-            subtotal = cart.get_subtotal()
-            
-            # Calculate discount
-            discount = Decimal('0.00')
-            if hasattr(cart, 'metadata') and cart.metadata and 'discount_amount' in cart.metadata:
-                discount = Decimal(str(cart.metadata['discount_amount']))
-            
-            # Calculate tax (simplified - 8% for example)
-            tax_rate = Decimal('0.08')
-            tax = (subtotal - discount) * tax_rate
+            cache_key = self._totals_key(
+                cart, self._shipping_address(cart, shipping_address_id), shipping_method
+            )
+            try:
+                cached = redis_client.get(cache_key)
+                if cached:
+                    return {'success': True, 'totals': loads(cached)}
+            except Exception:
+                pass
             
-            # Calculate shipping
-            shipping = self._calculate_shipping(cart, shipping_address_id)
+            totals = self._compute_totals(cart, user_id, shipping_address_id, shipping_method)
             
-            # Calculate total
-            total = subtotal + tax + shipping - discount
+            try:
+                redis_client.setex(cache_key, current_app.config.get('CART_TOTALS_TTL', 600), dumps(totals))
+            except Exception:
+                pass
             
             return {
                 'success': True,
-                'totals': {
-                    'subtotal': float(subtotal),
-                    'tax': float(tax),
-                    'shipping': float(shipping),
-                    'discount': float(discount),
-                    'total': float(total),
-                    'items_count': cart.get_total_quantity()
-                }
+                'totals': totals
             }
             
+        except ValueError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
         except Exception as e:
             return {
                 'success': False,
                 'error': 'Failed to calculate totals'
             }
     
-    def _calculate_shipping(self, cart: Cart, 
-                           shipping_address_id: Optional[UUID] = None) -> Decimal:
-        """Calculate shipping cost"""
+    def _compute_totals(self, cart: Cart, user_id: Optional[UUID],
+                        shipping_address_id: Optional[UUID] = None,
+                        shipping_method: Optional[str] = None) -> Dict[str, Any]:
+        """Totals computed from the cart lines, promotions and rate tables"""
+        if cart.is_empty():
+            return {
+                'subtotal': 0,
+                'tax': 0,
+                'shipping': 0,
+                'discount': 0,
+                'total': 0,
+                'items_count': 0,
+                'promotions': [],
+                'version': cart.version
+            }
+        
+        # Calculate subtotal
         subtotal = cart.get_subtotal()
         
-        # Free shipping over $50
-        if subtotal >= Decimal('50.00'):
-            return Decimal('0.00')
+        # Calculate discount
+        discount = Decimal('0.00')
+        if cart.cart_metadata and 'discount_amount' in cart.cart_metadata:
+            discount = Decimal(str(cart.cart_metadata['discount_amount']))
+        
+        # Automatic promotions stack on top of the coupon, up to the subtotal
+        lines = self.cart_repo.get_pricing_lines(cart.id)
+        promotions = promotion_engine.evaluate(subtotal - discount, lines, user_id)
+        discount += promotions['discount']
+        
+        # Tax and shipping come from the rate tables for the shipping address
+        address = self._shipping_address(cart, shipping_address_id)
+        tax = rate_engine.tax(subtotal - discount, address)
+        shipping = rate_engine.shipping(address, subtotal, self._weight(lines), shipping_method)
+        if shipping is None:
+            raise ValueError('Shipping method not available for this cart')
         
-        # Standard shipping rate
-        return Decimal('9.99')
+        # Calculate total
+        total = subtotal + tax + shipping - discount
+        
+        return {
+            'subtotal': float(subtotal),
+            'tax': float(tax),
+            'shipping': float(shipping),
+            'discount': float(discount),
+            'total': float(total),
+            'items_count': cart.get_total_quantity(),
+            'promotions': promotions['applied'],
+            'version': cart.version
+        }
+    
+    def get_shipping_options(self, user_id: Optional[UUID], session_id: Optional[str],
+                             shipping_address_id: Optional[UUID] = None) -> Dict[str, Any]:
+        """Shipping methods and prices for the current cart"""
+        cart = self.get_or_create_cart(user_id, session_id)
+        if not cart:
+            return {
+                'success': False,
+                'error': 'Cart not found'
+            }
+        
+        lines = self.cart_repo.get_pricing_lines(cart.id)
+        options = rate_engine.shipping_options(
+            self._shipping_address(cart, shipping_address_id),
+            cart.get_subtotal() if lines else 0,
+            self._weight(lines)
+        )
+        return {
+            'success': True,
+            'options': [{**option, 'price': float(option['price'])} for option in options]
+        }
+    
+    @staticmethod
+    def _shipping_address(cart: Cart, shipping_address_id: Optional[UUID]) -> Optional[Address]:
+        """The cart owner's address, or None (default rates) for guests and unknown ids"""
+        if not shipping_address_id or not cart.user_id:
+            return None
+        address = db.session.get(Address, shipping_address_id)
+        return address if address and address.user_id == cart.user_id else None
+    
+    @staticmethod
+    def _weight(lines) -> Decimal:
+        return sum((line['weight'] * line['quantity'] for line in lines), Decimal('0'))
+    
+    @staticmethod
+    def _totals_key(cart: Cart, address: Optional[Address],
+                    shipping_method: Optional[str] = None) -> str:
+        # Address edits and product weight/category changes alter tax and shipping too
+        address_part = f"{address.id}@{address.updated_at}" if address else '-'
+        return (
+            f"{TOTALS_CACHE_PREFIX}:{cart.id}:{cart.version}:{address_part}:"
+            f"{shipping_method or '-'}:{promotion_engine.version() or '-'}:"
+            f"{rate_engine.version() or '-'}:{catalog_version.version() or '-'}"
+        )
     
     def _track_cart_event(self, user_id: Optional[UUID], session_id: Optional[str],
                          event_type: str, variant_id: UUID, quantity: int):
@@ -418,6 +644,173 @@ class CartRepository(BaseRepository):
     
     def __init__(self):
         super().__init__(Cart)
+    
+    def get_version(self, user_id: Optional[UUID] = None,
+                    session_id: Optional[str] = None):
+        """Version of the active cart from one aggregate query, or None
+        
+        Covers the cart row, its items and the variants and products the
+        cart response embeds (names, prices, stock). Cart.version is bumped
+        by the CartItem listeners, so item changes count even when the
+        timestamps don't move.
+        """
+        if user_id:
+            owner_filter = Cart.user_id == user_id
+        elif session_id:
+            owner_filter = Cart.session_id == session_id
+        else:
+            return None
+        
+        row = self.db.query(
+            Cart.id,
+            Cart.updated_at,
+            Cart.version,
+            func.count(CartItem.id),
+            func.coalesce(func.sum(CartItem.quantity), 0),
+            func.max(CartItem.updated_at),
+            func.max(ProductVariant.updated_at),
+            func.max(Product.updated_at)
+        ).outerjoin(
+            CartItem, CartItem.cart_id == Cart.id
+        ).outerjoin(
+            ProductVariant, ProductVariant.id == CartItem.variant_id
+        ).outerjoin(
+            Product, Product.id == ProductVariant.product_id
+        ).filter(
+            owner_filter,
+            Cart.status == 'active'
+        ).group_by(Cart.id, Cart.updated_at, Cart.version).first()
+        
+        if row is None:
+            return None
+        
+        last_modified = max(filter(None, (row[1], row[5], row[6], row[7])), default=None)
+        return tuple(row), last_modified
+    
+    def merge_items(self, source_cart_id: UUID, target_cart_id: UUID) -> int:
+        """Upsert one cart's lines into another in a single statement
+        
+        Each line ends up with min(source + target quantity, stock). Prices are refreshed from the variant.
+        Inactive and out-of-stock variants are skipped. Returns the number
+        of lines inserted or updated.
+        """
+        dialect_insert, new_id = self._upsert_dialect()
+        
+        items = CartItem.__table__
+        variants = ProductVariant.__table__
+        existing = items.alias('existing')
+        
+        # Final quantity is computed here, with the target's current line
+        # joined in, so the conflict branch only has to copy it
+        wanted = items.c.quantity + func.coalesce(existing.c.quantity, 0)
+        capped = case((wanted < variants.c.stock, wanted), else_=variants.c.stock)
+        lines = select(
+            new_id, literal(target_cart_id, items.c.cart_id.type), items.c.variant_id,
+            capped, variants.c.price, func.now(), func.now()
+        ).select_from(items).join(
+            variants, variants.c.id == items.c.variant_id
+        ).outerjoin(
+            existing, (existing.c.cart_id == target_cart_id) & (existing.c.variant_id == items.c.variant_id)
+        ).where(
+            items.c.cart_id == source_cart_id,
+            variants.c.is_active.is_(True),
+            variants.c.stock > 0
+        )
+        
+        statement = dialect_insert(items).from_select(
+            ['id', 'cart_id', 'variant_id', 'quantity', 'price', 'created_at', 'updated_at'], lines
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=['cart_id', 'variant_id'],
+            set_={
+                'quantity': statement.excluded.quantity,
+                'price': statement.excluded.price,
+                'updated_at': func.now()
+            }
+        )
+        return self.db.execute(statement).rowcount
+    
+    def add_lines(self, cart_id: UUID, lines: list) -> int:
+        """Add (variant_id, quantity, price) lines to a cart in one statement
+        
+        Existing lines get the quantity added and the price refreshed.
+        Callers check stock first. Returns the number of lines written.
+        """
+        if not lines:
+            return 0
+        dialect_insert, _ = self._upsert_dialect()
+        items = CartItem.__table__
+        
+        statement = dialect_insert(items).values([
+            {'id': uuid4(), 'cart_id': cart_id, 'variant_id': variant_id,
+             'quantity': quantity, 'price': price}
+            for variant_id, quantity, price in lines
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=['cart_id', 'variant_id'],
+            set_={
+                'quantity': items.c.quantity + statement.excluded.quantity,
+                'price': statement.excluded.price,
+                'updated_at': func.now()
+            }
+        )
+        return self.db.execute(statement).rowcount
+    
+    def _upsert_dialect(self):
+        """INSERT ... ON CONFLICT construct and a SQL id generator for the bound database"""
+        dialect = self.db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            return dialect_insert, func.gen_random_uuid()
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            return dialect_insert, func.lower(func.hex(func.randomblob(16)))
+        raise NotImplementedError(f'Cart upserts are not supported on {dialect}')
+    
+    def get_pricing_lines(self, cart_id: UUID) -> list:
+        """Category, quantity and unit weight of each cart line, for promotions and shipping"""
+        rows = self.db.query(CartItem.quantity, Product.category_id, Product.weight).join(
+            ProductVariant, ProductVariant.id == CartItem.variant_id
+        ).join(
+            Product, Product.id == ProductVariant.product_id
+        ).filter(CartItem.cart_id == cart_id).all()
+        
+        return [
+            {'category_id': category_id, 'quantity': quantity, 'weight': weight or Decimal('0')}
+            for quantity, category_id, weight in rows
+        ]
+    
+    def get_order_lines(self, cart_id: UUID) -> list:
+        """Cart lines with the variant and product fields an order item keeps
+        
+        One query for the whole cart instead of lazy-loading each line's
+        variant and product.
+        """
+        rows = self.db.query(
+            CartItem.variant_id, CartItem.quantity, CartItem.price,
+            ProductVariant.name, ProductVariant.sku, ProductVariant.attributes,
+            Product.name, Product.sku
+        ).join(
+            ProductVariant, ProductVariant.id == CartItem.variant_id
+        ).outerjoin(
+            Product, Product.id == ProductVariant.product_id
+        ).filter(CartItem.cart_id == cart_id).all()
+        
+        return [
+            {
+                'variant_id': variant_id,
+                'quantity': quantity,
+                'price': price,
+                'total': price * quantity,
+                'product_name': product_name or '',
+                'product_sku': product_sku or '',
+                'variant_name': variant_name,
+                'variant_sku': variant_sku,
+                'variant_attributes': attributes or {}
+            }
+            for (variant_id, quantity, price, variant_name, variant_sku, attributes,
+                 product_name, product_sku) in rows
+        ]
 
 
 # Import repositories
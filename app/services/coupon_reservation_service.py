@@ -0,0 +1,237 @@
+"""Coupon usage reservations with atomic Redis counters"""
+
+import logging
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID, uuid4
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app.models import Coupon
+from app.extensions import db, redis_client
+
+logger = logging.getLogger(__name__)
+
+PENDING_USAGE_KEY = 'coupons:pending_usage'
+RECONCILING_KEY = 'coupons:reconciling'
+RESERVED_COUPONS_KEY = 'coupons:reserved'
+
+# KEYS: used, holds, reserved set
+# ARGV: holder, now, expires_at, limit (-1 = none), seed for used, coupon id
+RESERVE_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[5], 'NX')
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+if redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    return 1
+end
+local limit = tonumber(ARGV[4])
+if limit >= 0 and tonumber(redis.call('GET', KEYS[1])) + redis.call('ZCARD', KEYS[2]) >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[6])
+return 1
+"""
+
+# KEYS: used, holds, per-user counts, pending usage
+# ARGV: holder, now, limit (-1 = none), seed for used, user id ('' = guest),
+#       per-user limit (0 = none), the user's redemptions in the database, coupon id
+CONVERT_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[4], 'NX')
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    local limit = tonumber(ARGV[3])
+    if limit >= 0 and tonumber(redis.call('GET', KEYS[1])) + redis.call('ZCARD', KEYS[2]) >= limit then
+        return 'exhausted'
+    end
+end
+local per_user = tonumber(ARGV[6])
+if ARGV[5] ~= '' and per_user > 0 then
+    local user_used = tonumber(redis.call('HGET', KEYS[3], ARGV[5]) or '0')
+    if user_used < tonumber(ARGV[7]) then
+        -- Catch up with uses recorded while Redis was unavailable
+        user_used = tonumber(ARGV[7])
+        redis.call('HSET', KEYS[3], ARGV[5], user_used)
+    end
+    if user_used >= per_user then
+        return 'user_limit'
+    end
+    redis.call('HINCRBY', KEYS[3], ARGV[5], 1)
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('INCR', KEYS[1])
+redis.call('HINCRBY', KEYS[4], ARGV[8], 1)
+return 'ok'
+"""
+
+# KEYS: pending usage, reconciling; ARGV: batch id, coupon ids...
+# Moves each coupon's pending uses to the reconciling hash as "<batch>:<amount>",
+# unless an earlier batch for it is still there (it is applied first)
+CLAIM_SCRIPT = """
+for i = 2, #ARGV do
+    if redis.call('HEXISTS', KEYS[2], ARGV[i]) == 0 then
+        local amount = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+        if amount ~= 0 then
+            redis.call('HDEL', KEYS[1], ARGV[i])
+            redis.call('HSET', KEYS[2], ARGV[i], ARGV[1] .. ':' .. amount)
+        end
+    end
+end
+return 1
+"""
+
+
+class CouponReservationService:
+    """Exact coupon usage limits under flash-sale load
+
+    Applying a coupon reserves one use in Redis for the cart; checkout
+    converts the reservation into a redemption. Both steps are single Lua
+    scripts, so the limit check and the counter update can't interleave
+    with other requests and no database row is locked. Reservations expire
+    after COUPON_RESERVATION_TTL seconds and are released when the coupon is
+    removed, so abandoned carts give their use back.
+
+    Redeemed uses are queued in a pending hash and added to
+    ``coupons.usage_count`` in batches by reconcile(). When Redis is down
+    the methods return None. Callers then refuse coupons with a
+    usage_limit, since usage_count alone can't say whether a use is left,
+    and redeem other coupons through the conditional SQL UPDATE in
+    CouponRepository. A user's Redis count is raised to their redemptions
+    in the database on every conversion, so uses made meanwhile count.
+    """
+
+    @staticmethod
+    def _keys(coupon_id) -> Dict[str, str]:
+        prefix = f'coupon:{coupon_id}'
+        return {
+            'used': f'{prefix}:used',
+            'holds': f'{prefix}:holds',
+            'users': f'{prefix}:users',
+        }
+
+    @staticmethod
+    def _limit(coupon: Coupon) -> int:
+        return coupon.usage_limit if coupon.usage_limit is not None else -1
+
+    def reserve(self, coupon: Coupon, holder: str) -> Optional[bool]:
+        """Hold one use of the coupon for holder (a cart id)"""
+        keys = self._keys(coupon.id)
+        now = time.time()
+        ttl = current_app.config.get('COUPON_RESERVATION_TTL', 900)
+        try:
+            reserved = redis_client.register_script(RESERVE_SCRIPT)(
+                keys=[keys['used'], keys['holds'], RESERVED_COUPONS_KEY],
+                args=[str(holder), now, now + ttl, self._limit(coupon), coupon.usage_count, str(coupon.id)]
+            )
+            return bool(reserved)
+        except Exception:
+            logger.warning("Coupon reservation unavailable for %s", coupon.code)
+            return None
+
+    def release(self, coupon_id, holder: str):
+        """Give back a reservation that won't be converted"""
+        try:
+            redis_client.zrem(self._keys(coupon_id)['holds'], str(holder))
+        except Exception:
+            pass
+
+    def convert(self, coupon: Coupon, holder: str, user_id: Optional[UUID],
+                user_usage_count: int) -> Optional[str]:
+        """Turn holder's reservation into a redemption
+
+        Returns 'ok', 'exhausted' or 'user_limit', or None when Redis is
+        unavailable. A reservation that already expired is still converted
+        if the coupon has capacity left.
+        """
+        keys = self._keys(coupon.id)
+        try:
+            return redis_client.register_script(CONVERT_SCRIPT)(
+                keys=[keys['used'], keys['holds'], keys['users'], PENDING_USAGE_KEY],
+                args=[
+                    str(holder), time.time(), self._limit(coupon), coupon.usage_count,
+                    str(user_id) if user_id else '', coupon.usage_limit_per_user or 0,
+                    user_usage_count, str(coupon.id)
+                ]
+            )
+        except Exception:
+            logger.warning("Coupon redemption counters unavailable for %s", coupon.code)
+            return None
+
+    def revert(self, coupon_id, user_id: Optional[UUID]):
+        """Undo a conversion whose checkout transaction failed"""
+        keys = self._keys(coupon_id)
+        try:
+            pipe = redis_client.pipeline()
+            pipe.decr(keys['used'])
+            if user_id:
+                pipe.hincrby(keys['users'], str(user_id), -1)
+            pipe.hincrby(PENDING_USAGE_KEY, str(coupon_id), -1)
+            pipe.execute()
+        except Exception:
+            logger.warning("Failed to revert coupon redemption for %s", coupon_id)
+
+    def reconcile(self, batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """Apply pending redemptions to coupons.usage_count and sweep expired holds
+
+        Pending uses are first moved to a reconciling hash under a batch id.
+        The UPDATE that adds them records that id on the coupon and skips
+        coupons that already carry it, and the entry is deleted after the
+        commit. A run that dies anywhere in between is finished by the next
+        one without counting any use twice.
+        """
+        if batch_size is None:
+            batch_size = current_app.config.get('COUPON_RECONCILE_BATCH', 500)
+
+        # Finish an interrupted run before claiming anything new
+        coupons, uses = self._apply_claimed(batch_size)
+
+        pending = [
+            coupon_id for coupon_id, amount in redis_client.hgetall(PENDING_USAGE_KEY).items()
+            if int(amount) != 0
+        ]
+        claim = redis_client.register_script(CLAIM_SCRIPT)
+        for start in range(0, len(pending), batch_size):
+            claim(keys=[PENDING_USAGE_KEY, RECONCILING_KEY], args=[uuid4().hex, *pending[start:start + batch_size]])
+        updated, applied = self._apply_claimed(batch_size)
+        coupons += updated
+        uses += applied
+
+        now = time.time()
+        released = 0
+        for coupon_id in redis_client.smembers(RESERVED_COUPONS_KEY):
+            holds_key = self._keys(coupon_id)['holds']
+            released += redis_client.zremrangebyscore(holds_key, '-inf', now)
+            if redis_client.zcard(holds_key) == 0:
+                redis_client.srem(RESERVED_COUPONS_KEY, coupon_id)
+
+        return {'coupons': coupons, 'uses': uses, 'released': released}
+
+    @staticmethod
+    def _apply_claimed(batch_size: int):
+        """Add the reconciling hash to usage_count; returns (coupons, uses) applied"""
+        claimed = []
+        for coupon_id, entry in redis_client.hgetall(RECONCILING_KEY).items():
+            batch_id, amount = entry.split(':')
+            claimed.append((coupon_id, batch_id, int(amount)))
+
+        for start in range(0, len(claimed), batch_size):
+            batch = claimed[start:start + batch_size]
+            try:
+                for coupon_id, batch_id, amount in batch:
+                    # A coupon already carrying batch_id got this batch before a crash
+                    db.session.query(Coupon).filter(
+                        Coupon.id == UUID(coupon_id),
+                        or_(Coupon.reconcile_batch.is_(None), Coupon.reconcile_batch != batch_id)
+                    ).update(
+                        {Coupon.usage_count: Coupon.usage_count + amount, Coupon.reconcile_batch: batch_id},
+                        synchronize_session=False
+                    )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            redis_client.hdel(RECONCILING_KEY, *(coupon_id for coupon_id, _, _ in batch))
+
+        return len(claimed), sum(amount for _, _, amount in claimed)
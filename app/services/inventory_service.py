@@ -0,0 +1,295 @@
+"""Stock adjustments recorded in the inventory ledger"""
+
+import csv
+import logging
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, or_, select, update
+
+from app.models import InventoryLedger, Product, ProductVariant, Wishlist
+from app.models.serialization import loads
+from app.extensions import db
+from app.services.wishlist_alert_service import BACK_IN_STOCK, dispatch_alerts
+
+logger = logging.getLogger(__name__)
+
+VARIANT_NOT_FOUND = 'Product variant not found'
+NEGATIVE_STOCK = 'Stock cannot be negative'
+
+
+def _field(record: Dict[str, Any], name: str):
+    value = record.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value == '' else value
+
+
+def _integer(value, name: str) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f'{name} must be an integer')
+    try:
+        number = int(value) if isinstance(value, int) else int(str(value))
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer')
+    return number
+
+
+def parse_row(record) -> Dict[str, Any]:
+    """Validate one adjustment row: sku or variant_id, and delta or absolute"""
+    if not isinstance(record, dict):
+        raise ValueError('Row must be an object')
+
+    variant_id, sku = _field(record, 'variant_id'), _field(record, 'sku')
+    if variant_id is not None:
+        try:
+            variant_id = UUID(str(variant_id))
+        except ValueError:
+            raise ValueError('Invalid variant_id')
+    elif sku is None:
+        raise ValueError('sku or variant_id is required')
+
+    delta, absolute = _field(record, 'delta'), _field(record, 'absolute')
+    if (delta is None) == (absolute is None):
+        raise ValueError('Exactly one of delta or absolute is required')
+    if delta is not None:
+        delta = _integer(delta, 'delta')
+    else:
+        absolute = _integer(absolute, 'absolute')
+        if absolute < 0:
+            raise ValueError(NEGATIVE_STOCK)
+
+    reason = _field(record, 'reason')
+    return {
+        'variant_id': variant_id,
+        'sku': None if variant_id is not None else str(sku),
+        'delta': delta,
+        'absolute': absolute,
+        'reason': str(reason)[:255] if reason is not None else None
+    }
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    """(row number, record) pairs from CSV with a header row"""
+    reader = csv.DictReader(lines)
+    columns = set(reader.fieldnames or ())
+    if not columns & {'sku', 'variant_id'} or not columns & {'delta', 'absolute'}:
+        raise ValueError('CSV header needs sku or variant_id, and delta or absolute')
+    for number, record in enumerate(reader, 1):
+        yield number, record
+
+
+def parse_ndjson(lines: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    """(line number, record) pairs from newline-delimited JSON; undecodable lines give None"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, loads(line)
+        except ValueError:
+            yield number, None
+
+
+class InventoryService:
+    """Service for stock adjustments
+
+    Adjustments are applied in batches: one query resolves and locks
+    (SELECT ... FOR UPDATE, in id order) every variant a batch names,
+    new stock levels are worked out in memory row by row, and one
+    executemany UPDATE plus one bulk INSERT into inventory_ledger write
+    the batch before it commits. Rows that fail validation or would take
+    stock below zero are reported and skipped; the rest of the batch
+    still applies.
+
+    These writes bypass the ORM, so variants that come back in stock
+    queue their wishlist alerts here rather than through the mapper
+    listener.
+    """
+
+    def adjust(self, variant_id: UUID, adjustment: int, reason: Optional[str] = None,
+               actor_id: Optional[UUID] = None) -> Dict[str, Any]:
+        """Change one variant's stock by adjustment"""
+        result = self.bulk_adjust(
+            [(1, {'variant_id': str(variant_id), 'delta': adjustment, 'reason': reason})],
+            actor_id=actor_id, source='adjust'
+        )
+        if result['errors']:
+            error = result['errors'][0]['error']
+            status_code = 404 if error == VARIANT_NOT_FOUND else 400
+            return {'success': False, 'error': error, 'status_code': status_code}
+        return {'success': True, 'entry': result['entries'][0], 'products': result['products']}
+
+    def bulk_adjust(self, rows: Iterable[Tuple[int, Any]], reason: Optional[str] = None,
+                    actor_id: Optional[UUID] = None, source: str = 'bulk',
+                    on_batch: Optional[Callable[[set], None]] = None) -> Dict[str, Any]:
+        """Apply (row number, record) adjustments and report per-row errors
+
+        'products' in the result holds the (product_id, category_id) pairs
+        whose stock changed, for cache invalidation; on_batch, if given, is
+        called with each committed batch's pairs as soon as it commits.
+
+        rows is usually a lazy parser over the request body. If it fails
+        part way (undecodable bytes, a bad CSV header or line), reading
+        stops, the batches before stay applied and 'aborted' says why.
+        """
+        config = current_app.config
+        batch_size = config.get('INVENTORY_BULK_BATCH', 2000)
+        max_errors = config.get('INVENTORY_BULK_MAX_ERRORS', 1000)
+
+        batch_id = uuid4()
+        stats = {'batch_id': str(batch_id), 'rows': 0, 'applied': 0, 'failed': 0, 'errors': [], 'aborted': None}
+        entries: List[Dict[str, Any]] = []
+        products = set()
+        started = time.perf_counter()
+
+        rows = self._guarded(rows, stats)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            stats['rows'] += len(chunk)
+
+            parsed, errors = [], []
+            for number, record in chunk:
+                try:
+                    parsed.append((number, record, parse_row(record)))
+                except ValueError as e:
+                    errors.append(self._error(number, record, str(e)))
+
+            try:
+                ledger, row_errors, restocked, touched = self._apply(
+                    parsed, reason, actor_id, source, batch_id
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Inventory batch %s failed", batch_id)
+                ledger, restocked, touched = [], [], set()
+                row_errors = [self._error(number, record, 'Failed to apply batch')
+                              for number, record, _ in parsed]
+
+            errors.extend(row_errors)
+            errors.sort(key=lambda error: error['row'])
+            stats['applied'] += len(ledger)
+            stats['failed'] += len(errors)
+            stats['errors'].extend(errors[:max(max_errors - len(stats['errors']), 0)])
+            products |= touched
+            if touched and on_batch is not None:
+                on_batch(touched)
+            if source == 'adjust':
+                entries.extend(ledger)
+            if restocked:
+                dispatch_alerts([(variant_id, BACK_IN_STOCK, None, None) for variant_id in restocked])
+
+        elapsed = time.perf_counter() - started
+        stats.update({
+            'errors_truncated': stats['failed'] > len(stats['errors']),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(stats['rows'] / elapsed, 1) if elapsed else 0.0,
+            'entries': entries,
+            'products': products
+        })
+        return stats
+
+    def _apply(self, parsed: List[tuple], reason: Optional[str], actor_id: Optional[UUID],
+               source: str, batch_id: UUID):
+        """Write one batch; returns ledger rows, row errors, restocked variant ids and touched products"""
+        variant_ids = {row['variant_id'] for _, _, row in parsed if row['variant_id'] is not None}
+        skus = {row['sku'] for _, _, row in parsed if row['variant_id'] is None}
+        conditions = []
+        if variant_ids:
+            conditions.append(ProductVariant.id.in_(variant_ids))
+        if skus:
+            conditions.append(ProductVariant.sku.in_(skus))
+        if not conditions:
+            return [], [], [], set()
+
+        # Locked in id order so concurrent uploads can't deadlock
+        variants = db.session.execute(
+            select(ProductVariant.id, ProductVariant.sku, ProductVariant.stock, ProductVariant.is_active,
+                   ProductVariant.product_id, Product.category_id)
+            .join(Product, Product.id == ProductVariant.product_id)
+            .where(or_(*conditions))
+            .order_by(ProductVariant.id)
+            .with_for_update(of=ProductVariant)
+        ).all()
+        by_id = {variant.id: variant for variant in variants}
+        by_sku = {variant.sku: variant for variant in variants}
+        stock = {variant.id: variant.stock for variant in variants}
+
+        ledger, errors = [], []
+        for number, record, row in parsed:
+            if row['variant_id'] is not None:
+                variant = by_id.get(row['variant_id'])
+            else:
+                variant = by_sku.get(row['sku'])
+            if variant is None:
+                errors.append(self._error(number, record, VARIANT_NOT_FOUND))
+                continue
+
+            previous = stock[variant.id]
+            new_stock = previous + row['delta'] if row['delta'] is not None else row['absolute']
+            if new_stock < 0:
+                errors.append(self._error(number, record, f'{NEGATIVE_STOCK} (current stock {previous})'))
+                continue
+
+            stock[variant.id] = new_stock
+            ledger.append({
+                'variant_id': variant.id,
+                'sku': variant.sku,
+                'delta': new_stock - previous,
+                'previous_stock': previous,
+                'new_stock': new_stock,
+                'reason': row['reason'] or reason,
+                'source': source,
+                'batch_id': batch_id,
+                'actor_id': actor_id
+            })
+
+        changed = [(variant_id, level) for variant_id, level in stock.items()
+                   if level != by_id[variant_id].stock]
+        if changed:
+            table = ProductVariant.__table__
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('b_id')).values(stock=bindparam('b_stock')),
+                [{'b_id': variant_id, 'b_stock': level} for variant_id, level in changed]
+            )
+        if ledger:
+            db.session.execute(insert(InventoryLedger.__table__), ledger)
+
+        restocked = [variant_id for variant_id, level in changed
+                     if level > 0 and by_id[variant_id].stock <= 0 and by_id[variant_id].is_active]
+        if restocked:
+            # Only variants someone is waiting for need a match task
+            restocked = db.session.execute(
+                select(Wishlist.variant_id).where(Wishlist.variant_id.in_(restocked)).distinct()
+            ).scalars().all()
+        touched = {(by_id[variant_id].product_id, by_id[variant_id].category_id) for variant_id, _ in changed}
+        return ledger, errors, restocked, touched
+
+    @staticmethod
+    def _guarded(rows: Iterable[Tuple[int, Any]], stats: Dict[str, Any]) -> Iterator[Tuple[int, Any]]:
+        """rows until the source fails; the failure goes in stats['aborted']"""
+        rows, last = iter(rows), 0
+        while True:
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            except (ValueError, csv.Error) as e:
+                stats['aborted'] = f'Stopped reading after row {last}: {e}'
+                return
+            last = row[0]
+            yield row
+
+    @staticmethod
+    def _error(number: int, record, message: str) -> Dict[str, Any]:
+        error = {'row': number, 'error': message}
+        if isinstance(record, dict):
+            for key in ('sku', 'variant_id'):
+                if record.get(key):
+                    error[key] = str(record[key])
+        return error
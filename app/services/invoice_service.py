@@ -0,0 +1,227 @@
+"""Invoice rendering from flat order snapshots"""
+
+import logging
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from flask import current_app
+from jinja2 import Environment
+
+from app.extensions import redis_client
+from app.models.serialization import dumps
+from app.repositories import OrderRepository
+
+logger = logging.getLogger(__name__)
+
+# Orders in these statuses no longer change, so their invoices are cached
+CLOSED_STATUSES = frozenset({'delivered', 'refunded'})
+CACHE_PREFIX = 'invoice'
+
+INVOICE_FORMATS = {
+    'json': 'application/json',
+    'html': 'text/html; charset=utf-8',
+}
+
+_environment = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+_environment.filters['money'] = lambda value: f'{value or 0:.2f}'
+
+# Compiled once at import; rendering only runs the generated code
+HTML_TEMPLATE = _environment.from_string('''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Invoice {{ invoice_number }}</title>
+</head>
+<body>
+<h1>Invoice {{ invoice_number }}</h1>
+<p>Order {{ order.order_number }}<br>
+Date: {{ invoice_date[:10] }}<br>
+Status: {{ status }}</p>
+{% for title, address in (('Bill to', order.billing_address), ('Ship to', order.shipping_address)) %}
+{% if address %}
+<h2>{{ title }}</h2>
+<address>{{ address.line1 }}{% if address.line2 %}<br>{{ address.line2 }}{% endif %}<br>
+{{ address.city }}, {{ address.state }} {{ address.postal_code }}<br>
+{{ address.country }}</address>
+{% endif %}
+{% endfor %}
+<table>
+<thead><tr><th>SKU</th><th>Item</th><th>Qty</th><th>Price</th><th>Discount</th><th>Total</th></tr></thead>
+<tbody>
+{% for item in order['items'] %}
+<tr><td>{{ item.variant_sku }}</td><td>{{ item.product_name }}{% if item.variant_name %} ({{ item.variant_name }}){% endif %}</td><td>{{ item.quantity }}</td><td>{{ item.price|money }}</td><td>{{ item.discount_amount|money }}</td><td>{{ item.total|money }}</td></tr>
+{% endfor %}
+</tbody>
+</table>
+<table>
+<tr><th>Subtotal</th><td>{{ order.subtotal|money }} {{ order.currency }}</td></tr>
+<tr><th>Discount</th><td>-{{ order.discount_amount|money }} {{ order.currency }}</td></tr>
+<tr><th>Tax</th><td>{{ order.tax_amount|money }} {{ order.currency }}</td></tr>
+<tr><th>Shipping</th><td>{{ order.shipping_amount|money }} {{ order.currency }}</td></tr>
+<tr><th>Total</th><td>{{ order.total|money }} {{ order.currency }}</td></tr>
+</table>
+<p>Payment method: {{ order.payment_method }}</p>
+</body>
+</html>
+''')
+
+
+class _ZipStream:
+    """Write-only buffer that zipfile writes to and the response drains
+
+    It has no tell() or seek(), so zipfile writes each member with a
+    trailing data descriptor and never goes back to patch headers.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class InvoiceService:
+    """Service for rendering single invoices and bulk invoice exports
+
+    Invoices are rendered from flat snapshots of order and item columns
+    (see OrderRepository.get_invoice_snapshot), not from the ORM graph, so
+    one order costs two narrow queries and a batch of orders costs two
+    queries in total. Invoices of closed orders are cached in Redis; the
+    key includes the order's updated_at, so any later change misses.
+    """
+
+    def __init__(self):
+        self.order_repo = OrderRepository()
+
+    # ----- rendering -----
+
+    @staticmethod
+    def build_invoice(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Invoice document for an order snapshot with its items"""
+        issued_at = snapshot['created_at'].isoformat()
+        return {
+            'invoice_number': f"INV-{snapshot['order_number']}",
+            'invoice_date': issued_at,
+            'due_date': issued_at,  # Paid at checkout
+            'status': 'paid' if snapshot['payment_status'] == 'captured' else 'pending',
+            'order': snapshot
+        }
+
+    def render(self, snapshot: Dict[str, Any], fmt: str = 'json') -> str:
+        """Render an order snapshot (with items) as a json or html invoice"""
+        invoice = self.build_invoice(snapshot)
+        if fmt == 'html':
+            return HTML_TEMPLATE.render(invoice)
+        return dumps(invoice).decode('utf-8')
+
+    # ----- single invoice -----
+
+    def get_invoice(self, order_id: UUID, user_id: Optional[UUID] = None,
+                    fmt: str = 'json') -> Optional[str]:
+        """Rendered invoice for one order, or None when the order isn't found"""
+        snapshot = self.order_repo.get_invoice_snapshot(order_id, user_id)
+        if snapshot is None:
+            return None
+
+        cache_key = self._cache_key(snapshot, fmt)
+        if cache_key:
+            try:
+                cached = redis_client.get(cache_key)
+                if cached is not None:
+                    return cached
+            except Exception:
+                logger.warning("Invoice cache unavailable")
+
+        snapshot['items'] = self.order_repo.get_invoice_items([snapshot['id']])[snapshot['id']]
+        body = self.render(snapshot, fmt)
+
+        if cache_key:
+            self._store({cache_key: body})
+        return body
+
+    # ----- bulk export -----
+
+    def iter_rendered(self, start: datetime, end: datetime, fmt: str = 'json') -> Iterator[tuple]:
+        """(snapshot, rendered invoice) for orders created in [start, end), streamed by batch"""
+        batch_size = current_app.config.get('INVOICE_EXPORT_BATCH_SIZE', 500)
+        for batch in self.order_repo.iter_invoice_snapshots(start, end, batch_size):
+            keys = [self._cache_key(snapshot, fmt) for snapshot in batch]
+            cached = self._load([key for key in keys if key])
+
+            missing = [snapshot['id'] for snapshot, key in zip(batch, keys) if cached.get(key) is None]
+            items = self.order_repo.get_invoice_items(missing)
+
+            rendered = {}
+            for snapshot, key in zip(batch, keys):
+                body = cached.get(key)
+                if body is None:
+                    snapshot['items'] = items[snapshot['id']]
+                    body = self.render(snapshot, fmt)
+                    if key:
+                        rendered[key] = body
+                yield snapshot, body
+
+            self._store(rendered)
+
+    def export_ndjson(self, start: datetime, end: datetime) -> Iterator[bytes]:
+        """JSON invoices for a date range, one per line"""
+        for _, body in self.iter_rendered(start, end, 'json'):
+            yield body.encode('utf-8') + b'\n'
+
+    def export_zip(self, start: datetime, end: datetime) -> Iterator[bytes]:
+        """HTML invoices for a date range as a ZIP archive, written as it streams"""
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for snapshot, body in self.iter_rendered(start, end, 'html'):
+                member = zipfile.ZipInfo(
+                    f"INV-{snapshot['order_number']}.html",
+                    date_time=snapshot['created_at'].timetuple()[:6]
+                )
+                member.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(member, body)
+                yield stream.drain()
+        # Central directory
+        yield stream.drain()
+
+    # ----- cache -----
+
+    @staticmethod
+    def _cache_key(snapshot: Dict[str, Any], fmt: str) -> Optional[str]:
+        if snapshot['status'] not in CLOSED_STATUSES:
+            return None
+        version = snapshot['updated_at'].isoformat() if snapshot['updated_at'] else ''
+        return f"{CACHE_PREFIX}:{fmt}:{snapshot['id']}:{version}"
+
+    @staticmethod
+    def _load(keys: List[str]) -> Dict[str, str]:
+        if not keys:
+            return {}
+        try:
+            return dict(zip(keys, redis_client.mget(keys)))
+        except Exception:
+            logger.warning("Invoice cache unavailable")
+            return {}
+
+    @staticmethod
+    def _store(bodies: Dict[str, str]):
+        if not bodies:
+            return
+        ttl = current_app.config.get('INVOICE_CACHE_TTL', 604800)
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key, body in bodies.items():
+                pipe.set(key, body, ex=ttl)
+            pipe.execute()
+        except Exception:
+            logger.warning("Failed to cache %s invoices", len(bodies))
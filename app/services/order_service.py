@@ -0,0 +1,328 @@
+"""Order service: checkout core and post-checkout processing"""
+
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from app.models import Address, Order, OrderItem, ProductMetric, ProductVariant, UserEvent
+from app.repositories import OrderRepository, ProductVariantRepository
+from app.extensions import db
+from app.services.cart_service import CartService
+from app.services.product_service import ProductService
+from app.services.promotion_engine import invalidate_promotions, promotion_engine
+
+logger = logging.getLogger(__name__)
+
+# Payment methods captured right away (simplified gateway)
+INSTANT_CAPTURE_METHODS = ('credit_card', 'paypal')
+
+PROMOTION_UNAVAILABLE = 'A promotion applied to your cart is no longer available, please review your totals'
+
+# Fulfilment stages measured by the SLA report, in order
+SLA_STAGES = ('placed', 'confirmed', 'shipped', 'delivered')
+# Upper bounds (hours) of the SLA histogram buckets; one overflow bucket follows
+SLA_BUCKETS_HOURS = (1, 4, 12, 24, 48, 72, 120, 168)
+
+
+class OrderService:
+    """Service for checkout and order follow-up work
+
+    checkout() only does what must happen before the customer gets an
+    answer: validate the cart, reserve stock, create the order and redeem
+    the coupon, in one transaction. Payment capture, the confirmation email
+    and analytics are queued as Celery tasks (see app.tasks) after commit,
+    so slow downstream work doesn't add to checkout latency or fail it.
+    """
+
+    def __init__(self):
+        self.cart_service = CartService()
+        self.product_service = ProductService()
+        self.order_repo = OrderRepository()
+        self.variant_repo = ProductVariantRepository()
+
+    # ----- synchronous core -----
+
+    def checkout(self, user_id: UUID, data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Turn the user's cart into a pending order
+
+        Failures inside the order transaction (stock, coupon limits) set
+        'order_attempted', as opposed to request or cart validation errors.
+        """
+        if not data:
+            return {'success': False, 'error': 'Request body required'}
+
+        for field in ('shipping_address_id', 'billing_address_id', 'payment_method'):
+            if not data.get(field):
+                return {'success': False, 'error': f'{field} is required'}
+
+        try:
+            shipping_address_id = UUID(data['shipping_address_id'])
+            billing_address_id = UUID(data['billing_address_id'])
+        except (TypeError, ValueError):
+            return {'success': False, 'error': 'Invalid UUID format'}
+
+        cart = self.cart_service.get_or_create_cart(user_id, None)
+        if not cart or cart.is_empty():
+            return {'success': False, 'error': 'Cart is empty'}
+
+        validation_result = self.cart_service.validate_cart(user_id, None)
+        if not validation_result['valid']:
+            return {
+                'success': False,
+                'error': 'Cart validation failed',
+                'details': validation_result['errors']
+            }
+
+        # Optional guard: the client sends the cart version its totals came from
+        expected_version = data.get('cart_version')
+        if expected_version is not None and str(expected_version) != str(cart.version):
+            return {
+                'success': False,
+                'error': 'Cart changed since the totals were shown',
+                'status_code': 409
+            }
+
+        addresses = {
+            address.id: address
+            for address in db.session.query(Address).filter(
+                Address.id.in_({shipping_address_id, billing_address_id}),
+                Address.user_id == user_id
+            )
+        }
+        shipping_address = addresses.get(shipping_address_id)
+        billing_address = addresses.get(billing_address_id)
+        if not shipping_address or not billing_address:
+            return {'success': False, 'error': 'Invalid address'}
+
+        # Same cache entry as /cart/totals, so the order gets the figures the customer saw
+        totals_result = self.cart_service.calculate_totals(
+            user_id, None, shipping_address_id, data.get('shipping_method')
+        )
+        if not totals_result['success']:
+            if totals_result['error'] != 'Failed to calculate totals':
+                return {'success': False, 'error': totals_result['error']}
+            return {'success': False, 'error': 'Failed to calculate totals', 'status_code': 500}
+        totals = totals_result['totals']
+
+        redemption = None
+        try:
+            order = Order(
+                user_id=user_id,
+                status='pending',
+                payment_status='pending',
+                subtotal=totals['subtotal'],
+                tax_amount=totals['tax'],
+                shipping_amount=totals['shipping'],
+                discount_amount=totals['discount'],
+                total=totals['total'],
+                currency='USD',
+                shipping_address=self._address_snapshot(shipping_address),
+                billing_address=self._address_snapshot(billing_address),
+                payment_method=data['payment_method'],
+                notes=data.get('notes'),
+                order_metadata={'shipping_method': data['shipping_method']} if data.get('shipping_method') else {}
+            )
+            order.record_event('placed', actor_id=user_id)
+            db.session.add(order)
+            db.session.flush()  # Get order ID
+
+            lines = self.cart_service.cart_repo.get_order_lines(cart.id)
+            for line in lines:
+                # Conditional UPDATE: stock is checked and taken in one statement
+                if not self.variant_repo.reserve_stock(line['variant_id'], line['quantity']):
+                    db.session.rollback()
+                    return {
+                        'success': False,
+                        'error': f"Insufficient stock for {line['variant_sku']}",
+                        'order_attempted': True
+                    }
+            self.order_repo.add_items(order.id, lines)
+
+            # Redeem the cart's coupon; limits are enforced atomically here
+            redemption = self.cart_service.redeem_coupon(
+                cart, user_id, order.id, Decimal(str(totals['subtotal']))
+            )
+            if not redemption['success']:
+                db.session.rollback()
+                return {'success': False, 'error': redemption['error'], 'order_attempted': True}
+
+            # Count automatic promotions applied to this order
+            if not promotion_engine.record_usage(
+                promotion['rule_id'] for promotion in totals.get('promotions', [])
+            ):
+                db.session.rollback()
+                # New totals leave out the used-up promotion
+                invalidate_promotions()
+                self.cart_service.cancel_redemption(redemption)
+                return {'success': False, 'error': PROMOTION_UNAVAILABLE, 'order_attempted': True}
+
+            cart.status = 'converted'
+            cart.converted_at = datetime.utcnow()
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.cart_service.cancel_redemption(redemption)
+            logger.exception("Checkout failed for user %s", user_id)
+            return {'success': False, 'error': 'Failed to create order', 'status_code': 500}
+
+        # Purchases change what we'd recommend to this user
+        self.product_service.invalidate_recommendations(user_id)
+
+        self.dispatch_post_checkout(order.id)
+
+        return {'success': True, 'order': order}
+
+    @staticmethod
+    def _address_snapshot(address: Address) -> Dict[str, Any]:
+        return {
+            'line1': address.line1,
+            'line2': address.line2,
+            'city': address.city,
+            'state': address.state,
+            'postal_code': address.postal_code,
+            'country': address.country
+        }
+
+    # ----- post-checkout tasks -----
+
+    def dispatch_post_checkout(self, order_id: UUID):
+        """Queue the follow-up work for a committed order"""
+        from app import tasks
+
+        tasks.enqueue(tasks.capture_payment, str(order_id))
+        tasks.enqueue(tasks.record_order_analytics, str(order_id))
+
+    def capture_payment(self, order_id: UUID) -> Dict[str, Any]:
+        """Capture payment for a pending order (simplified gateway)"""
+        order = self.order_repo.get_by_id(order_id)
+        if not order:
+            return {'success': False, 'error': 'Order not found'}
+
+        if order.payment_method not in INSTANT_CAPTURE_METHODS:
+            return {'success': True, 'captured': False}
+
+        try:
+            # Conditional on the order still being pending, so retries are no-ops
+            captured = self.order_repo.mark_payment_captured(order_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if captured:
+            from app import tasks
+            tasks.enqueue(tasks.send_order_confirmation, str(order_id))
+
+        return {'success': True, 'captured': captured}
+
+    def send_order_confirmation(self, order_id: UUID) -> Dict[str, Any]:
+        """Send the order confirmation email"""
+        order = self.order_repo.get_by_id(order_id)
+        if not order or not order.user:
+            return {'success': False, 'error': 'Order not found'}
+
+        # No mail backend is configured yet; log what would be sent
+        logger.info("Order confirmation %s for %s", order.order_number, order.user.email)
+        return {'success': True}
+
+    def record_order_analytics(self, order_id: UUID) -> Dict[str, Any]:
+        """Record the purchase event and per-product daily metrics"""
+        order = self.order_repo.get_by_id(order_id)
+        if not order:
+            return {'success': False, 'error': 'Order not found'}
+
+        sold = defaultdict(lambda: [0, 0.0])
+        for product_id, quantity, total in db.session.query(
+            ProductVariant.product_id, OrderItem.quantity, OrderItem.total
+        ).join(
+            ProductVariant, ProductVariant.id == OrderItem.variant_id
+        ).filter(OrderItem.order_id == order_id):
+            sold[product_id][0] += quantity
+            sold[product_id][1] += float(total)
+
+        day = datetime.combine(order.created_at.date(), dt_time.min)
+        try:
+            db.session.add(UserEvent.create_event(
+                'order_created',
+                'Order Created',
+                user_id=order.user_id,
+                properties={
+                    'order_id': str(order.id),
+                    'order_number': order.order_number,
+                    'total': float(order.total),
+                    'items': sum(quantity for quantity, _ in sold.values())
+                }
+            ))
+
+            metrics = {
+                metric.product_id: metric
+                for metric in db.session.query(ProductMetric).filter(
+                    ProductMetric.product_id.in_(list(sold)),
+                    ProductMetric.date == day
+                )
+            } if sold else {}
+            for product_id, (quantity, revenue) in sold.items():
+                metric = metrics.get(product_id)
+                if metric is None:
+                    metric = ProductMetric(product_id=product_id, date=day)
+                    db.session.add(metric)
+                metric.purchases = (metric.purchases or 0) + quantity
+                metric.revenue = (metric.revenue or 0.0) + revenue
+                metric.views = metric.views or 0
+                metric.add_to_cart = metric.add_to_cart or 0
+                metric.calculate_conversion_rates()
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {'success': True, 'products': len(sold)}
+
+    # ----- reporting -----
+
+    def get_sla_report(self, days: int = 30,
+                       stages: Sequence[str] = SLA_STAGES) -> List[Dict[str, Any]]:
+        """Latency between consecutive fulfilment stages, from the order event log"""
+        since = datetime.utcnow() - timedelta(days=days)
+        rows = self.order_repo.get_stage_times(list(stages), since)
+
+        report = []
+        for index in range(len(stages) - 1):
+            latencies = sorted(
+                (row[index + 2] - row[index + 1]).total_seconds() / 3600
+                for row in rows
+                if row[index + 1] is not None and row[index + 2] is not None
+                and row[index + 2] >= row[index + 1]
+            )
+
+            counts = [0] * (len(SLA_BUCKETS_HOURS) + 1)
+            for hours in latencies:
+                counts[bisect_left(SLA_BUCKETS_HOURS, hours)] += 1
+
+            report.append({
+                'from': stages[index],
+                'to': stages[index + 1],
+                'count': len(latencies),
+                'p50_hours': self._percentile(latencies, 50),
+                'p90_hours': self._percentile(latencies, 90),
+                'p99_hours': self._percentile(latencies, 99),
+                'histogram': [
+                    {'le_hours': bound, 'count': count}
+                    for bound, count in zip(SLA_BUCKETS_HOURS + (None,), counts)
+                ]
+            })
+        return report
+
+    @staticmethod
+    def _percentile(values: List[float], percent: int) -> Optional[float]:
+        """Nearest-rank percentile of sorted values"""
+        if not values:
+            return None
+        rank = max(1, -(-len(values) * percent // 100))
+        return round(values[rank - 1], 2)
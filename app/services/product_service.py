@@ -1,13 +1,20 @@
 """Product service with business logic for product operations"""
 
+import logging
+import time
 from typing import List, Dict, Any, Optional
 from uuid import UUID
 from datetime import datetime
 
+from flask import current_app
+
 from app.repositories import ProductRepository
 from app.models import Product, ProductVariant, Category, Review, UserEvent
+from app.models.serialization import dumps, loads
 from app.extensions import db, redis_client
 
+logger = logging.getLogger(__name__)
+
 
 class ProductService:
     """Service for product-related business logic"""
@@ -16,6 +23,7 @@ class ProductService:
         self.product_repo = ProductRepository()
         self.category_repo = CategoryRepository()
         self.variant_repo = ProductVariantRepository()
+        self.recommendation_service = RecommendationService()
     
     def search_products(self, query: str = None, filters: Dict[str, Any] = None,
                        sort: str = 'created_at', limit: int = 20, 
@@ -31,6 +39,16 @@ class ProductService:
         brands = filters.get('brands', [])
         in_stock = filters.get('in_stock', True)
         
+        threshold = current_app.config.get('SEARCH_TRIGRAM_THRESHOLD', 0.5)
+        
+        # Without pg_trgm, rank text matches with the in-process trigram index
+        ranked_ids = None
+        if query and not self.product_repo.has_trigram_index():
+            max_results = current_app.config.get('SEARCH_MAX_RESULTS', 1000)
+            ranked_ids = [
+                product_id for product_id, _ in trigram_index.search(query, threshold, max_results)
+            ]
+        
         result = self.product_repo.search_products(
             query=query,
             category_ids=category_ids,
@@ -39,7 +57,9 @@ class ProductService:
             brands=brands,
             in_stock=in_stock,
             limit=limit,
-            offset=offset
+            offset=offset,
+            ranked_ids=ranked_ids,
+            similarity_threshold=threshold
         )
         
         return result
@@ -48,6 +68,10 @@ class ProductService:
         """Get product with all variants and related data"""
         return self.product_repo.get_with_variants(product_id)
     
+    def get_product_version(self, product_id: UUID):
+        """Get cheap version info of a product for conditional requests"""
+        return self.product_repo.get_version(product_id)
+    
     def get_featured_products(self, limit: int = 10) -> List[Product]:
         """Get featured products"""
         return self.product_repo.get_featured_products(limit)
@@ -81,54 +105,44 @@ class ProductService:
         return self.product_repo.get_related_products(product_id, limit)
     
     def get_recommendations(self, user_id: Optional[UUID] = None, 
-                          limit: int = 10) -> List[Product]:
-        """Get personalized product recommendations"""
-        cache_key = f"recommendations:{user_id}:{limit}"
+                          limit: int = 10) -> List[Dict[str, Any]]:
+        """Get personalized recommendations as ready-to-serve product cards
         
-        # Try to get from cache first
-        try:
-            cached = redis_client.get(cache_key)
-            if cached:
-                import json
-                product_ids = json.loads(cached)
-                products = []
-                for pid in product_ids:
-                    product = self.product_repo.get_by_id(UUID(pid))
-                    if product:
-                        products.append(product)
-                return products
-        except:
-            pass
+        Cards are cached per user. Past RECOMMENDATIONS_CACHE_FRESH seconds
+        the cached cards are still served while one queued refresh task
+        rebuilds them at the same size (stale-while-revalidate).
+        """
+        cache_key = self._recommendation_cache_key(user_id)
+        entry = self._read_recommendation_cache(cache_key)
         
-        if user_id:
-            # User-based recommendations (simplified)
-            # In a real system, this would use collaborative filtering
-            recommendations = self._get_user_based_recommendations(user_id, limit)
-        else:
-            # For anonymous users, return popular/featured products
-            recommendations = self.product_repo.get_featured_products(limit)
+        if entry is not None and entry['size'] >= limit:
+            fresh_for = current_app.config.get('RECOMMENDATIONS_CACHE_FRESH', 300)
+            if time.time() - entry['generated_at'] > fresh_for:
+                self._refresh_recommendations_async(user_id, entry['size'])
+            return entry['products'][:limit]
         
-        # Cache the recommendations
+        size = max(limit, current_app.config.get('RECOMMENDATIONS_CACHE_SIZE', 20))
+        cards = self._build_recommendation_cards(user_id, size)
+        self._write_recommendation_cache(cache_key, cards, size)
+        return cards[:limit]
+    
+    def invalidate_recommendations(self, user_id: UUID):
+        """Drop a user's cached recommendations (e.g. after a purchase)"""
         try:
-            import json
-            product_ids = [str(p.id) for p in recommendations]
-            redis_client.setex(cache_key, 300, json.dumps(product_ids))  # 5 min cache
-        except:
-            pass
-        
-        return recommendations
+            redis_client.delete(self._recommendation_cache_key(user_id))
+        except Exception:
+            logger.warning("Failed to invalidate recommendations for user %s", user_id)
     
     def track_product_view(self, product_id: UUID, user_id: Optional[UUID] = None,
                           session_id: Optional[str] = None):
         """Track product view event"""
         try:
-            event = UserEvent(
+            event = UserEvent.create_event(
+                'product_view',
+                'product_view',
                 user_id=user_id,
                 session_id=session_id,
-                event_type='product_view',
-                entity_type='product',
-                entity_id=product_id,
-                metadata={}
+                properties={'product_id': str(product_id)}
             )
             db.session.add(event)
             db.session.commit()
@@ -243,39 +257,72 @@ class ProductService:
             }
     
     def _get_user_based_recommendations(self, user_id: UUID, limit: int) -> List[Product]:
-        """Get user-based recommendations (simplified algorithm)"""
-        # Get user's purchase history
-        from app.models import Order, OrderItem, ProductVariant
-        
-        purchased_products = db.session.query(Product).join(ProductVariant).join(
-            OrderItem
-        ).join(Order).filter(
-            Order.user_id == user_id,
-            Order.status.in_(['delivered', 'completed'])
-        ).distinct().all()
+        """Get item-item collaborative filtering recommendations"""
+        # Over-fetch candidates since inactive products drop out on hydration
+        product_ids = self.recommendation_service.recommend_for_user(user_id, limit * 2)
+        recommendations = self.product_repo.get_active_by_ids(product_ids)[:limit]
         
-        if not purchased_products:
-            # No purchase history, return featured products
-            return self.product_repo.get_featured_products(limit)
+        if len(recommendations) < limit:
+            # Cold start or thin history: fill with featured products
+            seen = {p.id for p in recommendations}
+            additional = self.product_repo.get_featured_products(limit)
+            recommendations.extend([p for p in additional if p.id not in seen])
         
-        # Get products in same categories as purchased products
-        category_ids = [p.category_id for p in purchased_products if p.category_id]
-        
-        if category_ids:
-            recommendations = db.session.query(Product).filter(
-                Product.category_id.in_(category_ids),
-                Product.is_active == True,
-                ~Product.id.in_([p.id for p in purchased_products])  # Exclude already purchased
-            ).limit(limit).all()
-            
-            if len(recommendations) < limit:
-                # Fill remaining with featured products
-                additional = self.product_repo.get_featured_products(limit - len(recommendations))
-                recommendations.extend([p for p in additional if p not in recommendations])
-            
-            return recommendations[:limit]
+        return recommendations[:limit]
+    
+    def _build_recommendation_cards(self, user_id: Optional[UUID], size: int) -> List[Dict[str, Any]]:
+        """Compute recommendations and serialize them to product cards"""
+        if user_id:
+            products = self._get_user_based_recommendations(user_id, size)
+        else:
+            # For anonymous users, return popular/featured products
+            products = self.product_repo.get_featured_products(size)
+        return Product.to_dict_many(products)
+    
+    @staticmethod
+    def _recommendation_cache_key(user_id: Optional[UUID]) -> str:
+        return f"recommendations:{user_id or 'anonymous'}"
+    
+    def _read_recommendation_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = redis_client.get(cache_key)
+            return loads(cached) if cached else None
+        except Exception:
+            logger.warning("Failed to read recommendation cache %s", cache_key)
+            return None
+    
+    def _write_recommendation_cache(self, cache_key: str, cards: List[Dict[str, Any]], size: int):
+        entry = {'products': cards, 'size': size, 'generated_at': time.time()}
+        try:
+            ttl = current_app.config.get('RECOMMENDATIONS_CACHE_TTL', 3600)
+            redis_client.setex(cache_key, ttl, dumps(entry))
+        except Exception:
+            logger.warning("Failed to write recommendation cache %s", cache_key)
+    
+    def _refresh_recommendations_async(self, user_id: Optional[UUID], size: int):
+        """Queue a rebuild of a stale entry at its current size, once across workers"""
+        cache_key = self._recommendation_cache_key(user_id)
+        try:
+            if not redis_client.set(f"{cache_key}:refreshing", 1, nx=True, ex=60):
+                return
+        except Exception:
+            return
         
-        return self.product_repo.get_featured_products(limit)
+        from app import tasks
+        tasks.enqueue(tasks.refresh_recommendations, str(user_id) if user_id else None, size)
+    
+    def refresh_recommendations(self, user_id: Optional[UUID], size: int) -> Dict[str, Any]:
+        """Rebuild a user's cached cards (run by the refresh task)"""
+        cache_key = self._recommendation_cache_key(user_id)
+        try:
+            cards = self._build_recommendation_cards(user_id, size)
+            self._write_recommendation_cache(cache_key, cards, size)
+        finally:
+            try:
+                redis_client.delete(f"{cache_key}:refreshing")
+            except Exception:
+                pass
+        return {'success': True, 'size': size}
     
     def _track_review_event(self, product_id: UUID, user_id: UUID, rating: int):
         """Track review submission event"""
@@ -294,4 +341,6 @@ class ProductService:
 
 
 # Import repositories
-from app.repositories.product_repository import CategoryRepository, ProductVariantRepository 
\ No newline at end of file
+from app.repositories.product_repository import CategoryRepository, ProductVariantRepository
+from app.services.recommendation_service import RecommendationService 
+from app.services.search_index import trigram_index
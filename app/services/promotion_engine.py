@@ -0,0 +1,260 @@
+"""Automatic promotions: compiled DiscountRule evaluation"""
+
+import logging
+from bisect import bisect_right
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import or_
+
+from app.models import DiscountRule, Order
+from app.extensions import db
+from app.services.versioned_cache import VersionedCache, bump_version, track_changes
+
+logger = logging.getLogger(__name__)
+
+RULES_VERSION_KEY = 'promotions:rules_version'
+CENT = Decimal('0.01')
+
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class CompiledRule:
+    """A DiscountRule reduced to closures over its conditions and actions"""
+
+    __slots__ = ('id', 'name', 'priority', 'exclusive', 'sort_key', 'applies', 'discount')
+
+    def __init__(self, rule: DiscountRule, sequence: int,
+                 applies: Callable[[Dict[str, Any]], bool],
+                 discount: Callable[[Dict[str, Any]], Decimal]):
+        self.id = rule.id
+        self.name = rule.name
+        self.priority = rule.priority or 0
+        self.exclusive = bool((rule.actions or {}).get('exclusive'))
+        self.sort_key = (-self.priority, sequence)
+        self.applies = applies
+        self.discount = discount
+
+
+class PromotionEngine(VersionedCache):
+    """Evaluates active discount rules against a cart
+
+    Active rules are loaded once per process and compiled into closures, so
+    evaluating a rule is a few comparisons instead of re-reading its JSON.
+    Rules are indexed by what triggers them (category, minimum cart total,
+    minimum quantity, first order) and only rules a cart can trigger are
+    evaluated. Applicable rules are applied in priority order and their
+    discounts add up, except that an ``exclusive`` rule is only applied on
+    its own.
+
+    Rule writes bump a version counter in Redis after commit. Each process
+    checks it at most every PROMOTIONS_CHECK_INTERVAL seconds and recompiles
+    when it moved.
+    """
+
+    version_key = RULES_VERSION_KEY
+    check_interval_setting = 'PROMOTIONS_CHECK_INTERVAL'
+
+    def __init__(self):
+        super().__init__()
+        self._by_category: Dict[str, List[CompiledRule]] = {}
+        self._total_thresholds: List[Decimal] = []
+        self._total_rules: List[CompiledRule] = []
+        self._quantity_thresholds: List[int] = []
+        self._quantity_rules: List[CompiledRule] = []
+        self._first_order: List[CompiledRule] = []
+        self._limited_ids: frozenset = frozenset()
+
+    # ----- evaluation -----
+
+    def evaluate(self, cart_total: Decimal, items: List[Dict[str, Any]],
+                 user_id: Optional[UUID] = None) -> Dict[str, Any]:
+        """Discount from automatic promotions for a cart
+
+        items are dicts with ``category_id`` and ``quantity``. Returns the
+        combined discount (never above cart_total) and the rules applied.
+        """
+        self.ensure_fresh()
+
+        cart_total = _decimal(cart_total)
+        candidates = {}
+
+        for category_id in {str(item.get('category_id')) for item in items if item.get('category_id')}:
+            for rule in self._by_category.get(category_id, ()):
+                candidates[rule.id] = rule
+
+        for rule in self._total_rules[:bisect_right(self._total_thresholds, cart_total)]:
+            candidates[rule.id] = rule
+
+        total_quantity = sum(item.get('quantity', 0) for item in items)
+        for rule in self._quantity_rules[:bisect_right(self._quantity_thresholds, total_quantity)]:
+            candidates[rule.id] = rule
+
+        if self._first_order and user_id is not None and self._is_first_order(user_id):
+            for rule in self._first_order:
+                candidates[rule.id] = rule
+
+        context = {
+            'now': datetime.utcnow(),
+            'cart_total': cart_total,
+            'total_quantity': total_quantity,
+        }
+
+        applied = []
+        total_discount = Decimal('0.00')
+        for rule in sorted(candidates.values(), key=lambda rule: rule.sort_key):
+            if applied and rule.exclusive:
+                continue
+            if not rule.applies(context):
+                continue
+
+            amount = min(rule.discount(context), cart_total - total_discount)
+            if amount <= 0:
+                continue
+            total_discount += amount
+            applied.append({'rule_id': str(rule.id), 'rule_name': rule.name, 'discount': float(amount)})
+
+            if rule.exclusive or total_discount >= cart_total:
+                break
+
+        return {'discount': total_discount, 'applied': applied}
+
+    def record_usage(self, rule_ids: Iterable[str]) -> bool:
+        """Count one use of each applied rule in the current transaction
+
+        The UPDATE only counts rules still under their usage_limit. False
+        means one reached it since the totals were computed, so the caller
+        must roll back. Rules are recompiled only when one is used up.
+        """
+        rule_ids = {UUID(str(rule_id)) for rule_id in rule_ids}
+        if not rule_ids:
+            return True
+
+        counted = db.session.query(DiscountRule).filter(
+            DiscountRule.id.in_(rule_ids),
+            or_(DiscountRule.usage_limit.is_(None), DiscountRule.usage_count < DiscountRule.usage_limit)
+        ).update(
+            {DiscountRule.usage_count: DiscountRule.usage_count + 1},
+            synchronize_session=False
+        )
+        if counted < len(rule_ids):
+            return False
+
+        limited = rule_ids & self._limited_ids
+        if limited and db.session.query(DiscountRule.id).filter(
+            DiscountRule.id.in_(limited), DiscountRule.usage_count >= DiscountRule.usage_limit
+        ).first() is not None:
+            db.session.info['promotions_changed'] = True
+        return True
+
+    @staticmethod
+    def _is_first_order(user_id: UUID) -> bool:
+        return db.session.query(Order.id).filter(Order.user_id == user_id).first() is None
+
+    # ----- loading -----
+
+    def _load(self):
+        now = datetime.utcnow()
+        rules = db.session.query(DiscountRule).filter(
+            DiscountRule.is_active == True,
+            or_(DiscountRule.valid_until.is_(None), DiscountRule.valid_until > now),
+            or_(DiscountRule.usage_limit.is_(None), DiscountRule.usage_count < DiscountRule.usage_limit)
+        ).all()
+
+        by_category = {}
+        totals = []
+        quantities = []
+        first_order = []
+        for sequence, rule in enumerate(rules):
+            compiled = self._compile(rule, sequence)
+            if compiled is None:
+                continue
+
+            conditions = rule.conditions or {}
+            if rule.rule_type == 'category':
+                for category_id in conditions.get('category_ids', []):
+                    by_category.setdefault(str(category_id), []).append(compiled)
+            elif rule.rule_type == 'cart_total':
+                totals.append((_decimal(conditions.get('min_amount')), compiled))
+            elif rule.rule_type == 'quantity':
+                quantities.append((int(conditions.get('min_quantity', 0)), compiled))
+            elif rule.rule_type == 'first_order':
+                first_order.append(compiled)
+
+        totals.sort(key=lambda item: item[0])
+        quantities.sort(key=lambda item: item[0])
+
+        self._by_category = by_category
+        self._total_thresholds = [threshold for threshold, _ in totals]
+        self._total_rules = [rule for _, rule in totals]
+        self._quantity_thresholds = [threshold for threshold, _ in quantities]
+        self._quantity_rules = [rule for _, rule in quantities]
+        self._first_order = first_order
+        self._limited_ids = frozenset(rule.id for rule in rules if rule.usage_limit is not None)
+
+    @staticmethod
+    def _compile(rule: DiscountRule, sequence: int) -> Optional[CompiledRule]:
+        """Closures equivalent to DiscountRule.is_applicable / apply_discount"""
+        conditions = rule.conditions or {}
+        actions = rule.actions or {}
+
+        # Category and first-order triggers are settled by the index lookup
+        if rule.rule_type == 'cart_total':
+            min_amount = _decimal(conditions.get('min_amount'))
+            condition = lambda context: context['cart_total'] >= min_amount
+        elif rule.rule_type == 'quantity':
+            min_quantity = int(conditions.get('min_quantity', 0))
+            condition = lambda context: context['total_quantity'] >= min_quantity
+        elif rule.rule_type in ('category', 'first_order'):
+            condition = None
+        else:
+            return None
+
+        valid_from = _naive_utc(rule.valid_from)
+        valid_until = _naive_utc(rule.valid_until)
+
+        def applies(context):
+            now = context['now']
+            if valid_from is not None and now < valid_from:
+                return False
+            if valid_until is not None and now > valid_until:
+                return False
+            return condition is None or condition(context)
+
+        value = _decimal(actions.get('value'))
+        max_discount = _decimal(actions['max_discount']) if actions.get('max_discount') else None
+        if actions.get('type') == 'percentage':
+            rate = value / 100
+            amount = lambda context: context['cart_total'] * rate
+        elif actions.get('type') == 'fixed':
+            amount = lambda context: value
+        else:
+            return None
+
+        def discount(context):
+            result = amount(context)
+            if max_discount is not None and result > max_discount:
+                result = max_discount
+            return result.quantize(CENT, rounding=ROUND_HALF_UP)
+
+        return CompiledRule(rule, sequence, applies, discount)
+
+promotion_engine = PromotionEngine()
+
+
+def invalidate_promotions():
+    """Make every process recompile discount rules"""
+    bump_version(RULES_VERSION_KEY, promotion_engine)
+
+
+track_changes([DiscountRule], 'promotions_changed', invalidate_promotions)
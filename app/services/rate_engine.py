@@ -0,0 +1,217 @@
+"""Tax and shipping rates from in-memory tables"""
+
+import logging
+from bisect import bisect_left
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from app.models import ShippingRate, TaxRate
+from app.extensions import db
+from app.services.versioned_cache import VersionedCache, bump_version, track_changes
+
+logger = logging.getLogger(__name__)
+
+RATES_VERSION_KEY = 'rates:version'
+CENT = Decimal('0.01')
+NO_LIMIT = Decimal('Infinity')
+
+# Offered while shipping_rates is empty; standard uses SHIPPING_RATE and
+# FREE_SHIPPING_THRESHOLD from the config
+DEFAULT_SHIPPING_METHODS = (
+    ('standard', 'Standard Shipping', '5-7 business days', None),
+    ('express', 'Express Shipping', '2-3 business days', Decimal('19.99')),
+    ('overnight', 'Overnight Shipping', '1 business day', Decimal('39.99')),
+)
+
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def _normalize(value) -> str:
+    """Region code as stored in the lookup tables: upper case, no spaces or dashes"""
+    return ''.join(str(value or '').upper().split()).replace('-', '')
+
+
+def _region(address) -> Tuple[str, str, str]:
+    """(country, state, postal code) of an Address or an address snapshot dict"""
+    if address is None:
+        return '', '', ''
+    get = address.get if isinstance(address, dict) else lambda name: getattr(address, name, None)
+    return _normalize(get('country')), _normalize(get('state')), _normalize(get('postal_code'))
+
+
+class ShippingMethod:
+    """One shipping method's weight bands, searched with bisect"""
+
+    __slots__ = ('method', 'name', 'description', 'sort_order', 'bounds', 'bands')
+
+    def __init__(self, method: str, name: str, description: Optional[str], sort_order: int,
+                 bands: List[Tuple[Decimal, Decimal, Optional[Decimal]]]):
+        bands = sorted(bands, key=lambda band: band[0])
+        self.method = method
+        self.name = name
+        self.description = description
+        self.sort_order = sort_order
+        self.bounds = [max_weight for max_weight, _, _ in bands]
+        self.bands = [(price, free_over) for _, price, free_over in bands]
+
+    def quote(self, weight: Decimal, subtotal: Decimal) -> Optional[Decimal]:
+        """Price for a shipment, or None when it is heavier than every band"""
+        index = bisect_left(self.bounds, weight)
+        if index == len(self.bounds):
+            return None
+        price, free_over = self.bands[index]
+        if free_over is not None and subtotal >= free_over:
+            return Decimal('0.00')
+        return price
+
+
+class RateEngine(VersionedCache):
+    """Looks up tax and shipping rates without touching the database
+
+    tax_rates and shipping_rates are loaded once per process:
+
+    * tax rates are indexed by (country, state), then by postal prefix;
+      an address is matched by trying its own postal code prefixes from
+      longest to shortest, first for its state and then country-wide, so
+      a lookup costs a handful of dict probes whatever the table size;
+    * each shipping method keeps its weight bands sorted by upper bound
+      and finds a parcel's band with bisect (O(log n)).
+
+    Without a matching tax row the TAX_RATE setting applies, and without
+    any shipping rows the standard/express/overnight defaults do, so an
+    empty table keeps the previous 8% / 9.99 / free-over-50 behaviour.
+
+    Table writes bump a version counter in Redis after commit; each
+    process checks it at most every RATES_CHECK_INTERVAL seconds and
+    reloads when it moved.
+    """
+
+    version_key = RATES_VERSION_KEY
+    check_interval_setting = 'RATES_CHECK_INTERVAL'
+
+    def __init__(self):
+        super().__init__()
+        self._default_tax = Decimal('0')
+        self._tax: Dict[Tuple[str, str], Dict[str, Decimal]] = {}
+        self._shipping: Dict[str, List[ShippingMethod]] = {}
+
+    # ----- tax -----
+
+    def tax_rate(self, address=None) -> Decimal:
+        """Tax rate for a shipping address (default rate without one)"""
+        self.ensure_fresh()
+        country, state, postal_code = _region(address)
+        if country:
+            for key in ((country, state), (country, '')) if state else ((country, ''),):
+                by_prefix = self._tax.get(key)
+                if not by_prefix:
+                    continue
+                for length in range(len(postal_code), -1, -1):
+                    rate = by_prefix.get(postal_code[:length])
+                    if rate is not None:
+                        return rate
+        return self._default_tax
+
+    def tax(self, amount, address=None) -> Decimal:
+        """Tax on an amount, rounded to the cent"""
+        return (_decimal(amount) * self.tax_rate(address)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    # ----- shipping -----
+
+    def shipping_options(self, address=None, subtotal=0, weight=0) -> List[Dict[str, Any]]:
+        """Shipping methods available for a parcel, with their prices"""
+        self.ensure_fresh()
+        country = _region(address)[0]
+        methods = self._shipping.get(country) or self._shipping.get('', [])
+        subtotal, weight = _decimal(subtotal), _decimal(weight)
+
+        options = []
+        for method in methods:
+            price = method.quote(weight, subtotal)
+            if price is not None:
+                options.append({
+                    'id': method.method,
+                    'name': method.name,
+                    'description': method.description,
+                    'price': price
+                })
+        return options
+
+    def shipping(self, address=None, subtotal=0, weight=0,
+                 method: Optional[str] = None) -> Optional[Decimal]:
+        """Price of a shipping method (standard, else the cheapest), or None if unavailable"""
+        options = self.shipping_options(address, subtotal, weight)
+        if method:
+            return next((option['price'] for option in options if option['id'] == method), None)
+        for option in options:
+            if option['id'] == 'standard':
+                return option['price']
+        return min((option['price'] for option in options), default=None)
+
+    # ----- loading -----
+
+    def _load(self):
+        config = current_app.config
+
+        tax = {}
+        for row in db.session.query(TaxRate).filter(TaxRate.is_active == True):
+            key = (_normalize(row.country), _normalize(row.state))
+            tax.setdefault(key, {})[_normalize(row.postal_prefix)] = _decimal(row.rate)
+
+        rows = db.session.query(ShippingRate).filter(ShippingRate.is_active == True).all()
+        if rows:
+            # country -> method -> (name, description, sort order, bands)
+            by_country: Dict[str, Dict[str, list]] = {}
+            for row in rows:
+                country = _normalize(row.country)
+                entry = by_country.setdefault(country, {}).setdefault(
+                    row.method, [row.name, row.description, row.sort_order or 0, []]
+                )
+                entry[3].append((
+                    NO_LIMIT if row.max_weight is None else _decimal(row.max_weight),
+                    _decimal(row.price),
+                    None if row.free_over is None else _decimal(row.free_over)
+                ))
+            # A country's own rows replace the global ones method by method
+            shipping = {
+                country: self._compile_methods({**by_country.get('', {}), **methods})
+                for country, methods in by_country.items()
+            }
+        else:
+            shipping = {'': self._compile_methods({
+                method: [
+                    name, description, sort_order,
+                    [(NO_LIMIT, _decimal(config.get('SHIPPING_RATE', 9.99)),
+                      _decimal(config.get('FREE_SHIPPING_THRESHOLD', 50)))]
+                    if price is None else [(NO_LIMIT, price, None)]
+                ]
+                for sort_order, (method, name, description, price) in enumerate(DEFAULT_SHIPPING_METHODS)
+            })}
+
+        self._default_tax = _decimal(config.get('TAX_RATE', 0.08))
+        self._tax = tax
+        self._shipping = shipping
+
+    @staticmethod
+    def _compile_methods(methods: Dict[str, list]) -> List[ShippingMethod]:
+        compiled = [
+            ShippingMethod(method, name, description, sort_order, bands)
+            for method, (name, description, sort_order, bands) in methods.items()
+        ]
+        compiled.sort(key=lambda method: (method.sort_order, method.method))
+        return compiled
+
+
+rate_engine = RateEngine()
+
+
+def invalidate_rates():
+    """Make every process reload tax and shipping tables"""
+    bump_version(RATES_VERSION_KEY, rate_engine)
+
+
+track_changes([TaxRate, ShippingRate], 'rates_changed', invalidate_rates)
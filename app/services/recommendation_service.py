@@ -0,0 +1,477 @@
+"""Item-item collaborative filtering recommendations"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+import numpy as np
+from scipy import sparse
+from flask import current_app
+from sqlalchemy import delete, func, insert
+
+from app.models import (
+    Cart, CartItem, Order, OrderItem, ProductRelation, ProductVariant,
+    RelationType, UserEvent, Wishlist
+)
+from app.extensions import db, redis_client
+from app.services.batch_jobs import chunks, event_product_id, get_watermark, set_watermark
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationService:
+    """Item-item collaborative filtering over implicit feedback
+
+    Training builds a sparse user x item matrix from purchases, cart adds,
+    wishlist saves and product views, L2-normalizes the item columns and
+    computes cosine similarity in blocks of items, so memory is bounded by
+    the block size rather than items^2. The top-N neighbors per item are
+    stored in product_relations (relation_type 'similar'). Serving a user
+    is then a weighted sum over the neighbor lists of the items they
+    interacted with. Incremental runs recompute only the items with new
+    interactions (see _train_incremental).
+    """
+
+    WATERMARK_KEY = 'recommendations:last_train'
+    NORMS_KEY = 'recommendations:item_norms'
+
+    # Implicit feedback weight per interaction
+    PURCHASE_WEIGHT = 5.0
+    WISHLIST_WEIGHT = 4.0
+    CART_WEIGHT = 3.0
+    VIEW_WEIGHT = 1.0
+
+    # ----- training -----
+
+    def train(self, full: bool = False) -> Dict[str, Any]:
+        """Recompute item neighbor lists and return run statistics"""
+        config = current_app.config
+        started_at = datetime.utcnow()
+        window_start = started_at - timedelta(days=config.get('RECOMMENDATIONS_HISTORY_DAYS', 365))
+
+        since = None if full else get_watermark(self.WATERMARK_KEY)
+        norms = self._load_norms() if since is not None else {}
+        if since is not None and norms:
+            # Overlap the previous run to absorb clock skew between app and database
+            stats = self._train_incremental(since - timedelta(minutes=5), window_start, norms)
+        else:
+            stats = self._train_full(window_start)
+
+        set_watermark(self.WATERMARK_KEY, started_at)
+        return stats
+
+    def _train_full(self, window_start: datetime) -> Dict[str, Any]:
+        """Recompute every item from the whole interaction window"""
+        config = current_app.config
+        interactions = self._load_interactions(window_start)
+        matrix, item_ids = self._build_matrix(interactions, config.get('RECOMMENDATIONS_MAX_WEIGHT', 10.0))
+        del interactions
+        norms = self._column_norms(matrix)
+
+        rows = self._neighbor_rows(matrix, norms, item_ids, np.arange(len(item_ids)))
+        self._save_rows(rows, None)
+        self._save_norms(dict(zip(item_ids, norms.tolist())), replace=True)
+
+        return {
+            'mode': 'full',
+            'users': matrix.shape[0],
+            'items': matrix.shape[1],
+            'interactions': int(matrix.nnz),
+            'items_updated': len(item_ids),
+            'relations': len(rows)
+        }
+
+    def _train_incremental(self, since: datetime, window_start: datetime,
+                           norms: Dict[UUID, float]) -> Dict[str, Any]:
+        """Recompute only the items with interactions since the last run
+
+        Touched items are processed in blocks of RECOMMENDATIONS_BLOCK_SIZE.
+        A first pass reads each block's item columns to refresh their norms;
+        a second reads the full rows of the users who interacted with the
+        block, which is all a cosine against every other item needs. Norms
+        of untouched items haven't changed and come from the previous run,
+        so memory is bounded by one block's users, not the whole window.
+        """
+        config = current_app.config
+        block_size = config.get('RECOMMENDATIONS_BLOCK_SIZE', 1024)
+        max_weight = config.get('RECOMMENDATIONS_MAX_WEIGHT', 10.0)
+        touched = sorted(self._touched_products(since))
+
+        for block in chunks(touched, block_size):
+            matrix, item_ids = self._build_matrix(
+                self._load_interactions(window_start, products=block), max_weight
+            )
+            norms.update(zip(item_ids, self._column_norms(matrix).tolist()))
+
+        users, interactions, relations = set(), 0, 0
+        for block in chunks(touched, block_size):
+            block_users = self._interacting_users(window_start, block)
+            matrix, item_ids = self._build_matrix(
+                self._load_interactions(window_start, users=block_users), max_weight
+            )
+            users.update(block_users)
+            interactions += int(matrix.nnz)
+
+            column_norms = self._column_norms(matrix)
+            block_norms = np.array(
+                [norms.get(item_id, 0.0) for item_id in item_ids], dtype=np.float32
+            )
+            # Items new since the last full run: the loaded part of the column is all we have
+            missing = block_norms == 0
+            block_norms[missing] = column_norms[missing]
+
+            index = {item_id: position for position, item_id in enumerate(item_ids)}
+            block_rows = np.array([index[item_id] for item_id in block if item_id in index], dtype=np.int64)
+            rows = self._neighbor_rows(matrix, block_norms, item_ids, block_rows)
+            self._save_rows(rows, block)
+            relations += len(rows)
+
+        self._save_norms({item_id: norms[item_id] for item_id in touched if item_id in norms})
+
+        return {
+            'mode': 'incremental',
+            'users': len(users),
+            'items': len(touched),
+            'interactions': interactions,
+            'items_updated': len(touched),
+            'relations': relations
+        }
+
+    def _neighbor_rows(self, matrix, norms, item_ids: List[UUID], rows_to_compute) -> List[Dict[str, Any]]:
+        config = current_app.config
+        neighbors = self._item_neighbors(
+            matrix,
+            norms,
+            rows_to_compute,
+            top_n=config.get('RECOMMENDATIONS_NEIGHBORS', 30),
+            block_size=config.get('RECOMMENDATIONS_BLOCK_SIZE', 1024),
+            min_similarity=config.get('RECOMMENDATIONS_MIN_SIMILARITY', 0.01)
+        )
+        return [
+            {
+                'product_id': item_ids[item],
+                'related_product_id': item_ids[other],
+                'relation_type': RelationType.SIMILAR.value,
+                'score': float(score),
+                'rank': rank
+            }
+            for item, ranked in neighbors
+            for rank, (other, score) in enumerate(ranked)
+        ]
+
+    def _save_rows(self, rows, covered: Optional[List[UUID]]):
+        try:
+            self._replace_rows(rows, covered)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _load_interactions(self, window_start: datetime, users: Optional[Set[UUID]] = None,
+                           products: Optional[List[UUID]] = None) -> Dict[Tuple[UUID, UUID], float]:
+        """Aggregate weighted (user, product) interactions inside the window
+
+        users or products restrict the read to those users' rows or those
+        products' columns.
+        """
+        interactions = defaultdict(float)
+
+        purchases = db.session.query(
+            Order.user_id, ProductVariant.product_id, func.count(OrderItem.id)
+        ).join(
+            OrderItem, OrderItem.order_id == Order.id
+        ).join(
+            ProductVariant, ProductVariant.id == OrderItem.variant_id
+        ).filter(
+            Order.user_id.isnot(None),
+            Order.status != 'cancelled',
+            Order.created_at >= window_start
+        ).group_by(Order.user_id, ProductVariant.product_id)
+
+        cart_adds = db.session.query(
+            Cart.user_id, ProductVariant.product_id, func.count(CartItem.id)
+        ).join(
+            CartItem, CartItem.cart_id == Cart.id
+        ).join(
+            ProductVariant, ProductVariant.id == CartItem.variant_id
+        ).filter(
+            Cart.user_id.isnot(None),
+            CartItem.created_at >= window_start
+        ).group_by(Cart.user_id, ProductVariant.product_id)
+
+        wishlist = db.session.query(
+            Wishlist.user_id, ProductVariant.product_id, func.count(Wishlist.id)
+        ).join(
+            ProductVariant, ProductVariant.id == Wishlist.variant_id
+        ).filter(
+            Wishlist.created_at >= window_start
+        ).group_by(Wishlist.user_id, ProductVariant.product_id)
+
+        views = db.session.query(UserEvent.user_id, UserEvent.properties).filter(
+            UserEvent.event_type == 'product_view',
+            UserEvent.user_id.isnot(None),
+            UserEvent.timestamp >= window_start
+        )
+
+        sources = ((purchases, Order.user_id, self.PURCHASE_WEIGHT),
+                   (cart_adds, Cart.user_id, self.CART_WEIGHT),
+                   (wishlist, Wishlist.user_id, self.WISHLIST_WEIGHT))
+        for query, user_column, weight in sources:
+            for chunk_query in self._restrict(query, user_column, ProductVariant.product_id, users, products):
+                for user_id, product_id, count in chunk_query.yield_per(5000):
+                    interactions[(user_id, product_id)] += weight * count
+
+        viewed = UserEvent.viewed_product_id()
+        view_products = None if products is None else [str(product_id) for product_id in products]
+        for chunk_query in self._restrict(views, UserEvent.user_id, viewed, users, view_products):
+            for user_id, properties in chunk_query.yield_per(5000):
+                product_id = event_product_id(properties)
+                if product_id is not None:
+                    interactions[(user_id, product_id)] += self.VIEW_WEIGHT
+
+        return interactions
+
+    @staticmethod
+    def _restrict(query, user_column, product_column, users, products):
+        """The query as-is, or one query per chunk of users or products"""
+        if users is not None:
+            return [query.filter(user_column.in_(chunk)) for chunk in chunks(users)]
+        if products is not None:
+            return [query.filter(product_column.in_(chunk)) for chunk in chunks(products)]
+        return [query]
+
+    def _interacting_users(self, window_start: datetime, products: List[UUID]) -> Set[UUID]:
+        """Users with an interaction on any of the products inside the window"""
+        queries = (
+            db.session.query(Order.user_id).join(
+                OrderItem, OrderItem.order_id == Order.id
+            ).join(
+                ProductVariant, ProductVariant.id == OrderItem.variant_id
+            ).filter(
+                ProductVariant.product_id.in_(products),
+                Order.user_id.isnot(None),
+                Order.status != 'cancelled',
+                Order.created_at >= window_start
+            ),
+            db.session.query(Cart.user_id).join(
+                CartItem, CartItem.cart_id == Cart.id
+            ).join(
+                ProductVariant, ProductVariant.id == CartItem.variant_id
+            ).filter(
+                ProductVariant.product_id.in_(products),
+                Cart.user_id.isnot(None),
+                CartItem.created_at >= window_start
+            ),
+            db.session.query(Wishlist.user_id).join(
+                ProductVariant, ProductVariant.id == Wishlist.variant_id
+            ).filter(
+                ProductVariant.product_id.in_(products),
+                Wishlist.created_at >= window_start
+            ),
+            db.session.query(UserEvent.user_id).filter(
+                UserEvent.event_type == 'product_view',
+                UserEvent.viewed_product_id().in_([str(product_id) for product_id in products]),
+                UserEvent.user_id.isnot(None),
+                UserEvent.timestamp >= window_start
+            ),
+        )
+        users = set()
+        for query in queries:
+            users.update(user_id for (user_id,) in query.distinct())
+        return users
+
+    @staticmethod
+    def _build_matrix(interactions: Dict[Tuple[UUID, UUID], float], max_weight: float):
+        """Sparse CSR user x item matrix plus the item id of each column"""
+        user_index: Dict[UUID, int] = {}
+        item_index: Dict[UUID, int] = {}
+        size = len(interactions)
+
+        rows = np.empty(size, dtype=np.int32)
+        cols = np.empty(size, dtype=np.int32)
+        data = np.empty(size, dtype=np.float32)
+
+        for position, ((user_id, product_id), weight) in enumerate(interactions.items()):
+            rows[position] = user_index.setdefault(user_id, len(user_index))
+            cols[position] = item_index.setdefault(product_id, len(item_index))
+            # Cap so a single heavy browser doesn't dominate an item's vector
+            data[position] = min(weight, max_weight)
+
+        matrix = sparse.csr_matrix(
+            (data, (rows, cols)), shape=(len(user_index), len(item_index)), dtype=np.float32
+        )
+        item_ids = [None] * len(item_index)
+        for product_id, index in item_index.items():
+            item_ids[index] = product_id
+        return matrix, item_ids
+
+    @staticmethod
+    def _column_norms(matrix) -> np.ndarray:
+        """L2 norm of each item column"""
+        return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel()).astype(np.float32)
+
+    @staticmethod
+    def _item_neighbors(matrix, norms, rows_to_compute, top_n: int, block_size: int,
+                        min_similarity: float):
+        """Yield (item, [(neighbor, similarity), ...]) for the requested items
+
+        norms holds each column's L2 norm; it is passed in because an
+        incremental run only loads part of most columns.
+        """
+        if matrix.shape[1] == 0 or len(rows_to_compute) == 0:
+            return
+
+        # Items as rows, scaled to unit length: row dot products are cosines
+        norms = np.array(norms, dtype=np.float32)
+        norms[norms == 0] = 1.0
+        items = sparse.diags(1.0 / norms).dot(matrix.T.tocsr()).astype(np.float32).tocsr()
+        items_t = items.T.tocsr()
+
+        for start in range(0, len(rows_to_compute), block_size):
+            block_rows = rows_to_compute[start:start + block_size]
+            similarities = (items[block_rows] @ items_t).tocsr()
+
+            for offset, item in enumerate(block_rows):
+                begin, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+                others = similarities.indices[begin:end]
+                scores = similarities.data[begin:end]
+
+                keep = (others != item) & (scores >= min_similarity)
+                others, scores = others[keep], scores[keep]
+                if len(scores) > top_n:
+                    best = np.argpartition(-scores, top_n)[:top_n]
+                    others, scores = others[best], scores[best]
+
+                order = np.argsort(-scores, kind='stable')
+                yield int(item), list(zip(others[order].tolist(), scores[order].tolist()))
+
+    def _touched_products(self, since: datetime) -> Set[UUID]:
+        """Products with new interactions since the last run"""
+        touched = set()
+
+        queries = (
+            db.session.query(ProductVariant.product_id).join(
+                OrderItem, OrderItem.variant_id == ProductVariant.id
+            ).filter(OrderItem.created_at >= since),
+            db.session.query(ProductVariant.product_id).join(
+                CartItem, CartItem.variant_id == ProductVariant.id
+            ).filter(CartItem.updated_at >= since),
+            db.session.query(ProductVariant.product_id).join(
+                Wishlist, Wishlist.variant_id == ProductVariant.id
+            ).filter(Wishlist.created_at >= since),
+        )
+        for query in queries:
+            touched.update(product_id for (product_id,) in query.distinct())
+
+        views = db.session.query(UserEvent.properties).filter(
+            UserEvent.event_type == 'product_view',
+            UserEvent.user_id.isnot(None),
+            UserEvent.timestamp >= since
+        )
+        for (properties,) in views.yield_per(5000):
+            product_id = event_product_id(properties)
+            if product_id is not None:
+                touched.add(product_id)
+
+        return touched
+
+    def _replace_rows(self, rows, covered: Optional[Set[UUID]]):
+        """Swap in new neighbor rows for the items this run covers"""
+        stmt = delete(ProductRelation).where(
+            ProductRelation.relation_type == RelationType.SIMILAR.value
+        )
+        if covered is None:
+            db.session.execute(stmt)
+        else:
+            for chunk in chunks(covered):
+                db.session.execute(stmt.where(ProductRelation.product_id.in_(chunk)))
+
+        if rows:
+            db.session.execute(insert(ProductRelation), rows)
+
+    def _load_norms(self) -> Dict[UUID, float]:
+        """Item norms saved by the previous run; empty forces a full run"""
+        try:
+            stored = redis_client.hgetall(self.NORMS_KEY)
+        except Exception:
+            return {}
+        return {UUID(product_id): float(norm) for product_id, norm in stored.items()}
+
+    def _save_norms(self, norms: Dict[UUID, float], replace: bool = False):
+        try:
+            pipe = redis_client.pipeline()
+            if replace:
+                pipe.delete(self.NORMS_KEY)
+            for chunk in chunks(norms.items(), 5000):
+                pipe.hset(self.NORMS_KEY, mapping={str(product_id): norm for product_id, norm in chunk})
+            pipe.execute()
+        except Exception:
+            logger.warning("Failed to save recommendation item norms")
+
+    # ----- serving -----
+
+    def recommend_for_user(self, user_id: UUID, limit: int = 10) -> List[UUID]:
+        """Rank products for a user from the precomputed neighbor lists"""
+        history = self._user_history(user_id)
+        if not history:
+            return []
+
+        neighbor_rows = db.session.query(
+            ProductRelation.product_id,
+            ProductRelation.related_product_id,
+            ProductRelation.score
+        ).filter(
+            ProductRelation.product_id.in_(list(history)),
+            ProductRelation.relation_type == RelationType.SIMILAR.value
+        ).all()
+
+        scores = defaultdict(float)
+        for product_id, related_id, score in neighbor_rows:
+            if related_id not in history:
+                scores[related_id] += history[product_id] * score
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [product_id for product_id, _ in ranked[:limit]]
+
+    def _user_history(self, user_id: UUID) -> Dict[UUID, float]:
+        """Weighted products the user interacted with, from indexed lookups"""
+        limit = current_app.config.get('RECOMMENDATIONS_HISTORY_ITEMS', 50)
+        history = defaultdict(float)
+
+        purchased = db.session.query(ProductVariant.product_id).join(
+            OrderItem, OrderItem.variant_id == ProductVariant.id
+        ).join(
+            Order, Order.id == OrderItem.order_id
+        ).filter(
+            Order.user_id == user_id,
+            Order.status != 'cancelled'
+        ).order_by(Order.created_at.desc()).limit(limit)
+
+        saved = db.session.query(ProductVariant.product_id).join(
+            Wishlist, Wishlist.variant_id == ProductVariant.id
+        ).filter(Wishlist.user_id == user_id).limit(limit)
+
+        in_cart = db.session.query(ProductVariant.product_id).join(
+            CartItem, CartItem.variant_id == ProductVariant.id
+        ).join(
+            Cart, Cart.id == CartItem.cart_id
+        ).filter(Cart.user_id == user_id, Cart.status == 'active').limit(limit)
+
+        for query, weight in ((purchased, self.PURCHASE_WEIGHT),
+                              (saved, self.WISHLIST_WEIGHT),
+                              (in_cart, self.CART_WEIGHT)):
+            for (product_id,) in query:
+                history[product_id] += weight
+
+        views = db.session.query(UserEvent.properties).filter(
+            UserEvent.user_id == user_id,
+            UserEvent.event_type == 'product_view'
+        ).order_by(UserEvent.timestamp.desc()).limit(limit)
+        for (properties,) in views:
+            product_id = event_product_id(properties)
+            if product_id is not None:
+                history[product_id] += self.VIEW_WEIGHT
+
+        return history
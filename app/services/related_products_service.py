@@ -0,0 +1,294 @@
+"""Related products built from co-purchase and co-view graphs"""
+
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set
+from uuid import UUID
+
+from flask import current_app
+from sqlalchemy import String, cast, delete, distinct, func, insert
+
+from app.models import Order, OrderItem, ProductVariant, ProductRelation, RelationType, UserEvent
+from app.extensions import db
+from app.services.batch_jobs import chunks, event_product_id, get_watermark, set_watermark
+
+
+class RelatedProductsService:
+    """Offline job that stores the top-K neighbors of each product
+
+    Two products are neighbors when they show up in the same order
+    (co-purchase) or are viewed in the same session (co-view). Counts are
+    cosine-normalized, c(a, b) / sqrt(n(a) * n(b)), so best sellers don't
+    become everyone's neighbor, and the view graph is down-weighted against
+    purchases. Incremental runs only recompute products that appear in
+    orders or views since the previous run, and only read the orders and
+    sessions that contain one of those products, plus per-product basket
+    counts for their neighbors.
+    """
+
+    WATERMARK_KEY = 'related_products:last_build'
+
+    def build(self, full: bool = False) -> Dict[str, Any]:
+        """Rebuild related products and return run statistics"""
+        config = current_app.config
+        started_at = datetime.utcnow()
+
+        since = None if full else get_watermark(self.WATERMARK_KEY)
+        if since is not None:
+            # Overlap the previous run to absorb clock skew between app and database
+            since -= timedelta(minutes=5)
+        order_window = started_at - timedelta(days=config.get('RELATED_PRODUCTS_ORDER_DAYS', 365))
+        view_window = started_at - timedelta(days=config.get('RELATED_PRODUCTS_VIEW_DAYS', 90))
+
+        affected = None
+        if since is not None:
+            affected = self._touched_products(since)
+            if not affected:
+                set_watermark(self.WATERMARK_KEY, started_at)
+                return {'mode': 'incremental', 'products': 0, 'relations': 0}
+
+        max_basket = config.get('RELATED_PRODUCTS_MAX_BASKET', 50)
+        purchase_pairs, purchase_counts = self._count_pairs(
+            self._purchase_baskets(order_window, affected), affected, max_basket
+        )
+        view_pairs, view_counts = self._count_pairs(
+            self._view_baskets(view_window, affected), affected, max_basket
+        )
+        if affected is not None:
+            # Only baskets holding an affected product were loaded, so basket
+            # counts (the neighbors' in particular) come from indexed aggregates
+            purchase_counts = self._purchase_counts(order_window, self._pair_products(purchase_pairs))
+            view_counts = self._view_counts(view_window, self._pair_products(view_pairs))
+
+        view_weight = config.get('RELATED_PRODUCTS_VIEW_WEIGHT', 0.3)
+        top_k = config.get('RELATED_PRODUCTS_TOP_K', 20)
+
+        rows = []
+        for product_id in set(purchase_pairs) | set(view_pairs):
+            scores = defaultdict(float)
+            self._add_scores(scores, product_id, purchase_pairs, purchase_counts, 1.0)
+            self._add_scores(scores, product_id, view_pairs, view_counts, view_weight)
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            rows.extend(
+                {
+                    'product_id': product_id,
+                    'related_product_id': related_id,
+                    'relation_type': RelationType.RELATED.value,
+                    'score': round(score, 6),
+                    'rank': rank
+                }
+                for rank, (related_id, score) in enumerate(best)
+            )
+
+        try:
+            self._replace_rows(rows, affected)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        set_watermark(self.WATERMARK_KEY, started_at)
+
+        return {
+            'mode': 'full' if affected is None else 'incremental',
+            'products': len({row['product_id'] for row in rows}),
+            'relations': len(rows)
+        }
+
+    # ----- graph construction -----
+
+    def _purchase_baskets(self, window_start: datetime,
+                          products: Optional[Set[UUID]] = None) -> Dict[Any, Set[UUID]]:
+        """Products bought together, keyed by order
+
+        With products, only orders containing one of them are read.
+        """
+        baskets = defaultdict(set)
+        query = db.session.query(OrderItem.order_id, ProductVariant.product_id).join(
+            ProductVariant, ProductVariant.id == OrderItem.variant_id
+        ).join(
+            Order, Order.id == OrderItem.order_id
+        ).filter(
+            Order.created_at >= window_start,
+            Order.status != 'cancelled'
+        )
+
+        if products is None:
+            queries = [query]
+        else:
+            queries = [
+                query.filter(OrderItem.order_id.in_(
+                    db.session.query(OrderItem.order_id).join(
+                        ProductVariant, ProductVariant.id == OrderItem.variant_id
+                    ).filter(ProductVariant.product_id.in_(chunk))
+                ))
+                for chunk in chunks(products)
+            ]
+
+        for chunk_query in queries:
+            for order_id, product_id in chunk_query.yield_per(5000):
+                baskets[order_id].add(product_id)
+        return baskets
+
+    def _view_baskets(self, window_start: datetime,
+                      products: Optional[Set[UUID]] = None) -> Dict[Any, Set[UUID]]:
+        """Products viewed together, keyed by session (or user when signed in)
+
+        With products, only sessions that viewed one of them are read.
+        """
+        baskets = defaultdict(set)
+        query = db.session.query(
+            UserEvent.session_id, UserEvent.user_id, UserEvent.properties
+        ).filter(
+            UserEvent.event_type == 'product_view',
+            UserEvent.timestamp >= window_start
+        )
+
+        if products is None:
+            queries = [query]
+        else:
+            session_ids, user_ids = self._view_basket_keys(window_start, products)
+            queries = [query.filter(UserEvent.session_id.in_(chunk)) for chunk in chunks(session_ids)]
+            queries.extend(
+                query.filter(UserEvent.session_id.is_(None), UserEvent.user_id.in_(chunk))
+                for chunk in chunks(user_ids)
+            )
+
+        for chunk_query in queries:
+            for session_id, user_id, properties in chunk_query.yield_per(5000):
+                product_id = event_product_id(properties)
+                basket_key = session_id or user_id
+                if product_id is not None and basket_key is not None:
+                    baskets[basket_key].add(product_id)
+        return baskets
+
+    @staticmethod
+    def _view_basket_keys(window_start: datetime, products: Set[UUID]):
+        """Sessions, and session-less users, that viewed any of the products"""
+        session_ids, user_ids = set(), set()
+        for chunk in chunks(products):
+            rows = db.session.query(UserEvent.session_id, UserEvent.user_id).filter(
+                UserEvent.event_type == 'product_view',
+                UserEvent.viewed_product_id().in_([str(product_id) for product_id in chunk]),
+                UserEvent.timestamp >= window_start
+            ).distinct()
+            for session_id, user_id in rows:
+                if session_id is not None:
+                    session_ids.add(session_id)
+                elif user_id is not None:
+                    user_ids.add(user_id)
+        return session_ids, user_ids
+
+    @staticmethod
+    def _purchase_counts(window_start: datetime, products: Set[UUID]) -> Counter:
+        """Number of orders in the window containing each product"""
+        counts = Counter()
+        for chunk in chunks(products):
+            counts.update(dict(db.session.query(
+                ProductVariant.product_id, func.count(distinct(OrderItem.order_id))
+            ).join(
+                OrderItem, OrderItem.variant_id == ProductVariant.id
+            ).join(
+                Order, Order.id == OrderItem.order_id
+            ).filter(
+                ProductVariant.product_id.in_(chunk),
+                Order.created_at >= window_start,
+                Order.status != 'cancelled'
+            ).group_by(ProductVariant.product_id).all()))
+        return counts
+
+    @staticmethod
+    def _view_counts(window_start: datetime, products: Set[UUID]) -> Counter:
+        """Number of sessions (or session-less users) in the window that viewed each product"""
+        counts = Counter()
+        viewed = UserEvent.viewed_product_id()
+        basket_key = func.coalesce(UserEvent.session_id, cast(UserEvent.user_id, String))
+        for chunk in chunks(products):
+            rows = db.session.query(viewed, func.count(distinct(basket_key))).filter(
+                UserEvent.event_type == 'product_view',
+                viewed.in_([str(product_id) for product_id in chunk]),
+                UserEvent.timestamp >= window_start
+            ).group_by(viewed)
+            counts.update({UUID(product_id): count for product_id, count in rows})
+        return counts
+
+    @staticmethod
+    def _pair_products(pairs) -> Set[UUID]:
+        """Products on either side of the counted pairs"""
+        products = set(pairs)
+        for neighbors in pairs.values():
+            products.update(neighbors)
+        return products
+
+    def _touched_products(self, since: datetime) -> Set[UUID]:
+        """Products ordered or viewed since the last run"""
+        touched = {
+            product_id for (product_id,) in db.session.query(ProductVariant.product_id).join(
+                OrderItem, OrderItem.variant_id == ProductVariant.id
+            ).join(
+                Order, Order.id == OrderItem.order_id
+            ).filter(Order.created_at >= since).distinct()
+        }
+
+        query = db.session.query(UserEvent.properties).filter(
+            UserEvent.event_type == 'product_view',
+            UserEvent.timestamp >= since
+        )
+        for (properties,) in query.yield_per(5000):
+            product_id = event_product_id(properties)
+            if product_id is not None:
+                touched.add(product_id)
+
+        return touched
+
+    @staticmethod
+    def _count_pairs(baskets: Dict[Any, Set[UUID]], affected: Optional[Set[UUID]],
+                     max_basket: int):
+        """Co-occurrence counts for affected products plus per-product basket counts"""
+        pairs = defaultdict(Counter)
+        counts = Counter()
+
+        for products in baskets.values():
+            counts.update(products)
+            # Very large baskets add little signal and cost quadratic time
+            products = list(products)[:max_basket]
+            if len(products) < 2:
+                continue
+
+            for product_id in products:
+                if affected is not None and product_id not in affected:
+                    continue
+                neighbors = pairs[product_id]
+                for other_id in products:
+                    if other_id != product_id:
+                        neighbors[other_id] += 1
+
+        return pairs, counts
+
+    @staticmethod
+    def _add_scores(scores, product_id, pairs, counts, weight: float):
+        neighbors = pairs.get(product_id)
+        if not neighbors:
+            return
+        own_count = counts[product_id]
+        for other_id, together in neighbors.items():
+            scores[other_id] += weight * together / math.sqrt(own_count * counts[other_id])
+
+    # ----- storage -----
+
+    def _replace_rows(self, rows, affected: Optional[Set[UUID]]):
+        """Swap in new neighbor rows for the products this run covers"""
+        stmt = delete(ProductRelation).where(
+            ProductRelation.relation_type == RelationType.RELATED.value
+        )
+        if affected is None:
+            db.session.execute(stmt)
+        else:
+            for chunk in chunks(affected):
+                db.session.execute(stmt.where(ProductRelation.product_id.in_(chunk)))
+
+        if rows:
+            db.session.execute(insert(ProductRelation), rows)
@@ -0,0 +1,458 @@
+"""In-process search indexes over the product catalog"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.models import Category, Order, OrderItem, Product, ProductMetric, ProductVariant
+from app.models.product import build_search_text, fold_text
+from app.extensions import db
+from app.services.versioned_cache import VersionedCache, bump_version
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'search_index:catalog_version'
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+class CatalogIndex(VersionedCache):
+    """Base class for indexes kept in sync with the products table
+
+    The first lookup builds the index. Afterwards each process polls a
+    catalog version counter in Redis at most every SEARCH_INDEX_CHECK_INTERVAL
+    seconds; when it moved, only products updated since the last sync are
+    re-read and applied. A full rebuild (which also refreshes popularity)
+    runs in the background every SEARCH_INDEX_REBUILD_INTERVAL seconds.
+    """
+
+    version_key = CATALOG_VERSION_KEY
+    check_interval_setting = 'SEARCH_INDEX_CHECK_INTERVAL'
+
+    def __init__(self):
+        super().__init__()
+        self._built_at: Optional[float] = None
+        self._synced_at: Optional[datetime] = None
+        self._rebuilding = False
+
+    def ensure_fresh(self):
+        """Build, sync or schedule a rebuild as needed before a lookup"""
+        if (self._built_at is not None and time.monotonic() - self._built_at
+                > current_app.config.get('SEARCH_INDEX_REBUILD_INTERVAL', 3600)):
+            self._rebuild_async()
+        super().ensure_fresh()
+
+    def rebuild(self):
+        """Rebuild the whole index from the database"""
+        synced_at = datetime.utcnow()
+        products = db.session.query(
+            Product.id, Product.name, Product.slug, Product.brand, Product.tags, Product.category_id
+        ).filter(Product.is_active == True).all()
+
+        self._build(products)
+        self._synced_at = synced_at
+        self._built_at = time.monotonic()
+
+    def _load(self):
+        self.rebuild()
+
+    def _reload(self):
+        self._sync_changes()
+
+    def _sync_changes(self):
+        """Apply products changed since the last sync"""
+        synced_at = datetime.utcnow()
+        # Overlap the previous sync to absorb clock skew between app and database
+        since = self._synced_at - timedelta(minutes=1)
+
+        changed = db.session.query(
+            Product.id, Product.name, Product.slug, Product.brand, Product.tags,
+            Product.category_id, Product.is_active
+        ).filter(Product.updated_at >= since).all()
+
+        for row in changed:
+            if row.is_active:
+                self._upsert(row)
+            else:
+                self._remove(row.id)
+
+        self._synced_at = synced_at
+
+    def _rebuild_async(self):
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        app = current_app._get_current_object()
+
+        def rebuild():
+            with app.app_context():
+                try:
+                    with self._lock:
+                        self.rebuild()
+                except Exception:
+                    logger.exception("Failed to rebuild %s", type(self).__name__)
+                finally:
+                    self._rebuilding = False
+
+        threading.Thread(target=rebuild, daemon=True).start()
+
+    # ----- subclass hooks -----
+
+    def _build(self, products):
+        raise NotImplementedError
+
+    def _upsert(self, product):
+        raise NotImplementedError
+
+    def _remove(self, product_id):
+        raise NotImplementedError
+
+
+class SuggestIndex(CatalogIndex):
+    """Typeahead over product names, brands and category names
+
+    Every word suffix of an entry ("camiseta basica hombre", "basica
+    hombre", "hombre") is kept in one sorted array, so the terms matching a
+    prefix form a contiguous range found by binary search. To rank a range
+    by popularity without scanning it, the array is cut into blocks and
+    superblocks that each keep their best entries; a lookup merges at most a
+    few dozen of those precomputed lists however short the prefix.
+
+    The array is rebuilt in full periodically. Products changed in between
+    go into a small overlay that is scanned directly, and their entries in
+    the array are hidden until the next rebuild.
+
+    Lookups take no lock: the built array and the overlay are each one
+    tuple that writers replace rather than modify, so a lookup works on
+    whatever pair it picked up when it started.
+    """
+
+    BLOCK = 32
+    SUPERBLOCK = 1024
+    MAX_LIMIT = 20
+    MAX_OVERLAY = 1000
+
+    def __init__(self):
+        super().__init__()
+        # (terms, entries, block_top, superblock_top, popularity) of the last full build
+        self._base: Tuple[list, dict, list, list, dict] = ([], {}, [], [], {})
+        # (terms, entries, hidden keys) for changes since the last full build
+        self._overlay: Tuple[list, dict, frozenset] = ([], {}, frozenset())
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """Top suggestions whose words start with prefix, most popular first"""
+        prefix = ' '.join(fold_text(prefix).split())
+        if not prefix:
+            return []
+        limit = min(limit, self.MAX_LIMIT)
+
+        self.ensure_fresh()
+
+        base, overlay = self._base, self._overlay
+        entries = base[1]
+        overlay_entries, hidden = overlay[1], overlay[2]
+
+        sources = self._range_sources(base, prefix)
+        overlay_matches = self._overlay_matches(overlay, prefix)
+        if overlay_matches:
+            sources.append(overlay_matches)
+
+        results = []
+        seen = set()
+        for item in heapq.merge(*sources):
+            entry_key = item[1]
+            # Overlay matches carry a third element; array matches for
+            # products changed since the build are stale
+            if len(item) > 2:
+                entry = overlay_entries.get(entry_key)
+            elif entry_key in hidden:
+                continue
+            else:
+                entry = entries.get(entry_key)
+            if entry is None or entry_key in seen:
+                continue
+            seen.add(entry_key)
+            results.append({key: entry[key] for key in ('text', 'type', 'id', 'slug')})
+            if len(results) >= limit:
+                break
+        return results
+
+    def _range_sources(self, base, prefix: str) -> List[List[Tuple[float, Tuple[str, Any]]]]:
+        """Lists sorted by descending weight that together cover the prefix range"""
+        terms, entries, block_top, superblock_top, _ = base
+        low = bisect_left(terms, (prefix,))
+        # Every term starting with prefix sorts below prefix + U+FFFF
+        high = bisect_left(terms, (prefix + '\uffff',), low)
+
+        sources = []
+        singles = []
+        position = low
+        while position < high:
+            if position % self.SUPERBLOCK == 0 and position + self.SUPERBLOCK <= high:
+                sources.append(superblock_top[position // self.SUPERBLOCK])
+                position += self.SUPERBLOCK
+            elif position % self.BLOCK == 0 and position + self.BLOCK <= high:
+                sources.append(block_top[position // self.BLOCK])
+                position += self.BLOCK
+            else:
+                entry_key = terms[position][1]
+                singles.append((-entries[entry_key]['weight'], entry_key))
+                position += 1
+
+        if singles:
+            singles.sort()
+            sources.append(singles)
+        return sources
+
+    @staticmethod
+    def _overlay_matches(overlay, prefix: str) -> List[Tuple[float, Tuple[str, Any], bool]]:
+        terms, entries, _ = overlay
+        matches = []
+        position = bisect_left(terms, (prefix,))
+        while position < len(terms) and terms[position][0].startswith(prefix):
+            entry_key = terms[position][1]
+            matches.append((-entries[entry_key]['weight'], entry_key, True))
+            position += 1
+        matches.sort()
+        return matches
+
+    # ----- building -----
+
+    def _build(self, products):
+        popularity = self._load_popularity()
+        categories = db.session.query(Category.id, Category.name, Category.slug).filter(
+            Category.is_active == True
+        ).all()
+
+        brand_weights = defaultdict(float)
+        category_weights = defaultdict(float)
+        entries = {}
+        for product in products:
+            weight = popularity.get(product.id, 1.0)
+            entries[('product', product.id)] = self._product_entry(product, weight)
+            if product.brand:
+                brand_weights[product.brand] += weight
+            if product.category_id:
+                category_weights[product.category_id] += weight
+
+        for brand, weight in brand_weights.items():
+            entries[('brand', brand)] = self._brand_entry(brand, weight)
+        for category in categories:
+            entries[('category', category.id)] = {
+                'text': category.name, 'type': 'category', 'id': str(category.id),
+                'slug': category.slug, 'weight': category_weights.get(category.id, 1.0)
+            }
+
+        terms = sorted(
+            term for entry_key, entry in entries.items()
+            for term in self._terms_for(entry_key, entry['text'])
+        )
+
+        block_top = []
+        for start in range(0, len(terms), self.BLOCK):
+            keys = {entry_key for _, entry_key in terms[start:start + self.BLOCK]}
+            block_top.append(self._top(keys, entries))
+
+        blocks_per_superblock = self.SUPERBLOCK // self.BLOCK
+        superblock_top = []
+        for start in range(0, len(block_top), blocks_per_superblock):
+            keys = {entry_key for block in block_top[start:start + blocks_per_superblock]
+                    for _, entry_key in block}
+            superblock_top.append(self._top(keys, entries))
+
+        self._base = (terms, entries, block_top, superblock_top, popularity)
+        self._overlay = ([], {}, frozenset())
+
+    def _top(self, keys, entries) -> List[Tuple[float, Tuple[str, Any]]]:
+        """Best MAX_LIMIT entries of a block, as (negated weight, key) pairs"""
+        return sorted((-entries[entry_key]['weight'], entry_key) for entry_key in keys)[:self.MAX_LIMIT]
+
+    def _upsert(self, product):
+        entries, popularity = self._base[1], self._base[4]
+        entry_key = ('product', product.id)
+        entry = self._product_entry(product, popularity.get(product.id, 1.0))
+        added = {entry_key: entry}
+
+        brand_key = ('brand', product.brand)
+        if product.brand and brand_key not in entries and brand_key not in self._overlay[1]:
+            added[brand_key] = self._brand_entry(product.brand, entry['weight'])
+
+        self._replace_overlay(entry_key, added)
+        if len(self._overlay[1]) > self.MAX_OVERLAY:
+            self._rebuild_async()
+
+    def _remove(self, product_id):
+        self._replace_overlay(('product', product_id), {})
+
+    def _replace_overlay(self, hide_key, added: Dict[Tuple[str, Any], Dict[str, Any]]):
+        """Swap in a new overlay with hide_key hidden and dropped, then added applied"""
+        terms, entries, hidden = self._overlay
+        if hide_key in entries:
+            terms = [term for term in terms if term[1] != hide_key]
+        else:
+            terms = list(terms)
+        entries = {key: entry for key, entry in entries.items() if key != hide_key}
+
+        for entry_key, entry in added.items():
+            entries[entry_key] = entry
+            for term in self._terms_for(entry_key, entry['text']):
+                insort(terms, term)
+
+        self._overlay = (terms, entries, hidden | {hide_key})
+
+    @staticmethod
+    def _product_entry(product, weight: float) -> Dict[str, Any]:
+        return {
+            'text': product.name, 'type': 'product', 'id': str(product.id),
+            'slug': product.slug, 'weight': weight
+        }
+
+    @staticmethod
+    def _brand_entry(brand: str, weight: float) -> Dict[str, Any]:
+        return {'text': brand, 'type': 'brand', 'id': None, 'slug': None, 'weight': weight}
+
+    @staticmethod
+    def _terms_for(entry_key, text: str) -> List[Tuple[str, Tuple[str, Any]]]:
+        words = fold_text(text).split()
+        return [(' '.join(words[start:]), entry_key) for start in range(len(words))]
+
+    @staticmethod
+    def _load_popularity() -> Dict[Any, float]:
+        """Recent units sold plus a fraction of views, per product"""
+        days = current_app.config.get('SEARCH_POPULARITY_DAYS', 90)
+        window_start = datetime.utcnow() - timedelta(days=days)
+        popularity = defaultdict(lambda: 1.0)
+
+        sales = db.session.query(
+            ProductVariant.product_id, func.sum(OrderItem.quantity)
+        ).join(
+            OrderItem, OrderItem.variant_id == ProductVariant.id
+        ).join(
+            Order, Order.id == OrderItem.order_id
+        ).filter(
+            Order.created_at >= window_start,
+            Order.status != 'cancelled'
+        ).group_by(ProductVariant.product_id)
+        for product_id, units in sales:
+            popularity[product_id] += float(units or 0)
+
+        views = db.session.query(
+            ProductMetric.product_id, func.sum(ProductMetric.views)
+        ).filter(
+            ProductMetric.date >= window_start
+        ).group_by(ProductMetric.product_id)
+        for product_id, count in views:
+            popularity[product_id] += 0.1 * float(count or 0)
+
+        return dict(popularity)
+
+
+def trigrams(text: str) -> frozenset:
+    """pg_trgm-style trigrams: each folded word padded with two leading and one trailing space"""
+    grams = set()
+    for word in _WORD_RE.findall(fold_text(text)):
+        padded = f'  {word} '
+        grams.update(padded[start:start + 3] for start in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class TrigramIndex(CatalogIndex):
+    """Typo-tolerant product search for databases without pg_trgm
+
+    Mirrors the Postgres GIN trigram index on products.search_text: an
+    inverted index from trigram to product ids over the folded name, brand
+    and tags. A product's score is the share of the query's trigrams it
+    contains, like pg_trgm's word_similarity, so "camisa basca" still finds
+    "Camiseta Básica".
+
+    Searches take no lock: syncs replace a changed posting set instead of
+    modifying it, and a full build swaps in both dicts as one tuple.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # (trigram -> frozenset of product ids, product id -> trigrams)
+        self._data: Tuple[Dict[str, frozenset], Dict[Any, frozenset]] = ({}, {})
+
+    def search(self, query: str, threshold: float, limit: int) -> List[Tuple[Any, float]]:
+        """(product_id, score) pairs scoring at least threshold, best first"""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        self.ensure_fresh()
+
+        postings, product_trigrams = self._data
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(postings.get(gram, ()))
+
+        size = len(query_grams)
+        minimum = threshold * size
+        scored = []
+        for product_id, count in shared.items():
+            grams = product_trigrams.get(product_id)
+            if count < minimum or grams is None:
+                continue
+            # Ties go to the closer overall match (plain trigram similarity)
+            similarity = count / (size + len(grams) - count)
+            scored.append((count / size, similarity, product_id))
+
+        best = heapq.nlargest(limit, scored, key=lambda item: (item[0], item[1]))
+        return [(product_id, round(score, 4)) for score, _, product_id in best]
+
+    def _build(self, products):
+        postings = defaultdict(set)
+        product_trigrams = {}
+        for product in products:
+            grams = trigrams(build_search_text(product.name, product.brand, product.tags))
+            product_trigrams[product.id] = grams
+            for gram in grams:
+                postings[gram].add(product.id)
+
+        self._data = ({gram: frozenset(ids) for gram, ids in postings.items()}, product_trigrams)
+
+    def _upsert(self, product):
+        self._remove(product.id)
+        postings, product_trigrams = self._data
+        grams = trigrams(build_search_text(product.name, product.brand, product.tags))
+        for gram in grams:
+            postings[gram] = postings.get(gram, frozenset()) | {product.id}
+        product_trigrams[product.id] = grams
+
+    def _remove(self, product_id):
+        postings, product_trigrams = self._data
+        for gram in product_trigrams.pop(product_id, ()):
+            postings[gram] = postings[gram] - {product_id}
+
+
+class CatalogVersion(VersionedCache):
+    """The catalog version on its own, for cache keys of figures derived from products"""
+
+    version_key = CATALOG_VERSION_KEY
+    check_interval_setting = 'SEARCH_INDEX_CHECK_INTERVAL'
+
+    def _load(self):
+        pass
+
+
+suggest_index = SuggestIndex()
+trigram_index = TrigramIndex()
+catalog_version = CatalogVersion()
+
+# Caches that mark_catalog_changed() must notify in this process
+_catalog_caches = [suggest_index, trigram_index, catalog_version]
+
+
+def mark_catalog_changed():
+    """Signal every process that product rows changed and indexes must sync"""
+    bump_version(CATALOG_VERSION_KEY, *_catalog_caches)
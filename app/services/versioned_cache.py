@@ -0,0 +1,110 @@
+"""Per-process caches of database tables, reloaded when a Redis version counter moves"""
+
+import logging
+import threading
+import time
+from typing import Iterable
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.extensions import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class VersionedCache:
+    """Base class for in-memory copies of tables shared by every process
+
+    The first use loads the cache. Afterwards each process reads the Redis
+    counter at version_key at most every check_interval_setting seconds
+    and calls _reload() when it moved. Writers bump the counter with
+    bump_version(), usually through track_changes().
+
+    Subclasses implement _load(), and _reload() when they can do better
+    than loading everything again.
+    """
+
+    version_key: str = None
+    check_interval_setting: str = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0.0
+
+    def ensure_fresh(self):
+        """Load on first use and reload after the version moved"""
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < current_app.config.get(self.check_interval_setting, 5):
+            return
+
+        version = self._current_version()
+        with self._lock:
+            self._checked_at = now
+            if self._loaded and version == self._version:
+                return
+            if self._loaded:
+                self._reload()
+            else:
+                self._load()
+            self._version = version
+            self._loaded = True
+
+    def version(self):
+        """Version token of the loaded data, for cache keys and validators"""
+        self.ensure_fresh()
+        return self._version
+
+    def mark_stale(self):
+        """Force a version check on the next lookup"""
+        self._checked_at = 0.0
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _reload(self):
+        self._load()
+
+    def _current_version(self):
+        try:
+            return redis_client.get(self.version_key)
+        except Exception:
+            return None
+
+
+def bump_version(key: str, *caches: VersionedCache):
+    """Make every process reload the caches versioned by key"""
+    try:
+        redis_client.incr(key)
+    except Exception:
+        logger.warning("Failed to bump %s", key)
+    for cache in caches:
+        cache.mark_stale()
+
+
+def track_changes(models: Iterable, flag: str, on_commit):
+    """Call on_commit() after any commit that wrote one of models
+
+    ORM inserts, updates and deletes set flag in session.info; the flag is
+    cleared on rollback so an aborted write doesn't invalidate anything.
+    """
+    def changed(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info[flag] = True
+
+    def after_commit(session):
+        if session.info.pop(flag, False):
+            on_commit()
+
+    def after_rollback(session):
+        session.info.pop(flag, None)
+
+    for model in models:
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, changed)
+    event.listen(Session, 'after_commit', after_commit)
+    event.listen(Session, 'after_rollback', after_rollback)
@@ -0,0 +1,229 @@
+"""Back-in-stock and price-drop alerts for wishlisted variants"""
+
+import logging
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from app.models import Product, ProductVariant, User, Wishlist
+from app.extensions import db, redis_client
+
+logger = logging.getLogger(__name__)
+
+BACK_IN_STOCK = 'back_in_stock'
+PRICE_DROP = 'price_drop'
+
+DEDUP_PREFIX = 'wishlist_alert'
+RATE_PREFIX = 'wishlist_alert_rate'
+
+
+class WishlistAlertService:
+    """Matches variant changes to the users who wishlisted them
+
+    A committed change that makes a variant available again, or lowers
+    its price, queues a match task (see the listeners below). The task
+    walks the variant's wishlist rows in keyset chunks along
+    idx_wishlist_variant, so a variant on 100k wishlists is never one
+    huge result set, and queues one send task per chunk.
+
+    Per chunk, Redis drops users who already got this alert for this
+    variant within WISHLIST_ALERT_DEDUP_TTL, then users over
+    WISHLIST_ALERT_USER_LIMIT alerts per WISHLIST_ALERT_USER_WINDOW.
+    Dedup keys are set before anything is sent, so a retried task does
+    not alert anyone twice; rate-limited users get theirs removed again,
+    so they are not suppressed for the rest of the dedup TTL.
+
+    Reads use their own connection rather than the request session: with
+    eager tasks (or no broker) a match runs inside the commit hook, where
+    the session can't emit SQL.
+    """
+
+    def match(self, variant_id: UUID, kind: str, old_price: Optional[str] = None,
+              new_price: Optional[str] = None) -> Dict[str, Any]:
+        """Fan a variant change out to the users wishlisting it"""
+        config = current_app.config
+        batch_size = config.get('WISHLIST_ALERT_BATCH', 1000)
+        stats = {'matched': 0, 'duplicates': 0, 'rate_limited': 0, 'queued': 0, 'batches': 0}
+
+        with db.engine.connect() as connection:
+            variant = connection.execute(
+                select(ProductVariant.stock, ProductVariant.price, ProductVariant.is_active)
+                .where(ProductVariant.id == variant_id)
+            ).first()
+            if variant is None or not self._still_applies(variant, kind, new_price):
+                return {'success': True, 'skipped': True, **stats}
+
+            from app import tasks
+            for user_ids in self._iter_user_ids(connection, variant_id, batch_size):
+                stats['matched'] += len(user_ids)
+                fresh = self._dedup(variant_id, kind, user_ids)
+                allowed = self._rate_limit(fresh)
+                if len(allowed) < len(fresh):
+                    # Not alerted after all: a later change may still alert them
+                    self._undo_dedup(variant_id, kind, set(fresh) - set(allowed))
+                stats['duplicates'] += len(user_ids) - len(fresh)
+                stats['rate_limited'] += len(fresh) - len(allowed)
+                stats['batches'] += 1
+                if allowed:
+                    tasks.enqueue(tasks.send_wishlist_alerts, str(variant_id), kind,
+                            [str(user_id) for user_id in allowed], old_price, new_price)
+                    stats['queued'] += len(allowed)
+
+        logger.info("Wishlist %s alert for variant %s: %s", kind, variant_id, stats)
+        return {'success': True, 'skipped': False, **stats}
+
+    def send(self, variant_id: UUID, kind: str, user_ids: List[UUID],
+             old_price: Optional[str] = None, new_price: Optional[str] = None) -> Dict[str, Any]:
+        """Send one chunk of alerts"""
+        with db.engine.connect() as connection:
+            product = connection.execute(
+                select(Product.name, ProductVariant.name, ProductVariant.price)
+                .join(Product, Product.id == ProductVariant.product_id)
+                .where(ProductVariant.id == variant_id)
+            ).first()
+            if product is None:
+                return {'success': False, 'error': 'Variant not found'}
+            emails = connection.execute(
+                select(User.email).where(User.id.in_(user_ids), User.is_active.is_(True))
+            ).scalars().all()
+
+        product_name, variant_name, price = product
+        label = f"{product_name} ({variant_name})" if variant_name else product_name
+        for email in emails:
+            # No mail backend is configured yet; log what would be sent
+            if kind == PRICE_DROP:
+                logger.info("Price drop alert for %s: %s now %s (was %s)", email, label, new_price, old_price)
+            else:
+                logger.info("Back in stock alert for %s: %s at %s", email, label, price)
+        return {'success': True, 'sent': len(emails)}
+
+    # ----- matching -----
+
+    @staticmethod
+    def _still_applies(variant, kind: str, new_price: Optional[str]) -> bool:
+        """False when the change was undone before the task ran"""
+        stock, price, is_active = variant
+        if not is_active or stock <= 0:
+            return False
+        if kind == PRICE_DROP:
+            return new_price is not None and price <= Decimal(new_price)
+        return True
+
+    @staticmethod
+    def _iter_user_ids(connection, variant_id: UUID, batch_size: int) -> Iterator[List[UUID]]:
+        """Users wishlisting a variant, in keyset chunks of batch_size"""
+        last_user_id = None
+        while True:
+            query = select(Wishlist.user_id).where(Wishlist.variant_id == variant_id)
+            if last_user_id is not None:
+                query = query.where(Wishlist.user_id > last_user_id)
+            user_ids = connection.execute(query.order_by(Wishlist.user_id).limit(batch_size)).scalars().all()
+            if not user_ids:
+                return
+            yield user_ids
+            if len(user_ids) < batch_size:
+                return
+            last_user_id = user_ids[-1]
+
+    @staticmethod
+    def _dedup(variant_id: UUID, kind: str, user_ids: List[UUID]) -> List[UUID]:
+        """Users not yet alerted about this variant and kind; marks them as alerted"""
+        ttl = current_app.config.get('WISHLIST_ALERT_DEDUP_TTL', 86400)
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.set(f"{DEDUP_PREFIX}:{kind}:{variant_id}:{user_id}", 1, nx=True, ex=ttl)
+        return [user_id for user_id, added in zip(user_ids, pipe.execute()) if added]
+
+    @staticmethod
+    def _undo_dedup(variant_id: UUID, kind: str, user_ids):
+        redis_client.delete(*[f"{DEDUP_PREFIX}:{kind}:{variant_id}:{user_id}" for user_id in user_ids])
+
+    @staticmethod
+    def _rate_limit(user_ids: List[UUID]) -> List[UUID]:
+        """Users still under their alert limit for the current window"""
+        if not user_ids:
+            return []
+        config = current_app.config
+        limit = config.get('WISHLIST_ALERT_USER_LIMIT', 5)
+        window = config.get('WISHLIST_ALERT_USER_WINDOW', 86400)
+
+        keys = [f"{RATE_PREFIX}:{user_id}" for user_id in user_ids]
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.incr(key)
+        counts = pipe.execute()
+
+        # The first alert of a window starts its clock
+        pipe = redis_client.pipeline(transaction=False)
+        for key, count in zip(keys, counts):
+            if count == 1:
+                pipe.expire(key, window)
+        pipe.execute()
+        return [user_id for user_id, count in zip(user_ids, counts) if count <= limit]
+
+
+def variant_alerts(target) -> List[tuple]:
+    """Alerts due for a flushed variant change: (kind, old price, new price)"""
+    state = inspect(target)
+    stock = state.attrs.stock.history
+    price = state.attrs.price.history
+    active = state.attrs.is_active.history
+
+    alerts = []
+    if target.is_active and (target.stock or 0) > 0 and (stock.has_changes() or active.has_changes()):
+        old_stock = stock.deleted[0] if stock.deleted else target.stock
+        was_active = active.deleted[0] if active.deleted else target.is_active
+        if not was_active or (old_stock or 0) <= 0:
+            alerts.append((BACK_IN_STOCK, None, None))
+    if price.deleted and price.deleted[0] is not None and target.price is not None:
+        old_price, new_price = Decimal(str(price.deleted[0])), Decimal(str(target.price))
+        if new_price < old_price and target.is_active and (target.stock or 0) > 0:
+            alerts.append((PRICE_DROP, str(old_price), str(new_price)))
+    return alerts
+
+
+def dispatch_alerts(changes: List[tuple]):
+    """Queue match tasks for (variant_id, kind, old price, new price) changes"""
+    from app import tasks
+    for variant_id, kind, old_price, new_price in changes:
+        tasks.enqueue(tasks.match_wishlist_alert, str(variant_id), kind, old_price, new_price)
+
+
+# Load the previous value when these are set on an unloaded instance,
+# so the flush can tell what changed
+@event.listens_for(ProductVariant.stock, 'set', active_history=True)
+@event.listens_for(ProductVariant.price, 'set', active_history=True)
+@event.listens_for(ProductVariant.is_active, 'set', active_history=True)
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+@event.listens_for(ProductVariant, 'after_update')
+def _variant_updated(mapper, connection, target):
+    alerts = variant_alerts(target)
+    session = object_session(target)
+    if alerts and session is not None:
+        pending = session.info.setdefault('wishlist_alerts', {})
+        for kind, old_price, new_price in alerts:
+            # Keep the first old price of the transaction and the last new one
+            previous = pending.get((target.id, kind))
+            pending[(target.id, kind)] = (previous[0] if previous else old_price, new_price)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_after_commit(session):
+    pending = session.info.pop('wishlist_alerts', None)
+    if pending:
+        dispatch_alerts([
+            (variant_id, kind, old_price, new_price)
+            for (variant_id, kind), (old_price, new_price) in pending.items()
+        ])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('wishlist_alerts', None)
@@ -0,0 +1,71 @@
+"""Wishlist service with wishlist-to-cart moves"""
+
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from app.extensions import db
+from app.repositories import WishlistRepository
+from app.services.cart_service import CartRepository
+
+
+class WishlistService:
+    """Service for wishlist reads and moving wishlist items to the cart"""
+
+    def __init__(self):
+        self.wishlist_repo = WishlistRepository()
+        self.cart_repo = CartRepository()
+
+    def get_wishlist(self, user_id: UUID) -> List[Dict[str, Any]]:
+        """The user's wishlist with variant and product details"""
+        return self.wishlist_repo.get_items(user_id)
+
+    def move_to_cart(self, user_id: UUID, variant_ids: Optional[List[UUID]] = None) -> Dict[str, Any]:
+        """Move wishlist items (all of them without variant_ids) into the user's cart
+
+        One query checks stock for every item, one statement adds the
+        available ones to the cart (one unit each, on top of any quantity
+        already there) and one removes them from the wishlist, all in a
+        single transaction. Items that can't be moved stay in the wishlist
+        and are reported in 'skipped'.
+        """
+        try:
+            cart = self.cart_repo.find_one_by({'user_id': user_id, 'status': 'active'})
+            if not cart:
+                cart = self.cart_repo.create({'user_id': user_id, 'status': 'active'})
+
+            candidates = self.wishlist_repo.get_move_candidates(user_id, cart.id, variant_ids)
+            found = {candidate['variant_id'] for candidate in candidates}
+            skipped = [
+                {'variant_id': str(variant_id), 'error': 'Item not in wishlist'}
+                for variant_id in dict.fromkeys(variant_ids or []) if variant_id not in found
+            ]
+
+            lines = []
+            for candidate in candidates:
+                if not candidate['is_active'] or candidate['stock'] < 1:
+                    error = 'Product is not available'
+                elif candidate['stock'] <= candidate['in_cart']:
+                    error = f"Only {candidate['stock']} units available in stock"
+                else:
+                    lines.append((candidate['variant_id'], 1, candidate['price']))
+                    continue
+                skipped.append({'variant_id': str(candidate['variant_id']), 'error': error})
+
+            if lines:
+                moved_ids = [variant_id for variant_id, _, _ in lines]
+                self.cart_repo.add_lines(cart.id, lines)
+                self.wishlist_repo.remove_variants(user_id, moved_ids)
+                # Bulk writes skip the cart item events that bump the version
+                cart.bump_version()
+                cart.extend_expiration()
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            return {'success': False, 'error': 'Failed to move items to cart'}
+
+        return {
+            'success': True,
+            'moved': [str(variant_id) for variant_id, _, _ in lines],
+            'skipped': skipped
+        }
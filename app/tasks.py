@@ -0,0 +1,91 @@
+"""Celery tasks (run a worker with ``celery -A app.worker worker``)
+
+Tasks run inside the application context of the app that celery.init_app
+bound: the web process's own app, or the one app.worker creates from
+FLASK_ENV. Importing this module never creates an app. With
+CELERY_TASK_ALWAYS_EAGER the tasks run in-process instead of on a
+worker, which is what the test configuration uses.
+"""
+
+import logging
+from uuid import UUID
+
+from app.extensions import celery as celery_ext
+
+logger = logging.getLogger(__name__)
+
+celery = celery_ext.app
+
+
+def enqueue(task, *args):
+    """Queue a task, running it in-process if the broker is unreachable
+
+    Publishing doesn't retry: a request shouldn't wait out connection
+    retries while the broker is down when the inline run is right there.
+    """
+    try:
+        task.apply_async(args=args, retry=False)
+    except Exception:
+        logger.warning("Could not queue %s; running it inline", task.name)
+        try:
+            task.apply(args=args)
+        except Exception:
+            logger.exception("Task %s failed", task.name)
+
+
+def _order_service():
+    from app.services.order_service import OrderService
+    return OrderService()
+
+
+@celery.task(name='orders.capture_payment', autoretry_for=(Exception,), ignore_result=True,
+             retry_backoff=True, max_retries=5)
+def capture_payment(order_id: str):
+    """Capture payment for a new order, then queue its confirmation"""
+    return _order_service().capture_payment(UUID(order_id))
+
+
+@celery.task(name='orders.send_confirmation', autoretry_for=(Exception,), ignore_result=True,
+             retry_backoff=True, max_retries=5)
+def send_order_confirmation(order_id: str):
+    """Email the order confirmation"""
+    return _order_service().send_order_confirmation(UUID(order_id))
+
+
+@celery.task(name='orders.record_analytics', autoretry_for=(Exception,), ignore_result=True,
+             retry_backoff=True, max_retries=3)
+def record_order_analytics(order_id: str):
+    """Track the purchase event and update product metrics"""
+    return _order_service().record_order_analytics(UUID(order_id))
+
+
+def _wishlist_alert_service():
+    from app.services.wishlist_alert_service import WishlistAlertService
+    return WishlistAlertService()
+
+
+@celery.task(name='wishlists.match_alert', autoretry_for=(Exception,), ignore_result=True,
+             retry_backoff=True, max_retries=5)
+def match_wishlist_alert(variant_id: str, kind: str, old_price=None, new_price=None):
+    """Find the users wishlisting a changed variant and queue their alerts"""
+    return _wishlist_alert_service().match(UUID(variant_id), kind, old_price, new_price)
+
+
+@celery.task(name='wishlists.send_alerts', autoretry_for=(Exception,), ignore_result=True,
+             retry_backoff=True, max_retries=5)
+def send_wishlist_alerts(variant_id: str, kind: str, user_ids: list, old_price=None, new_price=None):
+    """Send back-in-stock or price-drop alerts to one chunk of users"""
+    return _wishlist_alert_service().send(
+        UUID(variant_id), kind, [UUID(user_id) for user_id in user_ids], old_price, new_price
+    )
+
+
+def _product_service():
+    from app.services.product_service import ProductService
+    return ProductService()
+
+
+@celery.task(name='recommendations.refresh_cache', ignore_result=True)
+def refresh_recommendations(user_id, size: int):
+    """Rebuild a user's stale recommendation cards"""
+    return _product_service().refresh_recommendations(UUID(user_id) if user_id else None, size)
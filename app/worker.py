@@ -0,0 +1,15 @@
+"""Celery worker entry point: ``celery -A app.worker worker``
+
+Creates the Flask app from FLASK_ENV, which binds the Celery app to it,
+then registers the tasks.
+"""
+
+from app import create_app
+from app.config import get_config
+from app.extensions import celery as celery_ext
+
+create_app(get_config())
+
+from app import tasks  # noqa: E402,F401  (registers the tasks)
+
+celery = celery_ext.app
@@ -0,0 +1,120 @@
+"""Checkout with 1, 20 and 200 cart lines, and building order items against the per-line loop"""
+
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import Address, Cart, CartItem, Category, Order, OrderItem, Product, ProductVariant
+from app.repositories.order_repository import OrderRepository
+from app.services.cart_service import CartRepository
+from app.services.order_service import OrderService
+from timing import measure, report
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = (1, 20, 200)
+ITEM_FIELDS = ('variant_id', 'quantity', 'price', 'total', 'product_name', 'product_sku',
+               'variant_name', 'variant_sku', 'variant_attributes')
+
+
+@pytest.fixture
+def variants(app):
+    category = Category(name='Bulk', slug='bulk')
+    db.session.add(category)
+    db.session.flush()
+    variants = []
+    for index in range(max(SIZES)):
+        product = Product(sku=f'B{index}', name=f'Bulk {index}', slug=f'bulk-{index}',
+                          category_id=category.id, weight=0.1)
+        db.session.add(product)
+        db.session.flush()
+        variant = ProductVariant(product_id=product.id, sku=f'B{index}-V', name='One size', price=5 + index % 7,
+                                 stock=100000, attributes={'size': 'M'}, images=[])
+        db.session.add(variant)
+        variants.append(variant)
+    db.session.commit()
+    return variants
+
+
+def _cart(user, variants, lines):
+    cart = Cart(user_id=user.id, status='active')
+    db.session.add(cart)
+    db.session.flush()
+    for variant in variants[:lines]:
+        db.session.add(CartItem(cart_id=cart.id, variant_id=variant.id, quantity=2, price=variant.price))
+    db.session.commit()
+    return cart
+
+
+def _per_line_items(cart, order):
+    """The loop checkout used before order lines were loaded in one query"""
+    for cart_item in cart.items:
+        variant = cart_item.variant
+        product = variant.product
+        db.session.add(OrderItem(
+            order_id=order.id, variant_id=cart_item.variant_id, quantity=cart_item.quantity,
+            price=cart_item.price, total=cart_item.price * cart_item.quantity,
+            product_name=product.name if product else '', product_sku=product.sku if product else '',
+            variant_name=variant.name, variant_sku=variant.sku, variant_attributes=variant.attributes or {}
+        ))
+    db.session.flush()
+
+
+def _bulk_items(cart, order):
+    OrderRepository().add_items(order.id, CartRepository().get_order_lines(cart.id))
+
+
+def _build(user, cart, build_items):
+    """Items of a throwaway order; returns them and the statements issued"""
+    statements = []
+    record = lambda *args: statements.append(args[2])
+    db.session.expire_all()
+    order = Order(user_id=user.id, subtotal=0, total=0, payment_method='card')
+    db.session.add(order)
+    db.session.flush()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        build_items(cart, order)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    items = sorted(
+        tuple(getattr(item, field) for field in ITEM_FIELDS)
+        for item in db.session.query(OrderItem).filter(OrderItem.order_id == order.id)
+    )
+    db.session.rollback()
+    return items, len(statements)
+
+
+def _checkout_ms(user, variants, lines, address_id, repeat=5):
+    service, samples = OrderService(), []
+    for _ in range(repeat):
+        _cart(user, variants, lines)
+        started = time.perf_counter()
+        result = service.checkout(user.id, {'shipping_address_id': address_id, 'billing_address_id': address_id,
+                                            'payment_method': 'card'})
+        samples.append((time.perf_counter() - started) * 1000)
+        assert result['success'], result
+    return sorted(samples)[len(samples) // 2]
+
+
+def test_checkout_by_cart_size(app, user, variants):
+    address_id = str(db.session.query(Address.id).filter(Address.user_id == user.id).scalar())
+    rows = {}
+    for lines in SIZES:
+        cart = _cart(user, variants, lines)
+        old_items, old_statements = _build(user, cart, _per_line_items)
+        new_items, new_statements = _build(user, cart, _bulk_items)
+        assert new_items == old_items and len(new_items) == lines
+
+        old = measure(lambda: _build(user, cart, _per_line_items), repeat=10, warmup=1)
+        new = measure(lambda: _build(user, cart, _bulk_items), repeat=10, warmup=1)
+        db.session.delete(cart)
+        db.session.commit()
+
+        rows[f'{lines:>3} lines, per-line items'] = f"{old['median_ms']:.2f} ms, {old_statements} statements"
+        rows[f'{lines:>3} lines, bulk items'] = f"{new['median_ms']:.2f} ms, {new_statements} statements"
+        rows[f'{lines:>3} lines, checkout'] = f'{_checkout_ms(user, variants, lines, address_id):.2f} ms'
+
+    report('Checkout: building order items (median) and full OrderService.checkout', rows)
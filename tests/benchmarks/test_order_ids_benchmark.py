@@ -0,0 +1,50 @@
+"""Order id throughput, single-threaded and with threads sharing one generator"""
+
+import threading
+import time
+
+import pytest
+
+from app.models.ids import SnowflakeGenerator
+from timing import measure, report
+
+pytestmark = pytest.mark.benchmark
+
+BATCH = 100000
+THREADS = 8
+
+
+def _threaded(generator, per_thread):
+    def work():
+        for _ in range(per_thread):
+            generator.next_order_number()
+
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return THREADS * per_thread / (time.perf_counter() - started)
+
+
+def test_order_id_throughput(app):
+    generator = SnowflakeGenerator()
+    generator.worker_id  # lease outside the timed loops
+
+    ids = measure(lambda: [generator.next_id() for _ in range(BATCH)], repeat=5, warmup=1)
+    numbers = measure(lambda: [generator.next_order_number() for _ in range(BATCH)], repeat=5, warmup=1)
+    threaded = _threaded(generator, BATCH // THREADS)
+
+    batch = [generator.next_order_number() for _ in range(BATCH)]
+    assert len(set(batch)) == BATCH
+    assert batch == sorted(batch)
+    generator.release()
+
+    report(f'Order ids: batches of {BATCH}', {
+        'next_id': ids,
+        'next_order_number': numbers,
+        'next_id / s': f"{BATCH / ids['median_ms'] * 1000:,.0f}",
+        'next_order_number / s': f"{BATCH / numbers['median_ms'] * 1000:,.0f}",
+        f'order numbers / s, {THREADS} threads': f'{threaded:,.0f}'
+    })
@@ -0,0 +1,31 @@
+"""Timing helpers shared by the benchmarks
+
+Run with ``pytest tests/benchmarks --benchmarks -s``. Numbers come from
+SQLite and fakeredis, so compare them with each other, not with
+production latencies.
+"""
+
+import statistics
+import time
+
+
+def measure(func, repeat: int = 20, warmup: int = 2) -> dict:
+    """Milliseconds per call of func: median, best and mean over repeat runs"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': statistics.median(samples), 'best_ms': min(samples), 'mean_ms': statistics.mean(samples)}
+
+
+def report(title: str, rows: dict):
+    """Print one benchmark's results as aligned lines"""
+    print(f"\n{title}")
+    width = max(len(str(label)) for label in rows)
+    for label, value in rows.items():
+        if isinstance(value, dict):
+            value = '  '.join(f"{key}={number:.3f}" for key, number in value.items())
+        print(f"  {str(label):<{width}}  {value}")
@@ -0,0 +1,163 @@
+"""Shared fixtures: the app on a throwaway SQLite database with fakeredis
+
+Production runs on PostgreSQL and Redis. Tests use a SQLite file per test
+(PostgreSQL UUID columns compile to CHAR(32)) and one in-process fakeredis
+server that is flushed between tests.
+
+Benchmarks under tests/benchmarks are skipped unless pytest gets
+--benchmarks; add -s to see the numbers they print.
+"""
+
+import threading
+
+import fakeredis
+import pytest
+import redis
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+
+from app.config import TestingConfig
+
+_redis_server = fakeredis.FakeServer()
+
+
+def _fake_redis(*args, **kwargs):
+    return fakeredis.FakeRedis(server=_redis_server, decode_responses=kwargs.get('decode_responses', False))
+
+
+redis.from_url = _fake_redis
+redis.Redis.from_url = classmethod(lambda cls, *args, **kwargs: _fake_redis(*args, **kwargs))
+
+
+@compiles(UUID, 'sqlite')
+def _uuid_on_sqlite(type_, compiler, **kw):
+    return 'CHAR(32)'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmarks', action='store_true', help='run the benchmarks in tests/benchmarks')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: timing run, skipped without --benchmarks')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmarks'):
+        return
+    skip = pytest.mark.skip(reason='benchmark; run with --benchmarks')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def app(tmp_path):
+    from app import create_app
+    from app.extensions import db
+    from app.models.base import Base
+
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        RATELIMIT_ENABLED = False
+        CACHE_TYPE = 'SimpleCache'
+
+    fakeredis.FakeRedis(server=_redis_server).flushall()
+    app = create_app(Config)
+    with app.app_context():
+        Base.metadata.create_all(db.engine)
+        _reset_process_state()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _reset_process_state():
+    """Drop per-process caches built against a previous test's database"""
+    from app.services.promotion_engine import promotion_engine
+    from app.services.rate_engine import rate_engine
+    from app.services.search_index import catalog_version, suggest_index, trigram_index
+
+    for engine in (promotion_engine, rate_engine, suggest_index, trigram_index, catalog_version):
+        engine.__init__()
+
+
+@pytest.fixture
+def run_concurrently(app):
+    """run(work) calls work() from workers threads released at the same moment; returns results"""
+    from app.extensions import db
+
+    def run(work, workers=24):
+        barrier = threading.Barrier(workers)
+        results, errors = [], []
+
+        def worker():
+            with app.app_context():
+                barrier.wait()
+                try:
+                    results.append(work())
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        return results
+
+    return run
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    from app.extensions import db
+    from app.models import Address, User
+
+    user = User(email='shopper@example.com', username='shopper', is_staff=True)
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Address(user_id=user.id, type='shipping', line1='1 Main St', city='Springfield',
+                           state='CA', postal_code='94000', country='US'))
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(user):
+    from flask_jwt_extended import create_access_token
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+
+@pytest.fixture
+def catalog(app):
+    """Eight products with two variants each, ordered by sku"""
+    from app.extensions import db
+    from app.models import Category, Product, ProductVariant
+
+    category = Category(name='Shirts', slug='shirts')
+    db.session.add(category)
+    db.session.flush()
+    products = []
+    for index in range(8):
+        product = Product(sku=f'P{index}', name=f'Shirt {index}', slug=f'shirt-{index}', brand='Basic',
+                          category_id=category.id, tags=['shirts'], weight=0.5)
+        db.session.add(product)
+        db.session.flush()
+        for size in range(2):
+            db.session.add(ProductVariant(product_id=product.id, sku=f'P{index}-V{size}', name=f'Size {size}',
+                                          price=10 + index + size, stock=20, attributes={'size': size},
+                                          images=[]))
+        products.append(product)
+    db.session.commit()
+    return products
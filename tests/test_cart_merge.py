@@ -0,0 +1,78 @@
+"""Merging a guest cart into the user's cart at login"""
+
+from uuid import UUID
+
+from app.extensions import db
+from app.models import Cart, CartItem
+from app.services.cart_service import CartService
+
+SESSION = 'guest-session'
+
+
+def _lines(cart):
+    db.session.expire_all()
+    return {item.variant.sku: item.quantity for item in db.session.get(Cart, cart.id).items}
+
+
+def _guest_cart(*lines):
+    cart = Cart(session_id=SESSION, status='active')
+    db.session.add(cart)
+    db.session.flush()
+    for variant, quantity in lines:
+        db.session.add(CartItem(cart_id=cart.id, variant_id=variant.id, quantity=quantity, price=variant.price))
+    db.session.commit()
+    return cart
+
+
+def test_overlapping_lines_are_capped_at_stock(app, user, catalog):
+    shared, guest_only, sold_out = (product.variants[0] for product in catalog[:3])
+    sold_out.stock = 0
+    cart = Cart(user_id=user.id, status='active')
+    db.session.add(cart)
+    db.session.flush()
+    db.session.add(CartItem(cart_id=cart.id, variant_id=shared.id, quantity=15, price=shared.price))
+    db.session.commit()
+    version = cart.version
+    guest = _guest_cart((shared, 10), (guest_only, 3), (sold_out, 1))
+
+    result = CartService().merge_guest_cart(SESSION, user.id)
+
+    assert result['success'] and result['merged_items'] == 2
+    assert _lines(cart) == {shared.sku: 20, guest_only.sku: 3}
+    assert db.session.get(Cart, cart.id).version > version
+    assert db.session.get(Cart, guest.id).status == 'merged'
+
+
+def test_merge_creates_the_user_cart_with_sql_generated_ids(app, user, catalog):
+    # SQLite has no gen_random_uuid(); new line ids come from randomblob()
+    assert db.session.get_bind().dialect.name == 'sqlite'
+    guest = _guest_cart((catalog[0].variants[0], 2), (catalog[1].variants[1], 1))
+
+    result = CartService().merge_guest_cart(SESSION, user.id)
+
+    assert result['success'] and result['merged_items'] == 2
+    cart = db.session.query(Cart).filter(Cart.user_id == user.id, Cart.status == 'active').one()
+    guest_ids = {item.id for item in db.session.get(Cart, guest.id).items}
+    ids = [item.id for item in cart.items]
+    assert all(isinstance(item_id, UUID) for item_id in ids)
+    assert len(set(ids)) == 2 and not guest_ids & set(ids)
+    assert _lines(cart) == {'P0-V0': 2, 'P1-V1': 1}
+
+
+def test_login_merges_the_guest_cart(client, user, catalog):
+    _guest_cart((catalog[0].variants[0], 2))
+
+    response = client.post('/api/v1/auth/login', json={'email': user.email, 'password': 'password123'},
+                           headers={'X-Session-ID': SESSION})
+
+    assert response.status_code == 200
+    assert response.json['merged_cart_items'] == 1
+
+
+def test_login_without_a_guest_cart(client, user):
+    response = client.post('/api/v1/auth/login', json={'email': user.email, 'password': 'password123'},
+                           headers={'X-Session-ID': SESSION})
+
+    assert response.status_code == 200
+    assert response.json['merged_cart_items'] == 0
+    assert db.session.query(Cart).count() == 0
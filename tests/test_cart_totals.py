@@ -0,0 +1,53 @@
+"""Cached cart totals follow the shipping address and the catalog"""
+
+from datetime import timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import Address, Cart, CartItem, ShippingRate, TaxRate
+from app.services.cart_service import CartService
+from app.services.search_index import mark_catalog_changed
+
+
+@pytest.fixture
+def cart(app, user, catalog):
+    cart = Cart(user_id=user.id, status='active')
+    db.session.add(cart)
+    db.session.flush()
+    variant = catalog[0].variants[0]
+    db.session.add(CartItem(cart_id=cart.id, variant_id=variant.id, quantity=2, price=variant.price))
+    db.session.add(TaxRate(country='US', state='CA', rate=0.10))
+    db.session.add(TaxRate(country='US', state='NY', rate=0.05))
+    db.session.commit()
+    return cart
+
+
+def _totals(user, address, method=None):
+    result = CartService().calculate_totals(user.id, None, address.id, method)
+    assert result['success'], result
+    return result['totals']
+
+
+def test_address_edit_recomputes_tax(user, cart):
+    address = db.session.query(Address).filter(Address.user_id == user.id).one()
+    assert _totals(user, address)['tax'] == 2.0
+
+    address.state = 'NY'
+    # A later transaction; SQLite's now() only has whole seconds
+    address.updated_at = address.updated_at + timedelta(seconds=1)
+    db.session.commit()
+    assert _totals(user, address)['tax'] == 1.0
+
+
+def test_product_weight_change_recomputes_shipping(user, cart, catalog):
+    address = db.session.query(Address).filter(Address.user_id == user.id).one()
+    db.session.add_all([ShippingRate(method='standard', name='Standard', max_weight=1, price=5),
+                        ShippingRate(method='standard', name='Standard', max_weight=20, price=12)])
+    db.session.commit()
+    assert _totals(user, address)['shipping'] == 5.0
+
+    catalog[0].weight = 5
+    db.session.commit()
+    mark_catalog_changed()
+    assert _totals(user, address)['shipping'] == 12.0
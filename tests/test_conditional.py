@@ -0,0 +1,59 @@
+"""Conditional GETs: validators answer 304s and move with the resource"""
+
+from app.api.v1 import cart as cart_api
+from app.extensions import db
+from app.models import CartItem, Order
+from app.services.cart_service import CartService
+
+
+SESSION = {'X-Session-ID': 'guest-session'}
+
+
+def _fill_cart(catalog):
+    assert CartService().add_to_cart(None, SESSION['X-Session-ID'], catalog[0].variants[0].id, 1)['success']
+
+
+def test_matching_etag_returns_304_before_the_view_runs(client, catalog, monkeypatch):
+    _fill_cart(catalog)
+    response = client.get('/api/v1/cart', headers=SESSION)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    def view_ran(*args, **kwargs):
+        raise AssertionError('the view should not run for a matching ETag')
+
+    monkeypatch.setattr(cart_api.cart_service, 'get_or_create_cart', view_ran)
+    response = client.get('/api/v1/cart', headers={**SESSION, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+
+
+def test_cart_item_change_moves_the_cart_etag(client, catalog):
+    _fill_cart(catalog)
+    etag = client.get('/api/v1/cart', headers=SESSION).headers['ETag']
+
+    # Same line count and quantity, and within the same second as the last write:
+    # only the version the CartItem listeners bump tells the carts apart
+    item = db.session.query(CartItem).one()
+    item.price = item.price + 1
+    db.session.commit()
+
+    response = client.get('/api/v1/cart', headers={**SESSION, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_status_transition_moves_the_order_history_etag(client, auth_headers, user):
+    order = Order(user_id=user.id, subtotal=0, total=10, status='pending', payment_method='card')
+    db.session.add(order)
+    db.session.commit()
+    etag = client.get('/api/v1/orders', headers=auth_headers).headers['ETag']
+    assert client.get('/api/v1/orders', headers={**auth_headers, 'If-None-Match': etag}).status_code == 304
+
+    order.transition_to('confirmed')
+    db.session.commit()
+
+    response = client.get('/api/v1/orders', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['orders'][0]['status'] == 'confirmed'
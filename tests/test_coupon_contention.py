@@ -0,0 +1,147 @@
+"""Coupon usage limits under concurrent redemption"""
+
+from decimal import Decimal
+from uuid import uuid4
+
+import fakeredis
+import pytest
+
+from app.extensions import db, redis_client
+from app.models import Cart, Coupon, CouponUsage
+from app.repositories import CouponRepository
+from app.services.cart_service import COUPON_UNAVAILABLE, CartService
+from app.services.coupon_reservation_service import PENDING_USAGE_KEY, RECONCILING_KEY, CouponReservationService
+
+LIMIT = 5
+
+
+def _coupon(**fields):
+    coupon = Coupon(code='FLASH', name='Flash sale', discount_type='percentage', discount_value=10,
+                    usage_limit=LIMIT, **fields)
+    db.session.add(coupon)
+    db.session.commit()
+    return coupon.id
+
+
+def test_sql_claims_never_exceed_usage_limit(app, run_concurrently):
+    coupon_id = _coupon()
+
+    def claim():
+        claimed = CouponRepository().claim_usage(coupon_id)
+        db.session.commit()
+        return claimed
+
+    results = run_concurrently(claim)
+
+    assert results.count(True) == LIMIT
+    assert db.session.get(Coupon, coupon_id).usage_count == LIMIT
+
+
+def test_redis_reservations_never_exceed_usage_limit(app, run_concurrently):
+    coupon_id = _coupon(usage_limit_per_user=0)
+    coupon = db.session.get(Coupon, coupon_id)
+    db.session.expunge(coupon)
+    reservations = CouponReservationService()
+
+    def reserve_and_convert():
+        holder = uuid4().hex
+        return reservations.reserve(coupon, holder) and reservations.convert(coupon, holder, None, 0)
+
+    results = run_concurrently(reserve_and_convert)
+
+    assert results.count('ok') == LIMIT
+
+
+def _unreachable_redis():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    monkeypatch.setattr(redis_client, '_client', _unreachable_redis())
+
+
+def _redeem(user, coupon_id):
+    cart = Cart(user_id=user.id, status='active',
+                cart_metadata={'coupon_id': str(coupon_id), 'discount_amount': 1})
+    db.session.add(cart)
+    db.session.flush()
+    return CartService().redeem_coupon(cart, user.id, uuid4(), Decimal('50'))
+
+
+def test_limited_coupons_fail_closed_without_redis(app, user, redis_down):
+    result = _redeem(user, _coupon())
+
+    assert result == {'success': False, 'error': COUPON_UNAVAILABLE}
+
+
+def test_unlimited_coupons_redeem_through_sql_without_redis(app, user, redis_down):
+    coupon_id = _coupon()
+    db.session.get(Coupon, coupon_id).usage_limit = None
+    db.session.commit()
+
+    assert _redeem(user, coupon_id)['success'] is True
+
+
+def test_redis_counts_per_user_uses_made_without_redis(app, user, monkeypatch):
+    coupon_id = _coupon(usage_limit_per_user=2)
+    coupon = db.session.get(Coupon, coupon_id)
+    coupon.usage_limit = None
+    db.session.commit()
+
+    # One use through Redis, then one through the SQL path during an outage
+    assert _redeem(user, coupon_id)['success'] is True
+    db.session.commit()
+    with monkeypatch.context() as patch:
+        patch.setattr(redis_client, '_client', _unreachable_redis())
+        assert _redeem(user, coupon_id)['success'] is True
+        db.session.commit()
+    assert db.session.query(CouponUsage).count() == 2
+
+    assert _redeem(user, coupon_id)['success'] is False
+
+
+def test_cancelling_a_sql_redemption_leaves_redis_counters(app, user, monkeypatch):
+    coupon_id = _coupon(usage_limit_per_user=0)
+    coupon = db.session.get(Coupon, coupon_id)
+    coupon.usage_limit = None
+    db.session.commit()
+    assert _redeem(user, coupon_id)['reserved'] is True
+    db.session.commit()
+    counters = (redis_client.get(f'coupon:{coupon_id}:used'), redis_client.hgetall(PENDING_USAGE_KEY))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(redis_client, '_client', _unreachable_redis())
+        redemption = _redeem(user, coupon_id)
+    assert redemption['reserved'] is False
+    # The checkout commit fails after Redis is back
+    db.session.rollback()
+    CartService().cancel_redemption(redemption)
+
+    assert (redis_client.get(f'coupon:{coupon_id}:used'), redis_client.hgetall(PENDING_USAGE_KEY)) == counters
+
+
+@pytest.mark.parametrize('crash', ['commit', 'hdel'])
+def test_interrupted_reconcile_counts_each_use_once(app, user, monkeypatch, crash):
+    coupon_id = _coupon(usage_limit_per_user=0)
+    for _ in range(2):
+        assert _redeem(user, coupon_id)['success'] is True
+        db.session.commit()
+
+    # Dies before the usage_count commit, or after it but before the Redis cleanup
+    target = db.session if crash == 'commit' else redis_client
+    with monkeypatch.context() as patch:
+        patch.setattr(target, crash, lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError('crash')))
+        with pytest.raises(RuntimeError):
+            CouponReservationService().reconcile()
+    db.session.rollback()
+
+    assert _redeem(user, coupon_id)['success'] is True
+    db.session.commit()
+    CouponReservationService().reconcile()
+    db.session.expire_all()
+    assert db.session.get(Coupon, coupon_id).usage_count == 3
+    assert redis_client.hgetall(PENDING_USAGE_KEY) == {}
+    assert redis_client.hgetall(RECONCILING_KEY) == {}
@@ -0,0 +1,67 @@
+"""Idempotency-Key on checkout: what is stored and replayed"""
+
+import pytest
+
+from app.extensions import db
+from app.models import Address, Cart, CartItem, Coupon, Order
+
+
+@pytest.fixture
+def checkout(app, client, user, auth_headers, catalog):
+    variant = catalog[0].variants[0]
+    cart = Cart(user_id=user.id, status='active')
+    db.session.add(cart)
+    db.session.flush()
+    db.session.add(CartItem(cart_id=cart.id, variant_id=variant.id, quantity=2, price=variant.price))
+    db.session.commit()
+    address_id = str(db.session.query(Address.id).filter(Address.user_id == user.id).scalar())
+    payload = {'shipping_address_id': address_id, 'billing_address_id': address_id, 'payment_method': 'card'}
+
+    def post(key, **overrides):
+        body = {**payload, **overrides}
+        return client.post('/api/v1/orders', json={k: v for k, v in body.items() if v is not None},
+                           headers={**auth_headers, 'Idempotency-Key': key})
+
+    return post
+
+
+def test_successful_checkout_is_replayed(checkout):
+    first = checkout('key-1')
+    assert first.status_code == 201
+
+    replay = checkout('key-1')
+    assert replay.status_code == 201
+    assert replay.headers.get('Idempotent-Replayed') == 'true'
+    assert replay.json['id'] == first.json['id']
+    assert db.session.query(Order).count() == 1
+
+
+@pytest.mark.parametrize('overrides', [
+    {'payment_method': None},
+    {'cart_version': 999},
+])
+def test_rejected_requests_release_the_key(checkout, overrides):
+    assert checkout('key-2', **overrides).status_code in (400, 409)
+
+    # Same key, corrected request: runs instead of 422 or a replayed error
+    retry = checkout('key-2')
+    assert retry.status_code == 201
+    assert 'Idempotent-Replayed' not in retry.headers
+
+
+def test_failure_inside_the_order_transaction_is_replayed(checkout, user):
+    coupon = Coupon(code='ONCE', name='Once', discount_type='fixed', discount_value=1,
+                    usage_limit=1, usage_count=1)
+    db.session.add(coupon)
+    db.session.flush()
+    cart = db.session.query(Cart).filter(Cart.user_id == user.id).one()
+    cart.cart_metadata = {'coupon_id': str(coupon.id), 'discount_amount': 1}
+    db.session.commit()
+
+    first = checkout('key-3')
+    assert first.status_code == 400
+
+    replay = checkout('key-3')
+    assert replay.status_code == 400
+    assert replay.headers.get('Idempotent-Replayed') == 'true'
+    assert db.session.query(Order).count() == 0
@@ -0,0 +1,104 @@
+"""Bulk stock adjustments: row errors, the ledger and partial uploads"""
+
+import pytest
+
+from app.api.middleware.response_cache import response_cache
+from app.extensions import db
+from app.models import InventoryLedger, ProductVariant
+from app.services.inventory_service import InventoryService, parse_csv
+
+
+def _stock(variant):
+    db.session.expire_all()
+    return db.session.get(ProductVariant, variant.id).stock
+
+
+def _rows(*records):
+    return list(enumerate(records, 1))
+
+
+def test_rows_by_sku_and_variant_id(app, user, catalog):
+    first, second = catalog[0].variants[0], catalog[1].variants[1]
+    result = InventoryService().bulk_adjust(_rows(
+        {'sku': first.sku, 'delta': 5},
+        {'variant_id': str(second.id), 'absolute': 3, 'reason': 'Recount'},
+        {'sku': f' {first.sku} ', 'delta': '-2'},
+    ), reason='Delivery', actor_id=user.id)
+
+    assert (result['rows'], result['applied'], result['failed']) == (3, 3, 0)
+    assert (_stock(first), _stock(second)) == (23, 3)
+
+    ledger = db.session.query(InventoryLedger).order_by(InventoryLedger.sku, InventoryLedger.previous_stock.desc()).all()
+    assert [(row.sku, row.delta, row.previous_stock, row.new_stock, row.reason) for row in ledger] == [
+        (first.sku, -2, 25, 23, 'Delivery'),
+        (first.sku, 5, 20, 25, 'Delivery'),
+        (second.sku, -17, 20, 3, 'Recount'),
+    ]
+    assert {(str(row.batch_id), row.source, row.actor_id) for row in ledger} == {(result['batch_id'], 'bulk', user.id)}
+
+
+def test_row_errors_are_reported_and_skipped(app, catalog):
+    variant = catalog[0].variants[0]
+    result = InventoryService().bulk_adjust(_rows(
+        {'sku': variant.sku},
+        {'sku': variant.sku, 'delta': 1, 'absolute': 4},
+        {'sku': 'NOPE', 'delta': 1},
+        {'variant_id': 'not-a-uuid', 'delta': 1},
+        {'sku': variant.sku, 'delta': 'lots'},
+        None,
+        {'sku': variant.sku, 'delta': 2},
+    ))
+
+    assert (result['applied'], result['failed']) == (1, 6)
+    assert [error['row'] for error in result['errors']] == [1, 2, 3, 4, 5, 6]
+    assert result['errors'][2] == {'row': 3, 'error': 'Product variant not found', 'sku': 'NOPE'}
+    assert _stock(variant) == 22
+
+
+def test_negative_stock_is_rejected(app, catalog):
+    variant = catalog[0].variants[0]
+    result = InventoryService().bulk_adjust(_rows(
+        {'sku': variant.sku, 'delta': -15},
+        {'sku': variant.sku, 'delta': -6},
+        {'sku': variant.sku, 'absolute': -1},
+    ))
+
+    assert (result['applied'], result['failed']) == (1, 2)
+    assert result['errors'][0]['error'] == 'Stock cannot be negative (current stock 5)'
+    assert result['errors'][1]['error'] == 'Stock cannot be negative'
+    assert _stock(variant) == 5
+    assert db.session.query(InventoryLedger).count() == 1
+
+
+def _upload(client, auth_headers, body):
+    return client.post('/api/v1/admin/inventory/bulk-adjust', data=body,
+                       headers={**auth_headers, 'Content-Type': 'text/csv'})
+
+
+def test_bad_header_applies_nothing(client, auth_headers, catalog):
+    response = _upload(client, auth_headers, b'code,amount\nP0-V0,5\n')
+    assert response.status_code == 400
+    assert response.json['applied'] == 0
+    assert 'CSV header' in response.json['error']
+
+
+def test_undecodable_input_keeps_and_reports_committed_batches(app, client, auth_headers, catalog, monkeypatch):
+    app.config['INVENTORY_BULK_BATCH'] = 500
+    invalidated = []
+    monkeypatch.setattr(response_cache, 'invalidate', lambda *tags: invalidated.extend(tags))
+
+    # The reader decodes in chunks, so the bad bytes surface after a few batches
+    body = b'sku,delta\n' + b'P0-V0,1\n' * 3000 + b'P0-V0,\xff\n' + b'P0-V0,1\n' * 1000
+    response = _upload(client, auth_headers, body)
+
+    assert response.status_code == 400
+    assert 500 <= response.json['applied'] <= 3000
+    assert 'Stopped reading after row' in response.json['error']
+    assert _stock(catalog[0].variants[0]) == 20 + response.json['applied']
+    # Committed batches still drop the cached product and category responses
+    assert f'product:{catalog[0].id}' in invalidated
+
+
+def test_parse_csv_checks_the_header():
+    with pytest.raises(ValueError):
+        next(parse_csv(['name,qty', 'x,1']))
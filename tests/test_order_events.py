@@ -0,0 +1,51 @@
+"""Order event log and the tracking timeline built from it"""
+
+from app.extensions import db
+from app.models import Order, OrderEvent
+
+
+def _order(user):
+    order = Order(user_id=user.id, subtotal=0, total=10, status='pending', payment_method='card')
+    db.session.add(order)
+    db.session.flush()
+    order.record_event('placed', actor_id=user.id)
+    db.session.commit()
+    return order
+
+
+def _events(order):
+    return db.session.query(OrderEvent).filter(OrderEvent.order_id == order.id).order_by(
+        OrderEvent.occurred_at).all()
+
+
+def test_transition_writes_an_event(app, user):
+    order = _order(user)
+
+    order.transition_to('confirmed', actor_id=user.id, note='paid')
+    db.session.commit()
+
+    placed, confirmed = _events(order)
+    assert (placed.event_type, placed.from_status, placed.to_status) == ('placed', None, 'pending')
+    assert (confirmed.event_type, confirmed.from_status, confirmed.to_status) == ('confirmed', 'pending', 'confirmed')
+    assert (confirmed.actor_id, confirmed.details) == (user.id, {'note': 'paid'})
+
+
+def test_timeline_is_read_from_the_events_in_order(client, auth_headers, user):
+    order = _order(user)
+    order.transition_to('confirmed')
+    db.session.commit()
+    order.mark_as_shipped(carrier='UPS', tracking_number='1Z')
+    db.session.commit()
+    # Only the event remembers the carrier the order shipped with
+    order.shipping_carrier = 'FedEx'
+    db.session.commit()
+
+    response = client.get(f'/api/v1/orders/{order.id}/track', headers=auth_headers)
+
+    assert response.status_code == 200
+    timeline = response.json['timeline']
+    events = _events(order)
+    assert [step['status'] for step in timeline] == ['placed', 'confirmed', 'shipped', 'delivered']
+    assert [step['date'] for step in timeline[:3]] == [event.occurred_at.isoformat() for event in events]
+    assert [step['completed'] for step in timeline] == [True, True, True, False]
+    assert timeline[2]['description'] == 'Order shipped via UPS'
@@ -0,0 +1,100 @@
+"""Order ids: worker id leases and uniqueness across processes"""
+
+import multiprocessing
+import threading
+import time
+
+import pytest
+import redis
+from fakeredis import TcpFakeServer
+
+from app.extensions import redis_client
+from app.models.ids import MAX_WORKER_ID, WORKER_COUNTER_KEY, WORKER_LEASE_KEY, SnowflakeGenerator
+
+PROCESSES = 4
+IDS_PER_PROCESS = 20000
+
+
+def _generator(ttl=60):
+    generator = SnowflakeGenerator()
+    generator._lease_ttl = ttl
+    return generator
+
+
+def test_lease_skips_worker_ids_held_by_live_processes(app):
+    # The counter has wrapped past the 1024 slots, but 0 and 1 are still held
+    redis_client.set(WORKER_COUNTER_KEY, MAX_WORKER_ID + 1)
+    redis_client.set(WORKER_LEASE_KEY.format(0), 'other', ex=60)
+    redis_client.set(WORKER_LEASE_KEY.format(1), 'other', ex=60)
+
+    generator = _generator()
+    assert generator.worker_id == 2
+    assert redis_client.get(WORKER_LEASE_KEY.format(0)) == 'other'
+    generator.release()
+
+
+def test_released_worker_id_is_leased_again(app):
+    first = _generator()
+    worker_id = first.worker_id
+    first.release()
+    assert redis_client.get(WORKER_LEASE_KEY.format(worker_id)) is None
+
+    redis_client.set(WORKER_COUNTER_KEY, worker_id)
+    second = _generator()
+    assert second.worker_id == worker_id
+    second.release()
+
+
+def test_heartbeat_renews_the_lease(app):
+    generator = _generator(ttl=1)
+    key = WORKER_LEASE_KEY.format(generator.worker_id)
+    time.sleep(1.5)
+    assert redis_client.get(key) is not None
+    generator.release()
+
+
+def test_lost_lease_is_replaced(app):
+    generator = _generator(ttl=1)
+    worker_id = generator.worker_id
+    # Another process took the id after ours expired (e.g. while we were paused)
+    redis_client.set(WORKER_LEASE_KEY.format(worker_id), 'other', ex=60)
+
+    deadline = time.time() + 3
+    while generator._worker_id == worker_id and time.time() < deadline:
+        time.sleep(0.05)
+    assert generator.worker_id != worker_id
+    assert redis_client.get(WORKER_LEASE_KEY.format(worker_id)) == 'other'
+    generator.release()
+
+
+def _generate(port, barrier, results):
+    redis_client._client = redis.Redis(port=port, decode_responses=True)
+    generator = _generator()
+    worker_id = generator.worker_id
+    # Every process holds its lease while the others lease and generate
+    barrier.wait()
+    results.put((worker_id, [generator.next_id() for _ in range(IDS_PER_PROCESS)]))
+    barrier.wait()
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_ids_are_unique_across_processes():
+    server = TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        context = multiprocessing.get_context('fork')
+        barrier, results = context.Barrier(PROCESSES), context.Queue()
+        processes = [context.Process(target=_generate, args=(server.server_address[1], barrier, results))
+                     for _ in range(PROCESSES)]
+        for process in processes:
+            process.start()
+        outputs = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join(timeout=60)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len({worker_id for worker_id, _ in outputs}) == PROCESSES
+    ids = [value for _, values in outputs for value in values]
+    assert len(set(ids)) == len(ids) == PROCESSES * IDS_PER_PROCESS
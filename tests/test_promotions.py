@@ -0,0 +1,88 @@
+"""Automatic promotions: usage limits at checkout"""
+
+from decimal import Decimal
+
+from sqlalchemy import update
+
+from app.extensions import db
+from app.models import Address, Cart, CartItem, DiscountRule, Order
+from app.services.cart_service import CartService
+from app.services.order_service import PROMOTION_UNAVAILABLE, OrderService
+from app.services.promotion_engine import promotion_engine
+
+LIMIT = 5
+ITEMS = [{'category_id': None, 'quantity': 1}]
+
+
+def _rule(usage_limit=None, usage_count=0):
+    rule = DiscountRule(name='Big basket', rule_type='cart_total', conditions={'min_amount': 10},
+                        actions={'type': 'fixed', 'value': 1}, priority=1, is_active=True,
+                        usage_limit=usage_limit, usage_count=usage_count)
+    db.session.add(rule)
+    db.session.commit()
+    return rule.id
+
+
+def _applied():
+    promotion_engine.mark_stale()
+    return [entry['rule_id'] for entry in promotion_engine.evaluate(Decimal('50'), ITEMS)['applied']]
+
+
+def test_concurrent_checkouts_never_exceed_usage_limit(app, run_concurrently):
+    rule_id = _rule(usage_limit=LIMIT)
+
+    def checkout():
+        counted = promotion_engine.record_usage([rule_id])
+        db.session.commit()
+        return counted
+
+    results = run_concurrently(checkout)
+
+    assert results.count(True) == LIMIT
+    db.session.expire_all()
+    assert db.session.get(DiscountRule, rule_id).usage_count == LIMIT
+    assert _applied() == []
+
+
+def test_rules_recompile_only_when_one_is_used_up(app):
+    unlimited, limited = _rule(), _rule(usage_limit=2)
+    version = promotion_engine.version()
+
+    assert promotion_engine.record_usage([unlimited, limited])
+    db.session.commit()
+    assert set(_applied()) == {str(unlimited), str(limited)}
+    assert promotion_engine.version() == version
+
+    assert promotion_engine.record_usage([limited])
+    db.session.commit()
+    assert promotion_engine.version() != version
+    assert _applied() == [str(unlimited)]
+
+    assert not promotion_engine.record_usage([limited])
+    db.session.rollback()
+
+
+def test_checkout_fails_when_a_cached_promotion_ran_out(app, user, catalog):
+    rule_id = _rule(usage_limit=1)
+    variant = catalog[0].variants[0]
+    cart = Cart(user_id=user.id, status='active')
+    db.session.add(cart)
+    db.session.flush()
+    db.session.add(CartItem(cart_id=cart.id, variant_id=variant.id, quantity=2, price=variant.price))
+    db.session.commit()
+    address_id = db.session.query(Address.id).filter(Address.user_id == user.id).scalar()
+    payload = {'shipping_address_id': str(address_id), 'billing_address_id': str(address_id),
+               'payment_method': 'card'}
+    # The totals checkout will reuse, promotion included
+    assert CartService().calculate_totals(user.id, None, address_id)['totals']['discount'] == 1
+
+    # Another checkout used it up after these totals were cached
+    db.session.execute(update(DiscountRule).where(DiscountRule.id == rule_id).values(usage_count=1))
+    db.session.commit()
+
+    result = OrderService().checkout(user.id, payload)
+    assert result['error'] == PROMOTION_UNAVAILABLE
+    assert db.session.query(Order).count() == 0
+
+    assert OrderService().checkout(user.id, payload)['success']
+    assert float(db.session.query(Order).one().discount_amount) == 0
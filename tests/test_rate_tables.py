@@ -0,0 +1,51 @@
+"""Admin rate tables: row validation, and every process picking up new rates"""
+
+from decimal import Decimal
+
+import pytest
+
+from app.extensions import db
+from app.models import TaxRate
+from app.services.rate_engine import rate_engine
+
+ADDRESS = {'country': 'US', 'state': 'CA', 'postal_code': '94000'}
+
+
+def _put(client, auth_headers, rows):
+    return client.put('/api/v1/admin/rates/tax', json={'rates': rows}, headers=auth_headers)
+
+
+@pytest.mark.parametrize('row', [
+    {'country': 'USA', 'rate': 0.07},
+    {'country': 'U1', 'rate': 0.07},
+    {'country': 12, 'rate': 0.07},
+    {'country': 'US', 'rate': 7.25},
+    {'country': 'US', 'rate': 1},
+    {'country': 'US', 'rate': -0.01},
+    {'country': 'US', 'rate': 'NaN'},
+    {'country': 'US', 'rate': 0.07, 'postal_prefix': '9' * 21},
+])
+def test_invalid_rows_are_rejected(client, auth_headers, row):
+    response = _put(client, auth_headers, [row])
+    assert response.status_code == 400
+    assert db.session.query(TaxRate).count() == 0
+
+
+def test_replaced_table_is_used_after_commit(client, auth_headers):
+    assert rate_engine.tax_rate(ADDRESS) == Decimal('0.08')
+
+    response = _put(client, auth_headers, [{'country': 'us', 'state': 'CA', 'rate': 0.0725}])
+    assert response.status_code == 200
+    assert response.json['rates'][0]['country'] == 'US'
+    assert rate_engine.tax_rate(ADDRESS) == Decimal('0.0725')
+
+
+def test_rolled_back_write_keeps_the_loaded_version(app):
+    version = rate_engine.version()
+    db.session.add(TaxRate(country='US', rate=Decimal('0.05')))
+    db.session.flush()
+    db.session.rollback()
+
+    rate_engine.mark_stale()
+    assert rate_engine.version() == version
+    assert rate_engine.tax_rate(ADDRESS) == Decimal('0.08')
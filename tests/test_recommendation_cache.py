@@ -0,0 +1,28 @@
+"""Recommendation card cache: stale entries are refreshed at their stored size"""
+
+from app.extensions import redis_client
+from app.models.serialization import loads
+from app.services.product_service import ProductService
+
+
+def _entry(user):
+    return loads(redis_client.get(f'recommendations:{user.id}'))
+
+
+def test_stale_refresh_keeps_entry_size(app, user, catalog):
+    for product in catalog:
+        product.is_featured = True
+    service = ProductService()
+
+    assert len(service.get_recommendations(user.id, limit=30)) == len(catalog)
+    assert _entry(user)['size'] == 30
+    generated_at = _entry(user)['generated_at']
+
+    app.config['RECOMMENDATIONS_CACHE_FRESH'] = 0
+    assert len(service.get_recommendations(user.id, limit=3)) == 3
+
+    # Eager tasks: the refresh ran during the call above
+    entry = _entry(user)
+    assert entry['generated_at'] > generated_at
+    assert entry['size'] == 30
+    assert not redis_client.exists(f'recommendations:{user.id}:refreshing')
@@ -0,0 +1,77 @@
+"""Collaborative filtering: incremental training agrees with full training"""
+
+import random
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import Order, OrderItem, ProductRelation, RelationType, User, UserEvent, Wishlist
+from app.services.recommendation_service import RecommendationService
+
+
+def _buy(user, products):
+    order = Order(user_id=user.id, total=1, status='delivered')
+    db.session.add(order)
+    db.session.flush()
+    for product in products:
+        variant = product.variants[0]
+        db.session.add(OrderItem(order_id=order.id, variant=variant, quantity=1, total=variant.price))
+
+
+def _neighbors(products):
+    rows = db.session.query(
+        ProductRelation.product_id, ProductRelation.related_product_id, ProductRelation.score
+    ).filter(
+        ProductRelation.relation_type == RelationType.SIMILAR.value,
+        ProductRelation.product_id.in_([product.id for product in products])
+    )
+    neighbors = {}
+    for product_id, related_id, score in rows:
+        neighbors.setdefault(product_id, {})[related_id] = round(score, 4)
+    return neighbors
+
+
+def test_incremental_training_matches_full_training(app, catalog):
+    app.config['RECOMMENDATIONS_BLOCK_SIZE'] = 2
+    rng = random.Random(7)
+    users = []
+    for index in range(30):
+        users.append(User(email=f'buyer{index}@example.com', username=f'buyer{index}', password_hash='x'))
+    db.session.add_all(users)
+    db.session.flush()
+    for user in users:
+        _buy(user, rng.sample(catalog, 3))
+    # Older than the overlap an incremental run re-reads
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    for model in (Order, OrderItem):
+        db.session.query(model).update({model.created_at: yesterday, model.updated_at: yesterday})
+    db.session.commit()
+
+    service = RecommendationService()
+    assert service.train(full=True)['mode'] == 'full'
+
+    # New interactions on three products, from old and new customers
+    _buy(users[0], [catalog[1], catalog[6]])
+    db.session.add(Wishlist(user_id=users[1].id, variant_id=catalog[6].variants[0].id))
+    db.session.add(UserEvent.create_event('product_view', 'product_view', user_id=users[2].id,
+                                          properties={'product_id': str(catalog[3].id)}))
+    db.session.commit()
+
+    stats = service.train()
+    assert stats['mode'] == 'incremental'
+    assert stats['items_updated'] < len(catalog)
+    touched = [catalog[1], catalog[3], catalog[6]]
+    incremental = _neighbors(touched)
+
+    service.train(full=True)
+    assert incremental == _neighbors(touched)
+
+
+def test_training_without_saved_norms_runs_full(app, catalog, user):
+    _buy(user, catalog[:3])
+    db.session.commit()
+
+    service = RecommendationService()
+    service.train(full=True)
+    from app.extensions import redis_client
+    redis_client.delete(RecommendationService.NORMS_KEY)
+    assert service.train()['mode'] == 'full'
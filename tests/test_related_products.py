@@ -0,0 +1,64 @@
+"""Related products: incremental builds agree with full builds"""
+
+from app.extensions import db
+from app.models import Order, OrderItem, ProductRelation, RelationType, UserEvent
+from app.services.related_products_service import RelatedProductsService
+
+
+def _order(user, products):
+    order = Order(user_id=user.id, total=1, status='delivered')
+    db.session.add(order)
+    db.session.flush()
+    for product in products:
+        variant = product.variants[0]
+        db.session.add(OrderItem(order_id=order.id, variant=variant, quantity=1, total=variant.price))
+
+
+def _views(session_id, products):
+    for product in products:
+        db.session.add(UserEvent.create_event('product_view', 'product_view', session_id=session_id,
+                                              properties={'product_id': str(product.id)}))
+
+
+def _relations(products):
+    rows = db.session.query(
+        ProductRelation.product_id, ProductRelation.related_product_id, ProductRelation.score
+    ).filter(
+        ProductRelation.relation_type == RelationType.RELATED.value,
+        ProductRelation.product_id.in_([product.id for product in products])
+    )
+    relations = {}
+    for product_id, related_id, score in rows:
+        relations.setdefault(product_id, {})[related_id] = round(score, 5)
+    return relations
+
+
+def test_incremental_build_matches_full_build(app, user, catalog):
+    app.config['RELATED_PRODUCTS_TOP_K'] = 50
+    p = catalog
+    for _ in range(4):
+        _order(user, [p[0], p[1]])
+    _order(user, [p[1], p[2], p[3]])
+    _order(user, [p[5], p[6]])
+    _views('s1', [p[0], p[3]])
+    _views('s2', [p[3], p[4]])
+    db.session.commit()
+
+    service = RelatedProductsService()
+    assert service.build(full=True)['mode'] == 'full'
+
+    # New activity touches p[2] and p[4] only
+    _order(user, [p[2], p[4]])
+    _views('s3', [p[4], p[1]])
+    db.session.commit()
+
+    result = service.build()
+    assert result['mode'] == 'incremental'
+    touched = [p[1], p[2], p[4]]
+    incremental = _relations(touched)
+    untouched = _relations([p[5], p[6]])
+
+    service.build(full=True)
+    assert incremental == _relations(touched)
+    assert untouched == _relations([p[5], p[6]])
+
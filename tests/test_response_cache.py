@@ -0,0 +1,27 @@
+"""Catalog response cache: admin writes invalidate only what they touch"""
+
+from app.extensions import db
+from app.models import Coupon
+
+
+def test_product_update_invalidates_cached_detail(client, auth_headers, catalog):
+    product = catalog[0]
+    path = f'/api/v1/products/{product.id}'
+    assert client.get(path).json['product']['name'] == 'Shirt 0'
+
+    response = client.put(f'/api/v1/admin/products/{product.id}', json={'name': 'Renamed'}, headers=auth_headers)
+    assert response.status_code == 200
+    assert client.get(path).json['product']['name'] == 'Renamed'
+
+
+def test_coupon_update_succeeds(client, auth_headers):
+    coupon = Coupon(code='SAVE5', name='Save 5', discount_type='fixed', discount_value=5)
+    db.session.add(coupon)
+    db.session.commit()
+
+    response = client.put(f'/api/v1/admin/coupons/{coupon.id}', json={'discount_value': 7, 'user_limit': 2},
+                          headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['discount_value'] == 7
+    db.session.expire_all()
+    assert db.session.get(Coupon, coupon.id).usage_limit_per_user == 2
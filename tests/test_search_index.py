@@ -0,0 +1,58 @@
+"""Search indexes: lookups stay consistent while a sync applies changes"""
+
+import threading
+from types import SimpleNamespace
+from uuid import uuid4
+
+from app.services.search_index import suggest_index, trigram_index
+
+
+def test_suggest_and_search_find_catalog_products(app, catalog):
+    assert [entry['text'] for entry in suggest_index.suggest('shirt 3')] == ['Shirt 3']
+    ids = [product_id for product_id, _ in trigram_index.search('shrit 3', 0.3, 5)]
+    assert catalog[3].id in ids
+
+
+def test_lookups_during_sync_do_not_fail(app, catalog):
+    suggest_index.ensure_fresh()
+    trigram_index.ensure_fresh()
+    errors = []
+    done = threading.Event()
+
+    def sync():
+        try:
+            for round_ in range(100):
+                products = [
+                    SimpleNamespace(id=uuid4(), name=f'Shirt extra {round_} {index}', slug=f'extra-{round_}-{index}',
+                                    brand=f'Brand {round_ % 7}', tags=['shirts'], category_id=None)
+                    for index in range(5)
+                ]
+                for index in (suggest_index, trigram_index):
+                    with index._lock:
+                        for product in products:
+                            index._upsert(product)
+                        for product in products[:3]:
+                            index._remove(product.id)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def lookups():
+        with app.app_context():
+            try:
+                while not done.is_set():
+                    suggest_index.suggest('sh', limit=20)
+                    suggest_index.suggest('brand', limit=20)
+                    trigram_index.search('shirt extra', 0.3, 50)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=sync)] + [threading.Thread(target=lookups) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert suggest_index.suggest('shirt extra 99 4')[0]['text'] == 'Shirt extra 99 4'
@@ -0,0 +1,26 @@
+"""JSON encoding with and without orjson"""
+
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app.models import serialization
+from app.models.order import OrderStatus
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_dumps_encodes_model_values_the_same_with_either_encoder(monkeypatch, use_orjson):
+    if use_orjson and serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    if not use_orjson:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    order_id = uuid.uuid4()
+    data = {'id': order_id, 'status': OrderStatus.SHIPPED, 'total': Decimal('12.50'),
+            'created_at': datetime(2026, 1, 2, 3, 4, 5)}
+
+    assert serialization.loads(serialization.dumps(data)) == {
+        'id': str(order_id), 'status': OrderStatus.SHIPPED.value, 'total': 12.5,
+        'created_at': '2026-01-02T03:04:05'
+    }
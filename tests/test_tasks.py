@@ -0,0 +1,32 @@
+"""Queueing Celery tasks"""
+
+import subprocess
+import sys
+
+from app import tasks
+
+
+def test_enqueue_runs_inline_without_retrying_when_the_broker_is_down(app, monkeypatch):
+    publishes, runs = [], []
+
+    def unreachable(args=None, **options):
+        publishes.append(options)
+        raise ConnectionError('broker unreachable')
+
+    task = tasks.refresh_recommendations
+    monkeypatch.setattr(task, 'apply_async', unreachable)
+    monkeypatch.setattr(task, 'apply', lambda args=None, **options: runs.append(args))
+
+    tasks.enqueue(task, 'user-id', 4)
+
+    assert publishes == [{'retry': False}]
+    assert runs == [('user-id', 4)]
+
+
+def test_importing_the_tasks_does_not_create_an_app():
+    script = (
+        'import app.tasks\n'
+        'from app.extensions import celery\n'
+        'assert celery.flask_app is None\n'
+    )
+    subprocess.run([sys.executable, '-c', script], check=True)
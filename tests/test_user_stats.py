@@ -0,0 +1,44 @@
+"""user_stats counters stay in step with orders and wishlists"""
+
+from app.extensions import db
+from app.models import Order, UserStats, Wishlist
+from app.services.wishlist_service import WishlistService
+
+
+def _stats(user):
+    db.session.expire_all()
+    return db.session.query(UserStats).filter(UserStats.user_id == user.id).one()
+
+
+def test_multi_row_flush_without_a_stats_row(app, user, catalog):
+    assert db.session.query(UserStats).count() == 0
+    for product in catalog[:3]:
+        db.session.add(Wishlist(user_id=user.id, variant_id=product.variants[0].id))
+    db.session.commit()
+    assert _stats(user).wishlist_items == 3
+
+    assert WishlistService().move_to_cart(user.id)['success']
+    assert _stats(user).wishlist_items == 0
+
+
+def test_orders_in_one_flush(app, user):
+    db.session.add_all([Order(user_id=user.id, subtotal=0, total=10, status='delivered', payment_method='card')
+                        for _ in range(3)])
+    db.session.commit()
+
+    stats = _stats(user)
+    assert (stats.total_orders, stats.completed_orders, stats.total_spent) == (3, 3, 30)
+
+
+def test_status_change_on_an_expired_order(app, user):
+    order = Order(user_id=user.id, subtotal=0, total=10, status='delivered', payment_method='card')
+    db.session.add(order)
+    db.session.commit()
+    assert _stats(user).completed_orders == 1
+
+    # The commit expired the order, so status and total aren't loaded here
+    order.status = 'refunded'
+    db.session.commit()
+
+    stats = _stats(user)
+    assert (stats.total_orders, stats.completed_orders, stats.total_spent) == (1, 0, 0)
@@ -0,0 +1,25 @@
+"""Wishlist alerts: dedup and per-user rate limiting"""
+
+from app.extensions import db, redis_client
+from app.models import Wishlist
+from app.services.wishlist_alert_service import DEDUP_PREFIX, PRICE_DROP, RATE_PREFIX, WishlistAlertService
+
+
+def test_rate_limited_users_are_not_marked_as_alerted(app, user, catalog):
+    app.config['WISHLIST_ALERT_USER_LIMIT'] = 1
+    first, second = catalog[0].variants[0], catalog[1].variants[0]
+    db.session.add_all([Wishlist(user_id=user.id, variant_id=first.id),
+                        Wishlist(user_id=user.id, variant_id=second.id)])
+    db.session.commit()
+
+    service = WishlistAlertService()
+    assert service.match(first.id, PRICE_DROP, '20', str(first.price))['queued'] == 1
+
+    limited = service.match(second.id, PRICE_DROP, '20', str(second.price))
+    assert (limited['queued'], limited['rate_limited']) == (0, 1)
+    assert not redis_client.exists(f"{DEDUP_PREFIX}:{PRICE_DROP}:{second.id}:{user.id}")
+
+    # Once the window resets the user still hears about the second variant
+    redis_client.delete(f"{RATE_PREFIX}:{user.id}")
+    assert service.match(second.id, PRICE_DROP, '20', str(second.price))['queued'] == 1
+    assert service.match(second.id, PRICE_DROP, '20', str(second.price))['duplicates'] == 1